@@ -1,5 +1,29 @@
 # 导入标准库 logging，用于配置和输出日志信息
 import logging
+# 导入 atexit，用于进程退出前把队列中剩余的日志写入文件
+import atexit
+# 导入 copy，用于复制日志记录，避免修改其他处理器看到的记录
+import copy
+# 导入 hashlib，用于计算大段日志内容的摘要
+import hashlib
+# 导入 json，用于输出 JSON 格式的日志
+import json
+# 导入 random，用于按比例采样调试日志
+import random
+# 导入 queue，用于创建有界的日志队列
+import queue
+# 导入 threading，用于保护丢弃计数
+import threading
+# 导入 datetime，用于生成 JSON 日志中的时间戳
+from datetime import datetime, timezone
+# 导入上下文管理器装饰器
+from contextlib import contextmanager
+# 导入 ContextVar，用于在一次请求的所有日志中携带请求ID、会话ID等关联字段
+from contextvars import ContextVar
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Iterator
+# 导入 QueueHandler 与 QueueListener：调用方只把日志放入队列，由后台线程格式化并写入文件
+from logging.handlers import QueueHandler, QueueListener
 # 从第三方库 concurrent_log_handler 中导入 ConcurrentRotatingFileHandler
 # 该处理器是 RotatingFileHandler 的并发安全版本，支持多进程/多线程安全写同一个日志文件并按大小滚动切分
 from concurrent_log_handler import ConcurrentRotatingFileHandler
@@ -15,6 +39,162 @@ else:
 # Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
 
 
+# 当前上下文的日志关联字段（如 request_id、thread_id、user_id），自动附加到该上下文中输出的每条日志
+_log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+def bind_log_context(**fields: Any) -> None:
+    """向当前上下文追加日志关联字段（在请求处理函数或任务中调用，只影响当前上下文及其子任务）"""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """在代码块内追加日志关联字段，退出时恢复"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def current_request_id() -> str:
+    """当前上下文的请求ID，跨服务调用时通过 X-Request-ID 请求头传递，不在请求中时返回空字符串"""
+    return _log_context.get().get("request_id", "")
+
+
+def truncate(text: str, limit: int = None) -> str:
+    """按字符数截断过长的日志字段，并注明被截断的长度"""
+    limit = limit or Config.LOG_FIELD_MAX_CHARS
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(截断 {len(text) - limit} 字符)"
+
+
+# 定义大段日志内容的包装：只在日志真正输出时才转换为字符串，默认只记录长度、摘要与开头片段
+class LogPayload:
+    """
+    用法：logger.info("检索到的文本块：%s", payload(serialized))
+
+      - 日志级别被过滤或被采样丢弃时不会执行任何格式化
+      - LOG_PAYLOAD_MODE=digest（默认）：输出 <len=12345 sha256=1a2b3c4d5e6f head='开头片段'>，日志量不随检索文档大小增长
+      - LOG_PAYLOAD_MODE=full：输出完整内容（仍受 LOG_FIELD_MAX_CHARS 限制），用于排查问题
+    """
+
+    __slots__ = ("value", "head")
+
+    def __init__(self, value: Any, head: int = 120):
+        self.value = value
+        # digest 模式下保留的开头字符数
+        self.head = head
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else str(self.value)
+        if Config.LOG_PAYLOAD_MODE == "full":
+            return truncate(text)
+        digest = hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()[:12]
+        return f"<len={len(text)} sha256={digest} head={text[:self.head]!r}>"
+
+    __repr__ = __str__
+
+
+def payload(value: Any, head: int = 120) -> LogPayload:
+    """把大段内容包装为按需格式化的日志参数"""
+    return LogPayload(value, head)
+
+
+# 定义文本格式的日志格式化器：存在关联字段或结构化字段时追加在消息之后（异常堆栈之前）
+class TextFormatter(logging.Formatter):
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        context = getattr(record, "context", None)
+        fields = getattr(record, "fields", None)
+        if context:
+            text += " [" + " ".join(f"{key}={value}" for key, value in context.items()) + "]"
+        if fields:
+            text += " " + truncate(json.dumps(fields, ensure_ascii=False, default=str))
+        return text
+
+
+# 定义 JSON 格式的日志格式化器：每条日志输出为一行 JSON，便于日志平台按字段检索与聚合
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        # 关联字段与结构化字段（logger.info("...", extra={"fields": {...}})）作为顶层字段输出
+        entry.update(getattr(record, "context", None) or {})
+        for key, value in (getattr(record, "fields", None) or {}).items():
+            entry[key] = self._cap(value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _cap(value: Any) -> Any:
+        """单个字段超过 LOG_FIELD_MAX_CHARS 时截断为字符串"""
+        if isinstance(value, (int, float, bool)) or value is None:
+            return value
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        if len(text) <= Config.LOG_FIELD_MAX_CHARS:
+            return value
+        return truncate(text)
+
+
+# 定义非阻塞的队列日志处理器：队列满时丢弃日志并按级别计数，调用方永远不会等待文件锁或磁盘 IO
+class DroppingQueueHandler(QueueHandler):
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        # 日志级别名称 -> 因队列已满被丢弃的日志条数
+        self.dropped = {}
+        # 保护丢弃计数的锁
+        self._drop_lock = threading.Lock()
+        # 被采样丢弃的调试日志条数
+        self.sampled_out = 0
+        # 调试日志的默认采样比例
+        self.debug_sample_rate = Config.LOG_DEBUG_SAMPLE_RATE
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """按比例采样高频的调试日志：DEBUG 日志使用 LOG_DEBUG_SAMPLE_RATE，单条日志可以通过 extra={"sample_rate": 0.1} 指定"""
+        rate = getattr(record, "sample_rate", None)
+        if rate is None and record.levelno <= logging.DEBUG:
+            rate = self.debug_sample_rate
+        if rate is not None and rate < 1 and random.random() >= rate:
+            with self._drop_lock:
+                self.sampled_out += 1
+            return False
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """在调用线程中只合并消息参数（参数对象之后可能被修改），时间格式化与文件写入交给后台线程"""
+        record = copy.copy(record)
+        # 合并参数后按 LOG_FIELD_MAX_CHARS 截断，避免单条日志写入过大的内容
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        # 附加当前上下文的关联字段（必须在调用线程中读取）
+        record.context = _log_context.get()
+        # 异常的 traceback 对象不能跨线程保留，在调用线程中转换为文本
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """非阻塞入队，队列已满时丢弃"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+
 # 定义日志管理器类,用于集中管理日志配置和提供统一的获取接口
 class LoggerManager:
     """日志管理器类,提供统一的日志配置和获取接口"""
@@ -23,6 +203,9 @@ class LoggerManager:
     _instance = None
     # 实际的 logging.Logger 实例引用
     _logger = None
+    # 队列日志处理器与后台写文件的监听线程
+    _queue_handler = None
+    _listener = None
 
     def __new__(cls):
         """单例模式,确保全局只有一个日志管理器实例"""
@@ -40,15 +223,16 @@ class LoggerManager:
 
     def _setup_logger(self):
         """配置日志记录器"""
+        # 日志级别从配置中读取，低于该级别的日志在调用处直接过滤，不进入队列
+        level = logging.getLevelName(Config.LOG_LEVEL.upper())
         # 获取当前模块名对应的日志记录器对象（一般为模块级 logger）
-        self._logger = logging.getLogger(__name__)
-        # 设置日志级别为 DEBUG，记录尽可能详细的调试和运行信息
-        self._logger.setLevel(logging.DEBUG)
+        logger = logging.getLogger(__name__)
+        logger.setLevel(level)
         # 清空已有的日志处理器，防止重复添加导致重复输出
-        self._logger.handlers = []
+        logger.handlers = []
 
-        # 创建支持并发写入且按大小滚动的文件日志处理器
-        handler = ConcurrentRotatingFileHandler(
+        # 创建支持并发写入且按大小滚动的文件日志处理器（只在后台线程中调用，滚动切分也在后台线程中完成）
+        file_handler = ConcurrentRotatingFileHandler(
             # 指定日志文件路径，从配置类中读取
             Config.LOG_FILE,
             # 每个日志文件允许的最大字节数，到达上限会触发日志滚动
@@ -56,14 +240,25 @@ class LoggerManager:
             # 最多保留的历史备份日志文件数量
             backupCount=Config.BACKUP_COUNT
         )
-        # 设置该处理器的日志级别为 DEBUG
-        handler.setLevel(logging.DEBUG)
-        # 定义日志输出格式：时间 - 日志器名称 - 级别 - 日志消息
-        handler.setFormatter(logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        ))
-        # 将配置好的处理器添加到日志记录器中
-        self._logger.addHandler(handler)
+        # 设置该处理器的日志级别
+        file_handler.setLevel(level)
+        # 日志输出格式：LOG_FORMAT=json 时每条日志为一行 JSON，否则为文本：时间 - 日志器名称 - 级别 - 日志消息 [关联字段]
+        if Config.LOG_FORMAT == "json":
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(TextFormatter(
+                "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+            ))
+
+        # 调用方只把日志放入有界队列，由监听线程取出后写入文件
+        LoggerManager._queue_handler = DroppingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+        LoggerManager._listener = QueueListener(LoggerManager._queue_handler.queue, file_handler, respect_handler_level=True)
+        LoggerManager._listener.start()
+        # 进程退出前停止监听线程，写完队列中剩余的日志
+        atexit.register(LoggerManager._listener.stop)
+        # 将队列处理器添加到日志记录器中
+        logger.addHandler(LoggerManager._queue_handler)
+        LoggerManager._logger = logger
 
     @property
     def logger(self):
@@ -78,3 +273,17 @@ class LoggerManager:
         instance = cls()
         # 返回内部 logger，供业务代码直接使用
         return instance.logger
+
+    @classmethod
+    def get_stats(cls):
+        """类方法,返回日志队列的积压条数、容量、各级别的丢弃条数与调试日志的采样丢弃条数"""
+        handler = cls()._queue_handler
+        return {
+            "level": logging.getLevelName(cls._logger.level),
+            "format": Config.LOG_FORMAT,
+            "debug_sample_rate": handler.debug_sample_rate,
+            "sampled_out": handler.sampled_out,
+            "queued": handler.queue.qsize(),
+            "capacity": handler.queue.maxsize,
+            "dropped": dict(handler.dropped),
+        }
@@ -24,7 +24,8 @@ from utils.tools import get_tools
 # 从自定义模型定义模块导入上下文 Context 和结构化响应模型 ResponseFormat
 from utils.models import Context, ResponseFormat
 # 从自定义日志模块导入 LoggerManager，用于获取日志记录器实例
-from utils.logger import LoggerManager
+# payload 把大段内容包装为按需格式化的日志参数（本文件中 payload 另有他用，导入时重命名）
+from utils.logger import LoggerManager, payload as log_payload
 
 
 
@@ -138,7 +139,7 @@ for chunk in agent.stream(
         # 打印当前步骤最后一条消息的 content_blocks,通常是本步骤的主要输出内容
         print(f"当前步骤返回内容: {data['messages'][-1].content_blocks} \n\n")
         # 通过 logger 记录当前步骤的主要输出内容
-        logger.info(f"当前步骤返回内容: {data['messages'][-1].content_blocks}")
+        logger.info("当前步骤返回内容: %s", log_payload(data['messages'][-1].content_blocks))
 
 # （2）使用messages模式
 # 遍历 agent 在 "messages" 模式下流式返回的结果
@@ -155,11 +156,11 @@ for token, metadata in agent.stream(
     # 打印当前产生 token 的 LangGraph 节点名(例如 "model" 或 "tools")
     print(f"当前节点: {metadata['langgraph_node']}")
     # 将当前节点名写入日志,方便排查和观测
-    logger.info(f"当前节点: {metadata['langgraph_node']}")
+    logger.debug("当前节点: %s", metadata['langgraph_node'])
     # 打印该 token 的内容块列表,包括文本 token 或 tool_call_chunk 等
     print(f"当前节点内容: {token.content_blocks} \n\n")
     # 将当前 token 的内容块写入日志,用于回放或调试
-    logger.info(f"当前节点内容: {token.content_blocks}")
+    logger.debug("当前节点内容: %s", token.content_blocks)
 
 # （3）使用custom模式
 # 在 "custom" 模式下遍历 agent 的流式输出,每个 chunk 都是由工具等节点通过 get_stream_writer 主动写出的自定义数据
@@ -176,7 +177,7 @@ for chunk in agent.stream(
     # 打印当前收到的自定义数据块,便于在控制台实时查看进度或业务日志
     print(f"当前数据块: {chunk}")
     # 将自定义数据块写入日志,用于后续排查或审计
-    logger.info(f"当前数据块: {chunk}")
+    logger.debug("当前数据块: %s", log_payload(chunk))
 
 # （4）使用updates和custom组合模式
 # 在同一个流中同时启用 "updates" 和 "custom" 两种流式模式
@@ -200,7 +201,7 @@ for stream_mode, chunk in agent.stream(
         # 打印当前 custom 模式返回的数据内容,通常是业务进度或调试信息
         print(f"当前流式模式返回的内容: {chunk} \n\n")
         # 将 custom 数据写入日志
-        logger.info(f"当前流式模式返回的内容: {chunk}")
+        logger.debug("当前流式模式返回的内容: %s", log_payload(chunk))
     # 当流式模式为 updates 时,chunk 是一次代理步骤(state)更新的字典
     elif stream_mode == "updates":
         # 遍历本次步骤更新中所有节点(步骤)的数据,step 是节点名,如 "model" 或 "tools"
@@ -212,7 +213,7 @@ for stream_mode, chunk in agent.stream(
             # 打印当前步骤中最后一条消息的内容块,通常是该步骤的主要输出
             print(f"当前步骤返回内容: {data['messages'][-1].content_blocks} \n\n")
             # 将当前步骤输出内容写入日志
-            logger.info(f"当前步骤返回内容: {data['messages'][-1].content_blocks}")
+            logger.info("当前步骤返回内容: %s", log_payload(data['messages'][-1].content_blocks))
 
 # （5）使用messages和custom组合模式
 # 在同一个流中同时启用 "messages" 和 "custom" 两种流式模式
@@ -236,7 +237,7 @@ for stream_mode, payload in agent.stream(
         # 打印当前 custom 模式返回的内容,通常用来承载业务进度或调试信息
         print(f"当前流式模式返回的内容: {payload} \n\n")
         # 将 custom 数据写入日志
-        logger.info(f"当前流式模式返回的内容: {payload}")
+        logger.debug("当前流式模式返回的内容: %s", log_payload(payload))
     # 当模式为 messages 时,payload 是 (token, metadata) 二元组
     elif stream_mode == "messages":
         # 解包出当前 token 以及其对应的元数据(包含节点名等信息)
@@ -244,11 +245,11 @@ for stream_mode, payload in agent.stream(
         # 打印当前产生 token 的 LangGraph 节点名,如 "model" 或 "tools"
         print(f"当前节点: {metadata['langgraph_node']}")
         # 将当前节点名写入日志
-        logger.info(f"当前节点: {metadata['langgraph_node']}")
+        logger.debug("当前节点: %s", metadata['langgraph_node'])
         # 打印当前 token 的内容块列表,包括文本 token 或 tool_call_chunk 等
         print(f"当前节点内容: {token.content_blocks} \n\n")
         # 将当前 token 内容块写入日志,用于回放或调试
-        logger.info(f"当前节点内容: {token.content_blocks}")
+        logger.debug("当前节点内容: %s", token.content_blocks)
 
 # （6）使用messages和updates组合模式
 # 只有在涉及工具调用,且想拿到“完整解析好”的工具调用或完整消息时使用messages和custom组合模式
@@ -280,11 +281,11 @@ for stream_mode, payload in agent.stream(
             # 若当前 chunk 中包含文本内容,则流式打印出来(结尾不换行,用于打字机效果)
             if token.text:
                 print(f"流式文本数据：{token.text} ", end="|")
-                logger.info(f"流式文本数据：{token.text} ")
+                logger.debug("流式文本数据：%s", token.text)
             # 若当前 chunk 中包含工具调用参数增量(tool_call_chunks),则一次性打印
             if token.tool_call_chunks:
                 print(f"流式工具参数数据：{token.tool_call_chunks}")
-                logger.info(f"流式工具参数数据：{token.tool_call_chunks}")
+                logger.debug("流式工具参数数据：%s", token.tool_call_chunks)
 
     # 当模式为 updates 时,payload 是一次代理步骤(state)更新的字典
     elif stream_mode == "updates":
@@ -301,6 +302,6 @@ for stream_mode, payload in agent.stream(
                 # 如果是 ToolMessage,则说明这是工具执行后的完整返回内容
                 if isinstance(message, ToolMessage):
                     print(f"非流式工具调用完整返回内容: {message.content_blocks}")
-                    logger.info(f"非流式工具调用完整返回内容: {message.content_blocks}")
+                    logger.info("非流式工具调用完整返回内容: %s", log_payload(message.content_blocks))
 
 
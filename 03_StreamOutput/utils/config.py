@@ -14,9 +14,21 @@ class Config:
     if not os.path.exists(os.path.dirname(LOG_FILE)):
         os.makedirs(os.path.dirname(LOG_FILE))
     # 配置单个日志文件的最大字节数（这里是 5MB），通常用于配合轮转日志处理
-    MAX_BYTES = 5*1024*1024,
+    MAX_BYTES = 5*1024*1024
     # 配置日志轮转时最多保留的备份文件数量，这里设置为保留 3 个历史日志文件
     BACKUP_COUNT = 3
+    # 配置日志级别（DEBUG、INFO、WARNING、ERROR），低于该级别的日志在调用处直接过滤
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+    # 配置日志队列容量：日志先放入内存队列，由后台线程格式化并写入文件，队列已满时丢弃并计数，不阻塞调用方
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # 配置日志格式：text 为文本格式，json 为每行一条 JSON（附带 request_id、thread_id 等关联字段），便于日志平台检索
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    # 配置单个日志字段（消息或结构化字段）的最大字符数，超出部分截断
+    LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "2000"))
+    # 配置大段内容（检索结果、消息内容块等）的记录方式：digest 只记录长度、摘要与开头片段，full 记录完整内容（仍受字段上限限制）
+    LOG_PAYLOAD_MODE = os.getenv("LOG_PAYLOAD_MODE", "digest")
+    # 配置调试日志的采样比例（0~1），1 表示全部记录，0.1 表示随机记录 10%
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
 
     # 配置使用的大模型类型
     # - "openai"：调用 OpenAI GPT 系列模型
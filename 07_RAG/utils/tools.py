@@ -15,7 +15,7 @@ from .models import Context
 # 从自定义 LLM 工具模块导入 get_llm 方法，用于获取对话模型和向量模型实例
 from .llms import get_llm
 # 从当前包中导入 LoggerManager，用于获取日志记录器实例
-from .logger import LoggerManager
+from .logger import LoggerManager, payload
 
 
 
@@ -73,7 +73,8 @@ def get_tools():
             (f"Source: {doc.metadata}\nContent: {doc.page_content}")
             for doc in retrieved_docs
         )
-        logger.info(f"检索到的文本块：{serialized}")
+        # 记录检索结果（默认只记录长度、摘要与开头片段，LOG_PAYLOAD_MODE=full 时记录完整内容）
+        logger.info("检索到的文本块：%s", payload(serialized))
         # 返回序列化的字符串和原始文档列表
         return serialized, retrieved_docs
 
@@ -7,7 +7,7 @@ from langchain_chroma import Chroma
 # 从自定义 LLM 工具模块导入 get_llm 方法，用于获取对话模型和向量模型实例
 from utils.llms import get_llm
 # 导入日志管理器模块
-from utils.logger import LoggerManager
+from utils.logger import LoggerManager, payload
 
 
 
@@ -54,7 +54,8 @@ def retrieve_context(query: str) -> str:
             (f"Source: {doc.metadata}\nContent: {doc.page_content}")
             for doc in retrieved_docs
         )
-        logger.info(f"检索到的文本块：{serialized[:200]}...")
+        # 记录检索结果（默认只记录长度、摘要与开头片段，LOG_PAYLOAD_MODE=full 时记录完整内容）
+        logger.info("检索到的文本块：%s", payload(serialized))
 
         return serialized
 
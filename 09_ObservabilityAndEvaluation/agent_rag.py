@@ -23,11 +23,6 @@ from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langgraph.store.postgres import AsyncPostgresStore
 # 从 LangChain 导入 ToolStrategy，用于指定代理使用“工具调用”的结构化输出格式
 from langchain.agents.structured_output import ToolStrategy
-# 从Langfuse的LangChain集成模块导入CallbackHandler类
-from langfuse.langchain import CallbackHandler
-# 从 langfuse 包中导入 Langfuse 客户端类，以及 propagate_attributes 上下文管理器
-# propagate_attributes 用于在一个代码块中批量“传播”统一的属性，比如 user_id、session_id、tags、metadata 等，让该代码块里新产生的所有观测都继承这些属性 [web:26][web:28]
-from langfuse import Langfuse, propagate_attributes
 # 从 LangChain 导入 ChatPromptTemplate，用于构建聊天型提示模板
 from langchain_core.prompts import ChatPromptTemplate
 # Command 用于在中断后携带决策恢复执行
@@ -42,6 +37,10 @@ from utils.tools import get_tools
 from utils.models import Context, ResponseFormat
 # 从自定义日志模块导入 LoggerManager，用于获取日志记录器实例
 from utils.logger import LoggerManager
+# 从自定义追踪模块导入 get_tracer，追踪数据缓存在内存中由后台线程批量导出（本地 JSONL、Langfuse、OTLP）
+from utils.tracing import get_tracer
+# 从自定义提示词缓存模块导入 PromptCache，Langfuse 不可用时使用本地缓存的提示词
+from utils.prompt_cache import PromptCache
 
 
 
@@ -56,12 +55,12 @@ async def main():
     os.environ["LANGFUSE_BASE_URL"] = Config.LANGFUSE_BASE_URL
     os.environ["LANGFUSE_TRACING_ENVIRONMENT"] = Config.LANGFUSE_TRACING_ENVIRONMENT
 
-    # 初始化 Langfuse 客户端实例，用于上报 trace、span、generation 以及与 Langfuse 交互
-    langfuse = Langfuse()
+    # 初始化追踪器：通过 LangChain 回调记录 chains 和 LLM 的执行过程，数据先缓存在内存中，由后台线程按批次导出
+    # 导出目标由 Config.TRACING_SINKS 配置（jsonl、langfuse、otlp），Langfuse 服务不可用时不影响 Agent 执行
+    tracer = get_tracer()
 
-    # 为 LangChain 初始化 Langfuse CallbackHandler（用于追踪/跟踪）回调处理器
-    # LangChain 有自己的一套回调系统，而 Langfuse 正是通过监听这些回调，来记录你的 chains 和 LLM 在做什么
-    langfuse_handler = CallbackHandler()
+    # 初始化提示词缓存：有效期内直接读取本地缓存，过期后从 Langfuse 获取，Langfuse 不可用时使用本地缓存
+    prompt_cache = PromptCache()
 
     # 获取全局日志记录器，用于输出运行过程中的日志信息
     logger = LoggerManager.get_logger()
@@ -72,23 +71,19 @@ async def main():
     # 获取当前智能体可用的工具列表和HITL中间件实例
     tools, hitl_middleware = await get_tools()
 
-    # 从 Langfuse 获取名为 system_prompt 的文本类型 prompt，并指定使用 production 标签版本
-    langfuse_system_prompt = langfuse.get_prompt(
+    # 从 Langfuse（或本地缓存）获取名为 system_prompt 的文本类型 prompt，并指定使用 production 标签版本
+    langfuse_system_prompt = prompt_cache.get_prompt(
         name="nange_agi/agent_rag/system_prompt",
-        type="text",
-        label="production",
-        cache_ttl_seconds=300
+        label="production"
     )
     # 打印系统 prompt 的原始内容，方便调试和确认是否读取正确
     # print(f'系统Prompt:{langfuse_system_prompt.prompt} \n')
     logger.info(f'系统Prompt:{langfuse_system_prompt.prompt}')
 
-    # 从 Langfuse 获取名为 human_prompt 的文本类型 prompt，同样使用 production 标签版本
-    langfuse_human_prompt = langfuse.get_prompt(
+    # 从 Langfuse（或本地缓存）获取名为 human_prompt 的文本类型 prompt，同样使用 production 标签版本
+    langfuse_human_prompt = prompt_cache.get_prompt(
         name="nange_agi/agent_rag/human_prompt",
-        type="text",
-        label="production",
-        cache_ttl_seconds=300
+        label="production"
     )
     # 获取prompt中的config中结构化输出的schema
     cfg = langfuse_human_prompt.config
@@ -308,9 +303,8 @@ async def main():
                 "thread_id": thread_id,
                 "user_id": user_id,
             },
-            # 将 Langfuse 的回调处理器接入 LangChain 的事件系统
-            "callbacks": [langfuse_handler],
-            "metadata": {"langfuse_prompt": langfuse_human_prompt}
+            # 将追踪器的回调处理器接入 LangChain 的事件系统
+            "callbacks": [tracer.callback_handler]
         }
         # 定义原始用户问题
         raw_question = "北京天气怎么样？"
@@ -330,14 +324,10 @@ async def main():
         # 将用户提示内容写入日志,方便后续排查问题或重现对话
         logger.info(f"用户的问题是: {query}")
 
-        # 创建根观测（命名追踪入口）
-        # 使用 Langfuse 的上下文管理器启动一个观测（observation），类型为 span，名称为 “nangeagi_agent”
-        with langfuse.start_as_current_observation(
-                as_type="span",
-                name="nangeagi_agent"
-        ) as root_span:
-            # 在根 span 对象中设置 trace 级别的属性，便于后续追踪、分析与评估
-            root_span.update_trace(
+        # 创建 trace（命名追踪入口），名称为 “nangeagi_agent”，并设置 trace 级别的属性，便于后续追踪、分析与评估
+        # 代码块内通过 config 中的回调采集到的模型调用、工具调用等都归入该 trace，继承用户ID、会话ID等属性
+        with tracer.trace(
+                name="nangeagi_agent",
                 # 用户标识，用于将数据与具体用户关联
                 user_id=user_id,
                 # 会话标识，用于区分不同对话线程
@@ -351,36 +341,29 @@ async def main():
                     "system_prompt_name": "nange_agi/agent_rag/system_prompt",
                     "system_prompt_version": langfuse_system_prompt.version,
                     "human_prompt_name": "nange_agi/agent_rag/human_prompt",
-                    "human_prompt_version": langfuse_human_prompt.version
+                    "human_prompt_version": langfuse_human_prompt.version,
+                    "prompt_source": langfuse_human_prompt.source
                 },
                 # 追踪版本号，便于维护与更新
                 version="1.0",
                 # 输入信息，包括用户查询内容与用户名，用于分析上下文
-                input={"question": query, "name": "南哥"}
+                input={"question": query, "name": "南哥"},
+                # 将模型调用与 human_prompt 的版本关联（导出到 Langfuse 时生效）
+                prompt={"name": "nange_agi/agent_rag/human_prompt", "version": langfuse_human_prompt.version}
+        ) as root_span:
+            # 调用带人工审核（HITL）的封装函数执行 Agent 对话流程
+            # 参数说明：
+            # - agent: 预配置的 AI 代理实例
+            # - user_content: 用户输入的查询内容
+            # - config: 包含 thread_id 的配置，用于维护会话上下文
+            # - context: 自定义 Context 对象，携带用户业务信息
+            response = await run_with_hitl_invoke(
+                agent=agent,
+                user_content=query,
+                config=config,
+                context=Context(user_id=user_id)
             )
 
-            # 设置属性传播（影响 Agent 内部所有子调用）
-            # 使用 propagate_attributes 确保所有子观测继承 Trace 属性（用户ID、会话ID、标签等）
-            with propagate_attributes(
-                    user_id=user_id,
-                    session_id=thread_id,
-                    tags=["https://nangeai.top", "南哥AGI研习社"],
-                    metadata={"organization": "南哥AGI研习社", "author": "南哥"},
-                    version="1.0"
-            ):
-                # 调用带人工审核（HITL）的封装函数执行 Agent 对话流程
-                # 参数说明：
-                # - agent: 预配置的 AI 代理实例
-                # - user_content: 用户输入的查询内容
-                # - config: 包含 thread_id 的配置，用于维护会话上下文
-                # - context: 自定义 Context 对象，携带用户业务信息
-                response = await run_with_hitl_invoke(
-                    agent=agent,
-                    user_content=query,
-                    config=config,
-                    context=Context(user_id=user_id)
-                )
-
             # 从 response 字典中取出 "messages" 列表的最后一条消息的内容，作为代理（Agent）的最终回复结果
             result = response["messages"][-1].content
             # 在控制台打印代理最终回复内容，方便调试和查看
@@ -390,15 +373,11 @@ async def main():
 
             # 更新 trace 的输出字段，确保评估器能获取完整的输入输出对
             # Agent 生成的最终答案（用于后续评估）
-            # 本次对话的消息总数
-            root_span.update_trace(
+            # 将完整对话历史记录到 trace 的 metadata 中，便于后续分析完整上下文（超过 TRACING_FIELD_MAX_CHARS 时截断）
+            root_span.update(
                 output={
                     "answer": result
-                }
-            )
-
-            # 将完整对话历史记录到根 span 的 metadata 中，便于后续分析完整上下文
-            root_span.update(
+                },
                 metadata={
                     "full_conversation": [
                         {"role": msg.type, "content": msg.content}
@@ -407,6 +386,9 @@ async def main():
                 }
             )
 
+    # 程序结束前导出内存中剩余的追踪数据
+    tracer.shutdown()
+
 
 # 主程序入口
 if __name__ == "__main__":
@@ -0,0 +1,432 @@
+# 导入 argparse 模块，用于解析命令行参数
+import argparse
+# 导入 asyncio 模块，用于并发执行评测样本
+import asyncio
+# 导入 hashlib 模块，用于计算数据集与提示词的摘要，判断两次评测是否可比
+import hashlib
+# 导入 json 模块，用于读取数据集与保存评测报告
+import json
+# 导入 os 模块，用于创建报告目录
+import os
+# 导入 re 模块，用于从评审模型的回复中解析分数
+import re
+# 导入 time 模块，用于统计样本耗时
+import time
+# 导入 Counter，用于计算字符级 F1
+from collections import Counter
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+# 从 LangChain 导入 create_agent 方法，用于创建与 agent_rag.py 相同结构的智能体
+from langchain.agents import create_agent
+# 从 LangChain 导入 tool 装饰器，用于定义本地检索工具
+from langchain.tools import tool
+# 导入 set_llm_cache，为全部模型实例接入评测缓存
+from langchain_core.globals import set_llm_cache
+# 导入消息类型，用于从 Agent 执行结果中提取回复、检索内容与 token 用量
+from langchain_core.messages import AIMessage, ToolMessage
+# 导入 PromptTemplate，用于渲染用户提示词
+from langchain_core.prompts import PromptTemplate
+# 从 langchain_chroma 包中导入 Chroma，用于加载 create_index.py 创建的向量索引
+from langchain_chroma import Chroma
+# 导入 MCP 客户端，--retriever mcp 时通过 MCP Server 检索
+from langchain_mcp_adapters.client import MultiServerMCPClient
+# 复用检索评测中的检索配置、相关性判定与排序指标
+from retrieval_benchmark import DEFAULT_CONFIGS, RetrievalBenchmark, normalize, percentile, recall_at_k, reciprocal_rank, ndcg_at_k
+# 从自定义配置模块导入 Config 类，用于读取模型类型、提示词路径与 MCP Server 地址
+from utils.config import Config
+# 从自定义 LLM 工具模块导入 get_llm 方法，用于获取对话模型和向量模型实例
+from utils.llms import get_llm
+# 从自定义日志模块导入 LoggerManager 与 payload
+from utils.logger import LoggerManager, payload
+# 从自定义缓存模块导入 SQLiteLLMCache，复跑时命中缓存的模型调用不再请求模型服务
+from utils.llm_cache import SQLiteLLMCache
+# 从自定义模型定义模块导入上下文 Context
+from utils.models import Context
+# 从自定义提示词缓存模块导入 PromptCache，--prompt-source langfuse 时使用
+from utils.prompt_cache import PromptCache
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志记录器，用于输出运行过程中的日志信息
+logger = LoggerManager.get_logger()
+
+
+# 评审模型（LLM-as-a-Judge）的提示词：对照参考答案按 1~5 分评价回答的正确性
+JUDGE_PROMPT = """你是一名严格的评审员。请对照参考答案评价回答是否正确、完整地回答了问题，忽略语气与表达风格。
+问题：{question}
+参考答案：{reference}
+回答：{answer}
+评分标准：5=完全正确且完整，4=正确但略有遗漏，3=部分正确，2=大部分错误，1=完全错误或未回答。
+只输出 JSON：{{"score": 分数, "reason": "简要理由"}}"""
+
+
+# 读取 JSONL 数据集：每行一个样本，包含 question、expected_answer，以及可选的 answer_keywords 与 sources
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    dataset = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "question" not in item:
+                raise ValueError(f"数据集第 {line_no} 行缺少 question 字段")
+            item.setdefault("id", f"line{line_no}")
+            dataset.append(item)
+    return dataset
+
+
+# 计算文件内容的摘要，评测报告中记录数据集与提示词的摘要，对比时据此判断两次评测是否可比
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+# 计算字符级 F1（中文问答常用的答案重合度指标，去除空白与标点后按字符统计）
+def char_f1(prediction: str, reference: str) -> float:
+    prediction_chars = Counter(re.sub(r"[\W_]", "", prediction))
+    reference_chars = Counter(re.sub(r"[\W_]", "", reference))
+    common = sum((prediction_chars & reference_chars).values())
+    if not common:
+        return 0.0
+    precision = common / sum(prediction_chars.values())
+    recall = common / sum(reference_chars.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+# 计算关键片段命中率：文本中包含的关键片段数 / 关键片段总数（没有关键片段时返回 None，不计入平均值）
+def keyword_recall(text: str, keywords: List[str]) -> Optional[float]:
+    if not keywords:
+        return None
+    text = normalize(text)
+    return sum(1 for kw in keywords if normalize(kw) in text) / len(keywords)
+
+
+# 提取消息的文本内容（MCP 工具返回的 ToolMessage 内容可能是内容块列表）
+def message_text(message: Any) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+
+
+# 定义离线评测器
+class OfflineEvaluator:
+    """
+    RAG 离线评测：
+
+      - retrieval 模式：只执行检索，按 sources 关键片段判定相关文本块（与 retrieval_benchmark.py 相同），计算 recall@k、MRR 与 nDCG@k
+      - agent 模式：执行与 agent_rag.py 相同的智能体（系统提示词 + 用户提示词 + retrieve_context 工具，不经过人工审核与长期记忆），
+        计算回答的字符级 F1、关键片段命中率、可选的评审模型打分，以及检索内容对 sources 的覆盖率
+      - 样本通过 asyncio 并发执行，并发数由 concurrency 限制；单个样本失败或超时只记录错误，不影响其他样本
+    """
+
+    def __init__(self, vector_store: Chroma, dataset: List[Dict[str, Any]], ks: List[int] = (1, 2, 4),
+                 concurrency: int = 4, timeout: float = 120.0):
+        self.dataset = dataset
+        # 评估的 k 值
+        self.ks = list(ks)
+        # 同时执行的样本数上限
+        self.concurrency = concurrency
+        # 单个样本的超时时间（秒）
+        self.timeout = timeout
+        # 复用检索评测器：按 sources 关键片段确定每个样本的相关文本块，并按配置执行检索
+        self.retrieval = RetrievalBenchmark(
+            vector_store,
+            [{"id": item["id"], "query": item["question"], "relevant_keywords": item.get("sources", [])} for item in dataset],
+            ks=ks, repeat=1,
+        )
+
+    async def _run_all(self, run_item: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], float]:
+        """并发执行全部样本，返回每个样本的结果与总耗时"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(item: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    record = await asyncio.wait_for(run_item(item), self.timeout)
+                except Exception as e:
+                    logger.error(f"评测样本 {item['id']} 执行失败: {type(e).__name__}: {e}")
+                    record = {"error": f"{type(e).__name__}: {e}", "metrics": {}}
+                record["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                return {"id": item["id"], "question": item["question"], **record}
+
+        start = time.perf_counter()
+        records = await asyncio.gather(*(run_one(item) for item in self.dataset))
+        return list(records), time.perf_counter() - start
+
+    @staticmethod
+    def _summarize(config: Dict[str, Any], records: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        """汇总样本结果：各指标取有值样本的平均值（失败的样本计为 0 分），并统计延迟与吞吐"""
+        names = []
+        for record in records:
+            names.extend(name for name in record["metrics"] if name not in names)
+        metrics = {}
+        for name in names:
+            values = [record["metrics"].get(name) for record in records if "error" not in record]
+            values = [value for value in values if value is not None] + [0.0] * sum(1 for record in records if "error" in record)
+            metrics[name] = round(sum(values) / len(values), 4) if values else None
+        latencies = [record["latency_ms"] for record in records if "error" not in record]
+        result = {
+            "config": config,
+            "metrics": metrics,
+            "errors": sum(1 for record in records if "error" in record),
+            "latency_ms": {
+                "p50": percentile(latencies, 0.5),
+                "p99": percentile(latencies, 0.99),
+                "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            },
+            "elapsed_s": round(elapsed, 2),
+            "throughput": round(len(records) / elapsed, 2) if elapsed else None,
+            "per_item": records,
+        }
+        usage = [record["usage"] for record in records if "usage" in record]
+        if usage:
+            result["usage"] = {
+                "avg_tokens": round(sum(u["tokens"] for u in usage) / len(usage), 1),
+                "avg_llm_calls": round(sum(u["llm_calls"] for u in usage) / len(usage), 2),
+            }
+        return result
+
+    async def evaluate_retrieval(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """评测单个检索配置"""
+        async def run_item(item: Dict[str, Any]) -> Dict[str, Any]:
+            docs = await asyncio.to_thread(self.retrieval.search, item["question"], config)
+            ranked = [doc.id for doc in docs]
+            relevant = self.retrieval.relevant[item["id"]]
+            metrics = {}
+            # 没有标注 sources 的样本不计算检索指标
+            if item.get("sources"):
+                for k in self.ks:
+                    metrics[f"recall@{k}"] = recall_at_k(ranked, relevant, k)
+                    metrics[f"ndcg@{k}"] = ndcg_at_k(ranked, relevant, k)
+                metrics["mrr"] = reciprocal_rank(ranked, relevant)
+            return {"metrics": metrics, "relevant_ids": sorted(relevant), "ranked_ids": ranked}
+
+        logger.info(f"开始评测检索配置: {config['name']}")
+        records, elapsed = await self._run_all(run_item)
+        return self._summarize(config, records, elapsed)
+
+    async def evaluate_agent(self, agent: Any, human_prompt: PromptTemplate, config: Dict[str, Any],
+                             user_name: str = "南哥", judge: Any = None) -> Dict[str, Any]:
+        """评测智能体的检索与回答质量"""
+        async def run_item(item: Dict[str, Any]) -> Dict[str, Any]:
+            query = human_prompt.format(question=item["question"], name=user_name)
+            response = await agent.ainvoke(
+                {"messages": [{"role": "user", "content": query}]},
+                context=Context(user_id="offline_eval"),
+            )
+            messages = response["messages"]
+            answer = message_text(messages[-1])
+            # 智能体本次调用检索工具得到的全部内容
+            contexts = [message_text(m) for m in messages if isinstance(m, ToolMessage) and m.name == "retrieve_context"]
+            ai_messages = [m for m in messages if isinstance(m, AIMessage)]
+            metrics = {
+                "answer_f1": char_f1(answer, item["expected_answer"]) if item.get("expected_answer") else None,
+                "answer_keyword_recall": keyword_recall(answer, item.get("answer_keywords", [])),
+                "retrieval_called": 1.0 if contexts else 0.0,
+                "context_recall": keyword_recall("\n".join(contexts), item.get("sources", [])),
+            }
+            if judge is not None and item.get("expected_answer"):
+                metrics["judge_score"] = await judge_answer(judge, item["question"], item["expected_answer"], answer)
+            logger.debug("评测样本 %s 回答: %s", item["id"], payload(answer))
+            return {
+                "metrics": metrics,
+                "answer": answer,
+                "expected_answer": item.get("expected_answer"),
+                "contexts": contexts,
+                "usage": {
+                    "tokens": sum((m.usage_metadata or {}).get("total_tokens", 0) for m in ai_messages),
+                    "llm_calls": len(ai_messages),
+                },
+            }
+
+        logger.info(f"开始评测智能体: {config['name']}")
+        records, elapsed = await self._run_all(run_item)
+        return self._summarize(config, records, elapsed)
+
+
+# 使用评审模型对回答打分（1~5），无法解析分数时返回 None
+async def judge_answer(llm: Any, question: str, reference: str, answer: str) -> Optional[float]:
+    response = await llm.ainvoke(JUDGE_PROMPT.format(question=question, reference=reference, answer=answer))
+    match = re.search(r'"score"\s*:\s*"?([1-5](?:\.\d+)?)', message_text(response))
+    if not match:
+        logger.warning("无法解析评审模型的打分: %s", payload(message_text(response)))
+        return None
+    return float(match.group(1))
+
+
+# 加载系统提示词与用户提示词，返回 (系统提示词, 用户提示词模板, 提示词信息)
+def load_prompts(args: argparse.Namespace) -> Tuple[str, PromptTemplate, Dict[str, Any]]:
+    if args.prompt_source == "langfuse":
+        # 与 agent_rag.py 相同：从 Langfuse（或本地缓存）获取 production 标签版本
+        prompt_cache = PromptCache()
+        system = prompt_cache.get_prompt(name="nange_agi/agent_rag/system_prompt", label="production")
+        human = prompt_cache.get_prompt(name="nange_agi/agent_rag/human_prompt", label="production")
+        system_prompt, human_template = system.prompt, human.get_langchain_prompt()
+        info = {"source": "langfuse", "system_version": system.version, "human_version": human.version}
+    else:
+        with open(args.system_prompt, encoding="utf-8") as f:
+            system_prompt = f.read()
+        with open(args.human_prompt, encoding="utf-8") as f:
+            human_template = f.read()
+        info = {"source": "file", "system_file": args.system_prompt, "human_file": args.human_prompt}
+    info.update({"system_sha256": digest(system_prompt), "human_sha256": digest(human_template)})
+    return system_prompt, PromptTemplate.from_template(human_template), info
+
+
+# 创建评测使用的智能体：检索工具与 rag_mcp_server.py 的 retrieve_context 相同，评测只覆盖健康档案问答，不加载天气工具与人工审核中间件
+async def build_agent(llm_chat: Any, vector_store: Chroma, system_prompt: str, retriever: str, top_k: int) -> Any:
+    if retriever == "mcp":
+        # 通过 MCP Server 检索（需要先启动 mcp_start.py），评测包含 MCP 往返的完整链路
+        client = MultiServerMCPClient({
+            "rag_mcp_server": {
+                "url": f"http://{Config.MCP_SERVER_HOST}:{Config.MCP_SERVER_PORT}/mcp",
+                "transport": "streamable_http",
+            }
+        })
+        tools = [t for t in await client.get_tools() if t.name == "retrieve_context"]
+    else:
+        # 在进程内直接检索本地 Chroma 索引，不依赖 MCP Server，可以修改 top_k 对比不同的检索数量
+        @tool("retrieve_context", description="根据查询内容在向量数据库中进行相似度搜索。")
+        async def retrieve_context(query: str) -> str:
+            docs = await asyncio.to_thread(vector_store.similarity_search, query, k=top_k)
+            return "\n\n".join(f"Source: {doc.metadata}\nContent: {doc.page_content}" for doc in docs)
+
+        tools = [retrieve_context]
+    return create_agent(model=llm_chat, system_prompt=system_prompt, tools=tools, context_schema=Context)
+
+
+# 打印评测报告，提供基线报告时同时打印与基线的差值以及指标下降的样本
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None, regression_threshold: float = 0.1) -> None:
+    results = report["results"]
+    baseline_by_name = {r["config"]["name"]: r for r in (baseline or {}).get("results", [])}
+    if baseline and baseline.get("dataset_sha256") != report["dataset_sha256"]:
+        print("注意：基线报告使用的数据集与本次不同，对比结果仅供参考")
+    metric_names = []
+    for r in results:
+        metric_names.extend(name for name in r["metrics"] if name not in metric_names)
+
+    # 列宽按最长的指标名称确定
+    width = max([11] + [len(name) + 2 for name in metric_names])
+
+    def fmt(value: Any, sign: str = "") -> str:
+        return "-" if value is None else format(value, sign)
+
+    print("=" * 140)
+    print(f"{'配置':<26}" + "".join(f"{name:>{width}}" for name in metric_names) + f"{'错误':>6}{'p50(ms)':>10}{'样本/秒':>9}")
+    for r in results:
+        print(f"{r['config']['name']:<26}" + "".join(f"{fmt(r['metrics'].get(name)):>{width}}" for name in metric_names)
+              + f"{r['errors']:>6}{fmt(r['latency_ms']['p50']):>10}{fmt(r['throughput']):>9}")
+        base = baseline_by_name.get(r["config"]["name"])
+        if not base:
+            continue
+        deltas = []
+        for name in metric_names:
+            current, previous = r["metrics"].get(name), base["metrics"].get(name)
+            deltas.append(None if current is None or previous is None else round(current - previous, 4))
+        print(f"{'  Δ 基线':<25}" + "".join(f"{fmt(delta, '+'):>{width}}" for delta in deltas)
+              + f"{r['errors'] - base['errors']:>+6}")
+        # 逐个样本对比，列出任一指标下降超过阈值或新出现错误的样本
+        base_items = {item["id"]: item for item in base.get("per_item", [])}
+        for item in r["per_item"]:
+            previous = base_items.get(item["id"])
+            if previous is None:
+                continue
+            if "error" in item and "error" not in previous:
+                print(f"    回退 {item['id']}: {item['error']}")
+                continue
+            drops = [f"{name} {previous['metrics'][name]:.2f}->{value:.2f}" for name, value in item["metrics"].items()
+                     if value is not None and previous["metrics"].get(name) is not None
+                     and previous["metrics"][name] - value > regression_threshold]
+            if drops:
+                print(f"    回退 {item['id']}: " + ", ".join(drops))
+    print("=" * 140)
+    if report.get("llm_cache"):
+        print(f"LLM 缓存: {report['llm_cache']}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    # 读取数据集
+    dataset = load_dataset(args.dataset)
+    with open(args.dataset, encoding="utf-8") as f:
+        dataset_sha256 = digest(f.read())
+
+    # agent 模式下为全部模型调用接入 SQLite 缓存：复跑时未变化的调用直接命中缓存，修改提示词或检索后只有受影响的调用重新请求模型
+    llm_cache = None
+    if args.mode == "agent" and not args.no_cache:
+        llm_cache = SQLiteLLMCache(args.cache)
+        set_llm_cache(llm_cache)
+
+    # 加载向量索引（与 rag_mcp_server.py 使用相同的集合与嵌入模型）
+    llm_chat, llm_embedding = get_llm(Config.LLM_TYPE)
+    vector_store = Chroma(
+        collection_name="example_collection",
+        embedding_function=llm_embedding,
+        persist_directory="./chroma_langchain_db",
+    )
+    evaluator = OfflineEvaluator(vector_store, dataset, ks=args.k, concurrency=args.concurrency, timeout=args.timeout)
+
+    report = {
+        "mode": args.mode,
+        "dataset": args.dataset,
+        "dataset_sha256": dataset_sha256,
+        "llm_type": Config.LLM_TYPE,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    if args.mode == "retrieval":
+        configs = DEFAULT_CONFIGS
+        if args.configs:
+            with open(args.configs, encoding="utf-8") as f:
+                configs = json.load(f)
+        # 检索前预热一次，排除首次加载嵌入模型的耗时
+        evaluator.retrieval.search(dataset[0]["question"], configs[0])
+        report["results"] = [await evaluator.evaluate_retrieval(config) for config in configs]
+    else:
+        system_prompt, human_prompt, prompt_info = load_prompts(args)
+        agent = await build_agent(llm_chat, vector_store, system_prompt, args.retriever, args.top_k)
+        config = {"name": args.name, "retriever": args.retriever, "top_k": args.top_k, "prompts": prompt_info}
+        report["results"] = [await evaluator.evaluate_agent(agent, human_prompt, config, args.user_name,
+                                                            judge=llm_chat if args.judge else None)]
+    if llm_cache is not None:
+        report["llm_cache"] = llm_cache.get_stats()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    # 保存评测报告
+    output = args.output or os.path.join("eval_results", f"{args.mode}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"评测报告已保存到 {output}")
+
+
+# 主程序入口
+if __name__ == "__main__":
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description="RAG 离线评测（检索与回答质量，索引由 create_index.py 创建）")
+    parser.add_argument("--mode", choices=["retrieval", "agent"], default="agent", help="retrieval 只评测检索，agent 评测完整的智能体")
+    parser.add_argument("--dataset", default="./eval_dataset.jsonl", help="JSONL 数据集（question、expected_answer、answer_keywords、sources）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时执行的样本数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个样本的超时时间（秒）")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4], help="retrieval 模式评估的 k 值")
+    parser.add_argument("--configs", default=None, help="retrieval 模式的检索配置 JSON 文件（默认评测 retrieval_benchmark.DEFAULT_CONFIGS）")
+    parser.add_argument("--name", default="agent_rag", help="agent 模式的配置名称，与基线报告中同名的配置对比")
+    parser.add_argument("--prompt-source", choices=["file", "langfuse"], default="file", help="提示词来源：本地文件或 Langfuse（带本地缓存）")
+    parser.add_argument("--system-prompt", default=Config.SYSTEM_PROMPT_TMPL, help="系统提示词文件")
+    parser.add_argument("--human-prompt", default=Config.HUMAN_PROMPT_TMPL, help="用户提示词模板文件（{name}、{question} 占位符）")
+    parser.add_argument("--user-name", default="南哥", help="用户提示词中的 {name}")
+    parser.add_argument("--retriever", choices=["local", "mcp"], default="local", help="检索工具：进程内检索本地 Chroma 索引或调用 MCP Server")
+    parser.add_argument("--top-k", type=int, default=2, help="本地检索工具返回的文本块数量（与 MCP Server 一致默认为 2）")
+    parser.add_argument("--judge", action="store_true", help="使用评审模型对回答打分（1~5）")
+    parser.add_argument("--cache", default="eval_cache/llm_cache.sqlite", help="LLM 缓存文件")
+    parser.add_argument("--no-cache", action="store_true", help="不使用 LLM 缓存")
+    parser.add_argument("--output", default=None, help="评测报告 JSON 保存路径（默认保存到 eval_results 目录）")
+    parser.add_argument("--baseline", default=None, help="基线评测报告 JSON，用于回归对比")
+    asyncio.run(main(parser.parse_args()))
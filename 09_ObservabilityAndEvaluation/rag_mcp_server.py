@@ -9,7 +9,7 @@ from langchain_chroma import Chroma
 # 从自定义 LLM 工具模块导入 get_llm 方法，用于获取对话模型和向量模型实例
 from utils.llms import get_llm
 # 导入日志管理器模块
-from utils.logger import LoggerManager
+from utils.logger import LoggerManager, payload
 
 
 
@@ -103,7 +103,8 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
             (f"Source: {doc.metadata}\nContent: {doc.page_content}")
             for doc in retrieved_docs
         )
-        logger.info(f"检索到的文本块：{serialized}")
+        # 记录检索结果（默认只记录长度、摘要与开头片段，LOG_PAYLOAD_MODE=full 时记录完整内容）
+        logger.info("检索到的文本块：%s", payload(serialized))
 
         # 返回一个包含查询结果的 TextContent 对象
         # 创建TextContent对象，将搜索结果封装为文本内容并返回
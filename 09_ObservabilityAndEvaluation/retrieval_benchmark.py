@@ -0,0 +1,235 @@
+# 导入 argparse 模块，用于解析命令行参数
+import argparse
+# 导入 json 模块，用于读取标注问题集与保存评测结果
+import json
+# 导入 math 模块，用于计算 nDCG 的对数折扣
+import math
+# 导入 os 模块，用于创建结果目录
+import os
+# 导入 re 模块，用于去除 PDF 抽取文本中的空白字符
+import re
+# 导入 time 模块，用于统计检索延迟
+import time
+# 导入线程池，用于测量并发检索吞吐
+from concurrent.futures import ThreadPoolExecutor
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, List, Optional
+# 从 langchain_chroma 包中导入 Chroma，用于加载 create_index.py 创建的向量索引
+from langchain_chroma import Chroma
+# 从自定义配置模块导入 Config 类，用于读取模型类型等配置
+from utils.config import Config
+# 从自定义 LLM 工具模块导入 get_llm 方法，用于获取向量模型实例
+from utils.llms import get_llm
+# 从自定义日志模块导入 LoggerManager，用于获取日志记录器实例
+from utils.logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志记录器，用于输出运行过程中的日志信息
+logger = LoggerManager.get_logger()
+
+
+# 默认评测的检索配置：rag_mcp_server.py 使用的 similarity_search 路径，以及 MMR 检索作为对照
+DEFAULT_CONFIGS = [
+    {"name": "similarity_search", "method": "similarity"},
+    {"name": "mmr_fetch20_lambda0.5", "method": "mmr", "fetch_k": 20, "lambda_mult": 0.5},
+]
+
+
+# 去除文本中的空白字符（PDF 抽取的文本常在词语中间断行）
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", "", text)
+
+
+# 计算分位数（数据为空时返回 None）
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# 计算 recall@k：前 k 个结果中命中的相关文本块数 / 相关文本块总数
+def recall_at_k(ranked: List[str], relevant: set, k: int) -> float:
+    return len(set(ranked[:k]) & relevant) / len(relevant) if relevant else 0.0
+
+
+# 计算 MRR：第一个相关文本块排名的倒数
+def reciprocal_rank(ranked: List[str], relevant: set) -> float:
+    for rank, doc in enumerate(ranked, 1):
+        if doc in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+# 计算 nDCG@k（二值相关性）
+def ndcg_at_k(ranked: List[str], relevant: set, k: int) -> float:
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, doc in enumerate(ranked[:k], 1) if doc in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+# 定义检索评测器
+class RetrievalBenchmark:
+    """
+    Chroma 检索评测：
+
+      - 标注问题集中每个问题给出若干关键片段，索引中包含任一片段的文本块即为相关文本块
+        （按内容判定相关性，重新切分或重建索引后标注仍然有效）
+      - 质量指标：recall@k、MRR 与 nDCG@k
+      - 性能指标：顺序执行得到单次检索延迟的 p50/p99（包含查询向量化耗时），线程池并发执行得到 QPS
+    """
+
+    def __init__(self, vector_store: Chroma, queries: List[Dict[str, Any]],
+                 ks: List[int] = (1, 2, 4), repeat: int = 3, concurrency: int = 8):
+        self.vector_store = vector_store
+        self.queries = queries
+        # 评估的 k 值，检索数量取最大的 k
+        self.ks = list(ks)
+        self.limit = max(self.ks)
+        # 延迟测量的重复次数
+        self.repeat = repeat
+        # 吞吐测量的并发线程数
+        self.concurrency = concurrency
+        # 读取索引中的全部文本块，按关键片段为每个问题确定相关文本块 ID
+        stored = vector_store.get(include=["documents"])
+        chunks = {doc_id: normalize(text) for doc_id, text in zip(stored["ids"], stored["documents"])}
+        self.relevant = {
+            item["id"]: {doc_id for doc_id, text in chunks.items() if any(normalize(kw) in text for kw in item["relevant_keywords"])}
+            for item in queries
+        }
+        for item in queries:
+            if not self.relevant[item["id"]]:
+                logger.warning(f"问题 {item['id']} 在索引中没有相关文本块，请检查标注: {item['query']}")
+
+    def search(self, query: str, config: Dict[str, Any]) -> List[Any]:
+        """按配置执行一次检索"""
+        if config["method"] == "mmr":
+            return self.vector_store.max_marginal_relevance_search(
+                query, k=self.limit, fetch_k=config.get("fetch_k", 20), lambda_mult=config.get("lambda_mult", 0.5))
+        return self.vector_store.similarity_search(query, k=self.limit)
+
+    def evaluate(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """评测单个检索配置"""
+        latencies = []
+        metrics = {f"recall@{k}": 0.0 for k in self.ks}
+        metrics.update({f"ndcg@{k}": 0.0 for k in self.ks})
+        metrics["mrr"] = 0.0
+        per_query = []
+        # 质量与延迟：顺序执行，每个问题重复 repeat 次，质量指标取第一次的结果
+        for item in self.queries:
+            relevant = self.relevant[item["id"]]
+            ranked = None
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                docs = self.search(item["query"], config)
+                latencies.append(time.perf_counter() - start)
+                if ranked is None:
+                    ranked = [doc.id for doc in docs]
+            for k in self.ks:
+                metrics[f"recall@{k}"] += recall_at_k(ranked, relevant, k)
+                metrics[f"ndcg@{k}"] += ndcg_at_k(ranked, relevant, k)
+            rr = reciprocal_rank(ranked, relevant)
+            metrics["mrr"] += rr
+            per_query.append({"id": item["id"], "query": item["query"], "reciprocal_rank": rr,
+                              "relevant_ids": sorted(relevant), "ranked_ids": ranked})
+        metrics = {name: round(value / len(self.queries), 4) for name, value in metrics.items()}
+
+        # 吞吐：线程池并发执行全部问题
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(lambda item: self.search(item["query"], config), self.queries * self.repeat))
+        elapsed = time.perf_counter() - start
+
+        return {
+            "config": config,
+            "metrics": metrics,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.5) * 1000, 2),
+                "p99": round(percentile(latencies, 0.99) * 1000, 2),
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+            },
+            "qps": round(len(self.queries) * self.repeat / elapsed, 2),
+            "per_query": per_query,
+        }
+
+    def run(self, configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """依次评测全部检索配置"""
+        results = []
+        for config in configs:
+            logger.info(f"开始评测检索配置: {config['name']}")
+            # 预热：每个配置先执行一次，排除首次加载的耗时
+            self.search(self.queries[0]["query"], config)
+            results.append(self.evaluate(config))
+        return results
+
+
+# 打印评测结果表格，提供基线结果时同时打印与基线的差值
+def print_results(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None) -> None:
+    baseline_by_name = {r["config"]["name"]: r for r in (baseline or {}).get("results", [])}
+    metric_names = list(results[0]["metrics"].keys())
+    print("=" * 120)
+    print(f"{'配置':<26}" + "".join(f"{name:>11}" for name in metric_names) + f"{'p50(ms)':>10}{'p99(ms)':>10}{'QPS':>9}")
+    for r in results:
+        print(f"{r['config']['name']:<26}" + "".join(f"{r['metrics'][name]:>11}" for name in metric_names)
+              + f"{r['latency_ms']['p50']:>10}{r['latency_ms']['p99']:>10}{r['qps']:>9}")
+        base = baseline_by_name.get(r["config"]["name"])
+        if base:
+            print(f"{'  Δ 基线':<25}" + "".join(f"{round(r['metrics'][name] - base['metrics'].get(name, 0), 4):>+11}" for name in metric_names)
+                  + f"{round(r['latency_ms']['p50'] - base['latency_ms']['p50'], 2):>+10}"
+                  + f"{round(r['latency_ms']['p99'] - base['latency_ms']['p99'], 2):>+10}{round(r['qps'] - base['qps'], 2):>+9}")
+    print("=" * 120)
+
+
+# 主程序入口
+if __name__ == "__main__":
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description="Chroma 检索质量与性能评测（索引由 create_index.py 创建）")
+    parser.add_argument("--queries", default="./retrieval_queries.json", help="标注问题集 JSON 文件")
+    parser.add_argument("--configs", default=None, help="检索配置 JSON 文件（默认评测 DEFAULT_CONFIGS）")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4], help="评估的 k 值")
+    parser.add_argument("--repeat", type=int, default=3, help="每个问题的重复次数（用于延迟与吞吐测量）")
+    parser.add_argument("--concurrency", type=int, default=8, help="吞吐测量的并发线程数")
+    parser.add_argument("--output", default=None, help="评测结果 JSON 保存路径（默认保存到 benchmark_results 目录）")
+    parser.add_argument("--baseline", default=None, help="基线评测结果 JSON，用于回归对比")
+    args = parser.parse_args()
+
+    # 读取标注问题集与检索配置
+    with open(args.queries, encoding="utf-8") as f:
+        queries = json.load(f)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, encoding="utf-8") as f:
+            configs = json.load(f)
+
+    # 加载向量索引（与 rag_mcp_server.py 使用相同的集合与嵌入模型）
+    llm_chat, llm_embedding = get_llm(Config.LLM_TYPE)
+    vector_store = Chroma(
+        collection_name="example_collection",
+        embedding_function=llm_embedding,
+        persist_directory="./chroma_langchain_db",
+    )
+    benchmark = RetrievalBenchmark(vector_store, queries, ks=args.k, repeat=args.repeat, concurrency=args.concurrency)
+    results = benchmark.run(configs)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    # 保存评测结果
+    output = args.output or os.path.join("benchmark_results", f"retrieval_chroma_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "collection": "example_collection",
+            "queries": args.queries,
+            "llm_type": Config.LLM_TYPE,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"评测结果已保存到 {output}")
@@ -0,0 +1,132 @@
+# 导入 hashlib，用于把 (模型参数, 消息) 压缩成定长的缓存键
+import hashlib
+# 导入 json 模块，用于序列化缓存内容
+import json
+# 导入 os，用于创建缓存文件所在目录
+import os
+# 导入 sqlite3，用于本地文件缓存
+import sqlite3
+# 导入线程锁，保证多线程下的读写安全（异步调用的缓存读写在线程池中执行）
+import threading
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Optional
+# 导入 LangChain 缓存基类，通过 set_llm_cache 接入全部模型实例
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+# 导入消息序列化工具，缓存中只保存普通 JSON
+from langchain_core.messages import messages_from_dict, messages_to_dict
+# 导入生成结果类型
+from langchain_core.outputs import ChatGeneration, Generation
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 定义 SQLite 文件缓存的 LLM 精确匹配缓存：用于离线评测复跑，相同的模型参数与消息直接返回上次的结果
+class SQLiteLLMCache(BaseCache):
+    """
+    LLM 精确匹配缓存（SQLite 文件，进程重启后仍然有效）：
+
+      - 缓存键为 sha256(模型序列化参数 + 调用参数 + 消息)，模型名、temperature、绑定的工具以及提示词任一不同都不会命中，
+        修改提示词或检索结果后只有受影响的调用会重新请求模型
+      - 评测时显式启用，不区分 temperature 全部缓存，保证复跑的结果可重现
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        # 同一连接在多个线程中使用，由锁串行化访问
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL 模式下读写互不阻塞
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def _normalize_prompt(prompt: str) -> str:
+        """去除历史消息中不会发送给模型的字段（消息 ID、token 用量、响应元数据），
+        命中缓存的消息带有 total_cost 等额外字段，不去除时后续的模型调用在下一次复跑时无法命中"""
+        try:
+            messages = json.loads(prompt)
+        except ValueError:
+            return prompt
+        if not isinstance(messages, list):
+            return prompt
+        for message in messages:
+            kwargs = message.get("kwargs") if isinstance(message, dict) else None
+            if isinstance(kwargs, dict):
+                for name in ("id", "usage_metadata", "response_metadata"):
+                    kwargs.pop(name, None)
+        return json.dumps(messages, sort_keys=True)
+
+    @classmethod
+    def make_key(cls, prompt: str, llm_string: str) -> str:
+        """计算缓存键"""
+        return hashlib.sha256(f"{llm_string}\x00{cls._normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _dumps(generations: RETURN_VAL_TYPE) -> str:
+        """将生成结果序列化为 JSON"""
+        items = []
+        for generation in generations:
+            if isinstance(generation, ChatGeneration):
+                message = messages_to_dict([generation.message])[0]
+                # 不保存消息 ID，命中缓存时由 LangChain 按本次运行重新生成
+                message["data"]["id"] = None
+                items.append({"message": message, "generation_info": generation.generation_info})
+            else:
+                items.append({"text": generation.text, "generation_info": generation.generation_info})
+        return json.dumps(items, ensure_ascii=False)
+
+    @staticmethod
+    def _loads(value: str) -> RETURN_VAL_TYPE:
+        """从 JSON 还原生成结果"""
+        generations = []
+        for item in json.loads(value):
+            if "message" in item:
+                generations.append(ChatGeneration(message=messages_from_dict([item["message"]])[0], generation_info=item.get("generation_info")))
+            else:
+                generations.append(Generation(text=item["text"], generation_info=item.get("generation_info")))
+        return generations
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """查询缓存，未命中时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (self.make_key(prompt, llm_string),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._loads(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """写入缓存"""
+        value = self._dumps(return_val)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO llm_cache (key, value) VALUES (?, ?)",
+                               (self.make_key(prompt, llm_string), value))
+            self._conn.commit()
+            self.writes += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+            }
@@ -0,0 +1,101 @@
+# 导入 json，用于读写本地缓存文件
+import json
+# 导入 os，用于创建缓存目录与读取文件修改时间
+import os
+# 导入 re，用于把 Langfuse 的 {{变量}} 占位符转换为 LangChain 的 {变量}
+import re
+# 导入 time，用于判断本地缓存是否过期
+import time
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Optional
+# 从当前包中导入 Config 配置类
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志记录器，用于输出运行过程中的日志信息
+logger = LoggerManager.get_logger()
+
+
+# 定义缓存的提示词：提供与 Langfuse TextPromptClient 相同的常用属性（prompt、config、version、get_langchain_prompt）
+class CachedPrompt:
+
+    def __init__(self, name: str, prompt: str, config: Optional[Dict[str, Any]], version: Optional[int], source: str):
+        self.name = name
+        self.prompt = prompt
+        self.config = config or {}
+        self.version = version
+        # 提示词来源：langfuse（刚从服务端获取）、cache（本地缓存有效期内）、fallback（Langfuse 不可用时使用过期的本地缓存）
+        self.source = source
+
+    def get_langchain_prompt(self) -> str:
+        """把 Langfuse 的 {{变量}} 占位符转换为 LangChain PromptTemplate 的 {变量}"""
+        escaped = self.prompt.replace("{", "{{").replace("}", "}}")
+        return re.sub(r"\{\{\{\{\s*(\w+)\s*\}\}\}\}", r"{\1}", escaped)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "prompt": self.prompt, "config": self.config, "version": self.version}
+
+
+# 定义提示词本地缓存：有效期内直接读取本地文件，过期后从 Langfuse 获取并更新本地文件，Langfuse 不可用时使用过期的本地文件
+class PromptCache:
+
+    def __init__(self, cache_dir: str = Config.PROMPT_CACHE_DIR, ttl: int = Config.PROMPT_CACHE_TTL,
+                 fetch_timeout: int = Config.PROMPT_FETCH_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.fetch_timeout = fetch_timeout
+        # Langfuse 客户端在首次需要访问服务端时才创建
+        self._client = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, name: str, label: str) -> str:
+        return os.path.join(self.cache_dir, f"{name.replace('/', '__')}.{label}.json")
+
+    def _read(self, path: str, source: str) -> Optional[CachedPrompt]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return CachedPrompt(data["name"], data["prompt"], data.get("config"), data.get("version"), source)
+
+    def _write(self, path: str, prompt: CachedPrompt) -> None:
+        # 先写临时文件再替换，避免并发读取到写了一半的文件
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(prompt.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, name: str, label: str) -> CachedPrompt:
+        if self._client is None:
+            from langfuse import Langfuse
+            self._client = Langfuse()
+        prompt = self._client.get_prompt(name=name, type="text", label=label, cache_ttl_seconds=0,
+                                         max_retries=0, fetch_timeout_seconds=self.fetch_timeout)
+        return CachedPrompt(name, prompt.prompt, prompt.config, prompt.version, "langfuse")
+
+    def get_prompt(self, name: str, label: str = "production") -> CachedPrompt:
+        """获取文本类型的提示词"""
+        path = self._path(name, label)
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.ttl:
+            cached = self._read(path, "cache")
+            if cached is not None:
+                return cached
+        try:
+            prompt = self._fetch(name, label)
+        except Exception as e:
+            cached = self._read(path, "fallback")
+            if cached is None:
+                raise
+            logger.warning(f"从 Langfuse 获取提示词失败，使用本地缓存: {name} 版本: {cached.version} 错误: {e}")
+            # 更新缓存文件的修改时间，下一个有效期内不再访问 Langfuse，避免每次获取都等待超时
+            os.utime(path)
+            return cached
+        self._write(path, prompt)
+        return prompt
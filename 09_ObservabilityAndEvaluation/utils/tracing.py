@@ -0,0 +1,508 @@
+# 导入 atexit，用于进程退出前导出缓存中剩余的追踪数据
+import atexit
+# 导入 json，用于序列化追踪数据
+import json
+# 导入 os，用于创建本地追踪文件目录
+import os
+# 导入 random，用于按比例采样 trace
+import random
+# 导入 threading，用于后台导出线程与缓存的并发保护
+import threading
+# 导入 time，用于记录 span 的开始与结束时间
+import time
+# 导入 uuid，用于生成 trace ID 与 span ID
+import uuid
+# 导入双端队列，作为有界的 span 缓存
+from collections import deque
+# 导入上下文管理器装饰器
+from contextlib import contextmanager
+# 导入 ContextVar，用于在一次 Agent 执行的所有回调之间共享当前 trace
+from contextvars import ContextVar
+# 导入 datetime，用于生成 ISO 格式的时间戳
+from datetime import datetime, timezone
+# 导入 UUID 类型，用于回调中的 run_id 类型注解
+from uuid import UUID
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Iterator, List, Optional
+# 导入 httpx，用于向 Langfuse 与 OTLP 接收端发送批量数据
+import httpx
+# 导入 LangChain 回调基类，用于采集模型调用、工具调用与链执行的追踪数据
+from langchain_core.callbacks import BaseCallbackHandler
+# 从当前包中导入 Config 配置类
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志记录器，用于输出运行过程中的日志信息
+logger = LoggerManager.get_logger()
+
+# 当前上下文的 trace，由 Tracer.trace() 设置；LangGraph 创建的子任务会复制上下文，共享同一个 trace
+_current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_trace", default=None)
+
+
+def _truncate(value: Any) -> Any:
+    """把输入输出等字段转换为可序列化的值，并按 TRACING_FIELD_MAX_CHARS 截断，保证单个 span 的内存占用有上限"""
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if len(text) <= Config.TRACING_FIELD_MAX_CHARS:
+        # 非字符串的值转换为 JSON 兼容的副本，导出时不受原对象后续修改的影响
+        return value if isinstance(value, str) else json.loads(text)
+    return f"{text[:Config.TRACING_FIELD_MAX_CHARS]}...(截断 {len(text) - Config.TRACING_FIELD_MAX_CHARS} 字符)"
+
+
+def _iso(timestamp: float) -> str:
+    """把 Unix 时间戳转换为 ISO 8601 格式"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="microseconds").replace("+00:00", "Z")
+
+
+# 定义本地 JSONL 文件导出目标：每个 span 一行 JSON，Langfuse 不可用时也能完整保留追踪数据
+class JsonlFileSink:
+
+    name = "jsonl"
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+
+
+# 定义 Langfuse 导出目标：通过 Langfuse 的批量写入接口（/api/public/ingestion）一次提交一批 trace 与 observation
+class LangfuseSink:
+
+    name = "langfuse"
+
+    def __init__(self, base_url: str, public_key: str, secret_key: str, environment: str, timeout: float):
+        self.url = base_url.rstrip("/") + "/api/public/ingestion"
+        self.environment = environment
+        self.client = httpx.Client(auth=(public_key, secret_key), timeout=timeout)
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        batch = []
+        for span in spans:
+            for event_type, body in self._to_events(span):
+                batch.append({"id": uuid.uuid4().hex, "timestamp": _iso(span["end_time"]), "type": event_type, "body": body})
+        response = self.client.post(self.url, json={"batch": batch})
+        response.raise_for_status()
+
+    def _to_events(self, span: Dict[str, Any]) -> List[tuple]:
+        """把 span 转换为 Langfuse 的写入事件：trace 同时生成 trace-create 与根 span-create，模型调用生成 generation-create"""
+        observation = {
+            "id": span["span_id"],
+            "traceId": span["trace_id"],
+            "parentObservationId": span["parent_id"],
+            "name": span["name"],
+            "startTime": _iso(span["start_time"]),
+            "endTime": _iso(span["end_time"]),
+            "input": span.get("input"),
+            "output": span.get("output"),
+            "metadata": span.get("metadata"),
+            "level": span.get("level", "DEFAULT"),
+            "statusMessage": span.get("status_message"),
+            "environment": self.environment,
+        }
+        if span["type"] == "trace":
+            trace = {
+                "id": span["trace_id"],
+                "name": span["name"],
+                "timestamp": _iso(span["start_time"]),
+                "userId": span.get("user_id"),
+                "sessionId": span.get("session_id"),
+                "tags": span.get("tags"),
+                "version": span.get("version"),
+                "input": span.get("input"),
+                "output": span.get("output"),
+                "metadata": span.get("metadata"),
+                "environment": self.environment,
+            }
+            return [("trace-create", trace), ("span-create", observation)]
+        if span["type"] == "generation":
+            usage = span.get("usage") or {}
+            observation.update(
+                model=span.get("model"),
+                usageDetails={key: value for key, value in usage.items() if value is not None},
+                promptName=(span.get("prompt") or {}).get("name"),
+                promptVersion=(span.get("prompt") or {}).get("version"),
+            )
+            return [("generation-create", observation)]
+        return [("span-create", observation)]
+
+
+# 定义 OTLP 导出目标：以 OTLP/HTTP JSON 格式发送到 OpenTelemetry Collector、Jaeger、Tempo 等接收端
+class OtlpSink:
+
+    name = "otlp"
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=timeout)
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "agent_rag.tracing"}, "spans": [self._to_otlp(span) for span in spans]}],
+            }]
+        }
+        response = self.client.post(self.url, json=payload)
+        response.raise_for_status()
+
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)}}
+
+    def _to_otlp(self, span: Dict[str, Any]) -> Dict[str, Any]:
+        attributes = {"span.type": span["type"]}
+        for key in ("input", "output", "metadata", "model", "user_id", "session_id", "tags", "version", "status_message"):
+            if span.get(key) is not None:
+                attributes[key] = span[key]
+        for key, value in (span.get("usage") or {}).items():
+            if value is not None:
+                attributes[f"usage.{key}"] = value
+        otlp_span = {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            # 1 为 SPAN_KIND_INTERNAL
+            "kind": 1,
+            "startTimeUnixNano": str(int(span["start_time"] * 1e9)),
+            "endTimeUnixNano": str(int(span["end_time"] * 1e9)),
+            "attributes": [self._attribute(key, value) for key, value in attributes.items()],
+            # 状态码：1 为 OK，2 为 ERROR
+            "status": {"code": 2 if span.get("level") == "ERROR" else 1},
+        }
+        if span["parent_id"]:
+            otlp_span["parentSpanId"] = span["parent_id"]
+        return otlp_span
+
+
+def create_sinks(names: str) -> List[Any]:
+    """根据配置的名称列表创建导出目标"""
+    sinks = []
+    for name in [item.strip() for item in names.split(",") if item.strip()]:
+        if name == "jsonl":
+            sinks.append(JsonlFileSink(Config.TRACING_JSONL_FILE))
+        elif name == "langfuse":
+            sinks.append(LangfuseSink(Config.LANGFUSE_BASE_URL, Config.LANGFUSE_PUBLIC_KEY, Config.LANGFUSE_SECRET_KEY,
+                                      Config.LANGFUSE_TRACING_ENVIRONMENT, Config.TRACING_EXPORT_TIMEOUT))
+        elif name == "otlp":
+            sinks.append(OtlpSink(Config.TRACING_OTLP_ENDPOINT, Config.TRACING_SERVICE_NAME, Config.TRACING_EXPORT_TIMEOUT))
+        else:
+            raise ValueError(f"不支持的追踪导出目标: {name}，可选值: jsonl、langfuse、otlp")
+    return sinks
+
+
+# 定义批量导出器：span 结束时只放入有界缓存，由后台线程按批次导出到各个导出目标
+class BatchSpanExporter:
+    """
+    批量导出：
+
+      - 缓存已满时丢弃新产生的 span 并计数，内存占用不会超过 TRACING_MAX_BUFFERED_SPANS 个 span
+      - 后台线程每隔 TRACING_EXPORT_INTERVAL 秒或缓存达到一批时导出，导出耗时与失败都不影响 Agent 执行
+      - 某个导出目标失败（如 Langfuse 不可用）时记录日志并丢弃该批数据，不影响其他导出目标
+    """
+
+    def __init__(self, sinks: List[Any], max_buffered: int, batch_size: int, interval: float):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.interval = interval
+        self._buffer: deque = deque()
+        self._max_buffered = max_buffered
+        self._lock = threading.Lock()
+        # 唤醒后台线程立即导出（缓存达到一批或主动刷新时）
+        self._wakeup = threading.Event()
+        # 保证同一时间只有一个线程在导出（后台线程与主动刷新）
+        self._export_lock = threading.Lock()
+        self._stopped = threading.Event()
+        # 统计：已导出（至少一个导出目标成功）、全部导出目标均失败、缓存已满丢弃、各导出目标失败的 span 数量
+        self.stats = {"exported": 0, "failed": 0, "dropped": 0, "sink_failed": {sink.name: 0 for sink in sinks}}
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Dict[str, Any]) -> None:
+        """放入缓存（不做任何 IO）"""
+        with self._lock:
+            if len(self._buffer) >= self._max_buffered:
+                self.stats["dropped"] += 1
+                return
+            self._buffer.append(span)
+            full_batch = len(self._buffer) >= self.batch_size
+        if full_batch:
+            self._wakeup.set()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+
+    def _export(self, batch: List[Dict[str, Any]]) -> None:
+        succeeded = 0
+        for sink in self.sinks:
+            try:
+                sink.export(batch)
+                succeeded += 1
+            except Exception as e:
+                self.stats["sink_failed"][sink.name] += len(batch)
+                logger.warning(f"追踪数据导出失败，导出目标: {sink.name} span 数量: {len(batch)} 错误: {e}")
+        # 至少一个导出目标成功才计为已导出，全部失败时该批数据已丢失，单独计数
+        if succeeded:
+            self.stats["exported"] += len(batch)
+        else:
+            self.stats["failed"] += len(batch)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """导出缓存中的全部 span"""
+        with self._export_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return
+                self._export(batch)
+
+    def shutdown(self) -> None:
+        """停止后台线程并导出剩余数据"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+
+# 定义 trace 句柄：在 trace 结束前补充输出与元数据
+class TraceHandle:
+
+    def __init__(self, trace: Dict[str, Any]):
+        self._trace = trace
+
+    @property
+    def trace_id(self) -> str:
+        return self._trace["trace_id"]
+
+    def update(self, output: Any = None, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """更新 trace 的输出与元数据（未被采样时不做任何事）"""
+        if not self._trace["sampled"]:
+            return
+        if output is not None:
+            self._trace["record"]["output"] = _truncate(output)
+        if metadata:
+            self._trace["record"]["metadata"] = {**(self._trace["record"].get("metadata") or {}), **{k: _truncate(v) for k, v in metadata.items()}}
+
+
+# 定义追踪器：创建 trace，并把 span 交给批量导出器
+class Tracer:
+
+    def __init__(self, exporter: BatchSpanExporter, sample_rate: float):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        # 未被采样的 trace 数量
+        self.sampled_out = 0
+        # 挂载到 LangChain 调用配置中的回调处理器
+        self.callback_handler = TracingCallbackHandler(self)
+
+    def new_trace(self, name: str, **attributes: Any) -> Dict[str, Any]:
+        """创建一个 trace，按采样比例决定是否记录"""
+        sampled = random.random() < self.sample_rate
+        if not sampled:
+            self.sampled_out += 1
+        trace_id = uuid.uuid4().hex
+        record = {
+            "type": "trace",
+            "trace_id": trace_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": None,
+            "name": name,
+            "start_time": time.time(),
+            **{key: _truncate(value) if key in ("input", "metadata") else value for key, value in attributes.items() if value is not None},
+        }
+        return {"trace_id": trace_id, "sampled": sampled, "record": record, "prompt": attributes.get("prompt")}
+
+    def end_trace(self, trace: Dict[str, Any], error: Optional[BaseException] = None) -> None:
+        if not trace["sampled"]:
+            return
+        record = trace["record"]
+        record["end_time"] = time.time()
+        if error is not None:
+            record.update(level="ERROR", status_message=f"{type(error).__name__}: {error}")
+        self.exporter.submit(record)
+
+    @contextmanager
+    def trace(self, name: str, *, user_id: Optional[str] = None, session_id: Optional[str] = None,
+              tags: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None, version: Optional[str] = None,
+              input: Any = None, prompt: Optional[Dict[str, Any]] = None) -> Iterator[TraceHandle]:
+        """
+        在代码块内创建一个 trace，代码块中通过 callback_handler 采集到的模型调用、工具调用等都归入该 trace。
+        prompt 为 {"name": ..., "version": ...}，导出到 Langfuse 时用于把模型调用与提示词版本关联
+        """
+        trace = self.new_trace(name, user_id=user_id, session_id=session_id, tags=tags, metadata=metadata,
+                               version=version, input=input, prompt=prompt)
+        token = _current_trace.set(trace)
+        error = None
+        try:
+            yield TraceHandle(trace)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_trace.reset(token)
+            self.end_trace(trace, error)
+
+    def submit(self, span: Dict[str, Any]) -> None:
+        self.exporter.submit(span)
+
+    def flush(self) -> None:
+        self.exporter.flush()
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"sample_rate": self.sample_rate, "sampled_out": self.sampled_out,
+                "buffered": len(self.exporter._buffer), **self.exporter.stats}
+
+
+# 定义追踪回调：在 LangChain 回调中记录链、模型调用、工具调用与检索的 span
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    采集的 span：
+
+      - chain：LangGraph 节点与中间件等链执行（只有最外层记录输入输出，避免每个节点都序列化完整的消息列表）
+      - generation：模型调用，记录输入消息、输出、模型名与 token 用量
+      - tool / retriever：工具调用与检索，记录输入与输出
+      - 未在 Tracer.trace() 中执行时，最外层调用自动创建一个 trace
+    """
+
+    # 在调用线程中直接执行（回调只构造字典并放入缓存），不提交到线程池
+    run_inline = True
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        # run_id -> 执行中的 span（未被采样的 trace 也记录，用于子调用找到所属 trace）
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], span_type: str, name: str, **fields: Any) -> None:
+        parent = self._runs.get(parent_run_id) if parent_run_id else None
+        if parent is not None:
+            trace, parent_id, implicit = parent["trace"], parent["record"]["span_id"], False
+        else:
+            trace, implicit = _current_trace.get(), False
+            if trace is None:
+                # 不在 Tracer.trace() 中：最外层调用自动创建一个 trace
+                trace, implicit = self.tracer.new_trace(name), True
+            parent_id = trace["record"]["span_id"]
+        record = None
+        if trace["sampled"]:
+            record = {"type": span_type, "trace_id": trace["trace_id"], "span_id": run_id.hex[:16], "parent_id": parent_id,
+                      "name": name, "start_time": time.time(), **{key: _truncate(value) for key, value in fields.items()}}
+            if span_type == "generation" and trace.get("prompt"):
+                record["prompt"] = trace["prompt"]
+        self._runs[run_id] = {"trace": trace, "record": record, "implicit": implicit}
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **fields: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        record = run["record"]
+        if record is not None:
+            record["end_time"] = time.time()
+            record.update({key: _truncate(value) for key, value in fields.items() if value is not None})
+            if error is not None:
+                record.update(level="ERROR", status_message=f"{type(error).__name__}: {error}")
+            self.tracer.submit(record)
+        if run["implicit"]:
+            self.tracer.end_trace(run["trace"], error)
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, tags: Optional[List[str]] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        self._start(run_id, parent_run_id, "span", name, **({"input": inputs} if parent_run_id is None else {}))
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._end(run_id, **({"output": outputs} if parent_run_id is None else {}))
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=error)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        model = (metadata or {}).get("ls_model_name") or ((kwargs.get("invocation_params") or {}).get("model"))
+        conversation = [{"role": message.type, "content": message.content} for message in (messages[0] if messages else [])]
+        self._start(run_id, parent_run_id, "generation", kwargs.get("name") or (serialized or {}).get("name") or "llm",
+                    input=conversation, model=model)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        output, usage = None, None
+        generations = response.generations[0] if response.generations else []
+        if generations:
+            message = getattr(generations[0], "message", None)
+            output = message.content if message is not None else generations[0].text
+            if message is not None and getattr(message, "tool_calls", None):
+                output = {"content": output, "tool_calls": message.tool_calls}
+            usage_metadata = getattr(message, "usage_metadata", None) or {}
+            if usage_metadata:
+                usage = {"input": usage_metadata.get("input_tokens"), "output": usage_metadata.get("output_tokens"),
+                         "total": usage_metadata.get("total_tokens")}
+        self._end(run_id, output=output, usage=usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start(run_id, parent_run_id, "tool", name, input=kwargs.get("inputs") or input_str)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, output=getattr(output, "content", output))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=error)
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID,
+                           parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, "retriever", kwargs.get("name") or "retriever", input=query)
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, output=[{"metadata": doc.metadata, "content": doc.page_content} for doc in documents])
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=error)
+
+
+# 进程内共享的追踪器
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """获取进程内共享的追踪器（首次调用时根据配置创建导出目标并启动后台导出线程）"""
+    global _tracer
+    if _tracer is None:
+        exporter = BatchSpanExporter(create_sinks(Config.TRACING_SINKS), Config.TRACING_MAX_BUFFERED_SPANS,
+                                     Config.TRACING_BATCH_SIZE, Config.TRACING_EXPORT_INTERVAL)
+        _tracer = Tracer(exporter, Config.TRACING_SAMPLE_RATE)
+        # 进程退出前导出剩余数据
+        atexit.register(_tracer.shutdown)
+        logger.info(f"追踪导出已启用，导出目标: {Config.TRACING_SINKS} 采样比例: {Config.TRACING_SAMPLE_RATE} 缓存上限: {Config.TRACING_MAX_BUFFERED_SPANS} 个 span")
+    return _tracer
@@ -7,7 +7,7 @@ from utils.config import Config
 # 导入自定义的Milvus搜索管理器类
 from mix_text_search import MilvusSearchManager
 # 导入日志管理器模块
-from utils.logger import LoggerManager
+from utils.logger import LoggerManager, payload
 
 
 
@@ -189,8 +189,8 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
                     )
                     # 将记录追加到结果字符串
                     filtered_result_string += record
-                # 打印完整的搜索结果字符串
-                logger.info(f"过滤搜索结果:\n{filtered_result_string}")
+                # 记录搜索结果（默认只记录长度、摘要与开头片段，LOG_PAYLOAD_MODE=full 时记录完整内容）
+                logger.info("过滤搜索结果: %s", payload(filtered_result_string))
                 # 返回一个包含查询结果的 TextContent 对象
                 # 创建TextContent对象，将搜索结果封装为文本内容并返回
                 return [TextContent(type="text", text=filtered_result_string)]
@@ -2,37 +2,66 @@
 import uvicorn
 # 导入 uuid 模块，用于生成全局唯一标识符（例如记忆 ID）
 import uuid
+# 导入 asyncio，用于把阻塞的统计查询放到线程中执行
+import asyncio
+# 导入 argparse 模块，用于解析启动参数（worker 数等）
+import argparse
+# 导入 os 模块，用于把 worker 数传递给子进程
+import os
+# 导入 json 模块，用于序列化进度订阅接口推送的事件
+import json
+# 导入 time 模块，用于统计请求耗时指标
+import time
+# 导入 random 模块，用于按比例随机选择需要剖析的请求
+import random
+# 导入 datetime，用于根据中断时的 checkpoint 时间计算人工审核等待时长
+from datetime import datetime, timezone
 # 导入 typing 模块中的类型提示工具，用于类型注解
 from typing import List, Dict, Any, Optional
 # FastAPI 核心框架导入
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
+# 导入 JSONResponse（就绪检查失败时返回 503）、StreamingResponse（推送异步任务进度）与 Response（输出 Prometheus 指标）
+from fastapi.responses import JSONResponse, StreamingResponse, Response, FileResponse
 # Pydantic 数据验证与序列化基类，用于定义请求/响应模型
 from pydantic import BaseModel
-# 实现 lifespan 的上下文管理器，用于管理应用生命周期
-from contextlib import asynccontextmanager
+# 实现 lifespan 的上下文管理器，用于管理应用生命周期；nullcontext 用于未启用准入控制时的占位
+from contextlib import asynccontextmanager, nullcontext
 # LangChain Agent 创建相关导入
 from langchain.agents import create_agent
 # 导入摘要中间件，用于在上下文过长时自动摘要历史消息
 from langchain.agents.middleware import SummarizationMiddleware
-# 导入提示词模板相关类，用于构建系统/用户提示
-from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
-# 导入异步 PostgreSQL 连接池
-from psycopg_pool import AsyncConnectionPool
 # 导入异步 PostgreSQL 检查点保存器（用于短期记忆/对话状态持久化）
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 # 导入异步 PostgreSQL 键值存储（用于长期记忆）
 from langgraph.store.postgres import AsyncPostgresStore
 # 导入工具调用结构化输出策略
 from langchain.agents.structured_output import ToolStrategy
+# 导入 RunnableLambda，用于把单个问题的处理流程包装为 Runnable 以使用 abatch_as_completed
+from langchain_core.runnables import RunnableLambda
 # 导入 LangGraph 中的 Command 类型，用于中断后恢复执行
 from langgraph.types import Command
 # 导入项目自定义配置、工具、模型、日志等模块
 from utils.config import Config
-from utils.llms import get_llm
+from utils.llms import get_llm, get_rate_limiters
 from utils.tools import get_tools
 from utils.models import Context, ResponseFormat
-from utils.models import AskRequest, InterveneRequest, AgentResponse
-from utils.logger import LoggerManager
+from utils.models import AskRequest, InterveneRequest, AgentResponse, RunCreated, RunInfo, BatchAskRequest
+from utils.logger import LoggerManager, bind_log_context, log_context, payload, current_request_id
+from utils.db import PoolManager, TimedPostgresSaver
+from utils.token_counter import get_token_counter
+from utils.summarization import BackgroundSummarizationMiddleware
+from utils.trimming import MessageWindowMiddleware
+from utils.prompts import PromptRegistry
+from utils.llm_cache import get_llm_cache
+from utils.semantic_cache import get_semantic_cache, tools_used_in_turn
+from utils.router import RoutedChatModel
+from utils.health import check_readiness, wait_until_ready
+from utils.admission import AdmissionRejected, get_admission_controller
+from utils.runs import RunQueue, RunWorkerPool, TERMINAL_STATUSES, checkpoint_progress
+from utils.timing import RequestTimer, current_timer, span, record, timing_callback
+from utils.profiler import get_profiler, set_session, reset_session
+from utils.hitl_policy import list_audit_records
+from utils.metrics import HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT, AGENT_RESULTS, update_pool_metrics, render_metrics, prepare_multiprocess_dir
 
 
 
@@ -43,59 +72,85 @@ from utils.logger import LoggerManager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    FastAPI 应用生命周期管理器：
-      - 启动阶段：创建连接池、初始化 checkpointer 和 store
+    FastAPI 应用生命周期管理器（多 worker 部署时每个 worker 进程各自执行一次）：
+      - 启动阶段：创建连接池、初始化 checkpointer 和 store，并等待 PostgreSQL 与 MCP Server 就绪
       - 运行阶段：yield 让 FastAPI 开始接受请求
       - 关闭阶段：清理资源（关闭连接池）
     """
-    # 声明使用全局变量（在模块级别定义的 pool、checkpointer、store）
-    global pool, checkpointer, store
+    # 声明使用全局变量（在模块级别定义的 pool_manager、checkpointer、store、run_queue、run_workers）
+    global pool_manager, checkpointer, store, run_queue, run_workers
+
+    # 一次性加载并编译 prompt 目录下的全部模板，并启动后台热加载
+    prompt_registry.start()
 
     # 记录应用启动日志
     logger.info("应用正在启动... 初始化数据库资源")
 
-    # 创建异步 PostgreSQL 连接池
-    pool = AsyncConnectionPool(
-        # 数据库连接字符串，从配置读取
-        conninfo=Config.DB_URI,
-        # 连接池最小连接数
-        min_size=Config.MIN_SIZE,
-        # 连接池最大连接数
-        max_size=Config.MAX_SIZE,
-        # 连接参数：启用自动提交，禁用预处理语句
-        kwargs={"autocommit": True, "prepare_threshold": 0},
-        # 启动时不立即打开（稍后手动打开）
-        open=False
-    )
-    # 显式打开连接池
-    await pool.open()
+    # 创建连接池管理器：checkpointer 与 store 使用各自独立、按 worker 数自动计算大小的连接池
+    pool_manager = PoolManager()
+    # 打开连接池
+    await pool_manager.open()
 
-    # 创建短期记忆检查点保存器
-    checkpointer = AsyncPostgresSaver(pool)
+    # 创建短期记忆检查点保存器（checkpoint 读写耗时记入请求耗时明细）
+    checkpointer = TimedPostgresSaver(pool_manager.checkpointer_pool)
     # 初始化检查点所需的数据库表结构
     await checkpointer.setup()
     # 记录检查点初始化成功日志
     logger.info("短期记忆 Checkpointer 初始化成功")
 
     # 创建长期记忆键值存储器
-    store = AsyncPostgresStore(pool)
+    store = AsyncPostgresStore(pool_manager.store_pool)
     # 初始化存储器所需的数据库表结构
     await store.setup()
     # 记录长期记忆存储器初始化成功日志
     logger.info("长期记忆 store 初始化成功")
 
-    logger.info(f"API接口服务启动成功")
+    # 创建异步任务队列（访问量较低，复用 store 连接池）
+    run_queue = RunQueue(pool_manager.store_pool)
+    await run_queue.setup()
+
+    # 等待依赖服务就绪后再开始接收请求；超时仍未就绪时照常启动，由 /ready 返回 503 让负载均衡暂不转发流量
+    readiness = await wait_until_ready(pool_manager, Config.READY_WAIT_TIMEOUT)
+    if not readiness["ready"]:
+        logger.warning(f"依赖服务未就绪: {readiness['checks']}")
+
+    # 依赖就绪后再启动任务执行 worker
+    if Config.RUNS_ENABLED:
+        run_workers = RunWorkerPool(
+            queue=run_queue,
+            execute=execute_run,
+            concurrency=Config.RUN_WORKER_CONCURRENCY,
+            poll_interval=Config.RUN_POLL_INTERVAL,
+            lease_seconds=Config.RUN_LEASE_SECONDS,
+            max_attempts=Config.RUN_MAX_ATTEMPTS
+        )
+        run_workers.start()
+
+    # 后台定时刷新数据库连接池指标
+    pool_metrics_task = asyncio.create_task(refresh_pool_metrics())
+
+    # 开启请求剖析时在事件循环上安装任务工厂，剖析请求中创建的任务归入对应的剖析
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.install(asyncio.get_running_loop())
+        logger.info(f"请求剖析已启用，请求头触发: {Config.PROFILING_ENABLED} 随机采样比例: {Config.PROFILING_SAMPLE_RATE} 剖析目录: {Config.PROFILING_DIR}")
+
+    logger.info(f"API接口服务启动成功，进程ID: {os.getpid()}")
 
     # ──────────────── 进入正常运行阶段，让 FastAPI 开始接收请求 ────────────────
     yield
 
     # ──────────────── 应用即将关闭，清理资源 ────────────────
     logger.info("应用正在关闭... 清理资源")
-    # 如果连接池存在，则关闭它
-    if pool is not None:
-        await pool.close()
-        # 记录连接池关闭日志
-        logger.info("数据库连接池已关闭")
+    pool_metrics_task.cancel()
+    # 停止领取新任务并等待执行中的任务完成
+    if run_workers is not None:
+        await run_workers.stop(Config.RUN_SHUTDOWN_TIMEOUT)
+    # 停止提示词模板热加载线程
+    prompt_registry.stop()
+    # 如果连接池管理器存在，则关闭其管理的全部连接池
+    if pool_manager is not None:
+        await pool_manager.close()
 
 
 # 创建 FastAPI 应用实例，并绑定 lifespan 生命周期管理器
@@ -114,10 +169,76 @@ app = FastAPI(
 # 获取项目统一的日志记录器实例
 logger = LoggerManager.get_logger()
 
+
+# 准入控制拒绝时返回 429/503，并通过 Retry-After 告知客户端重试时间
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# 请求剖析：开启后对带 X-Profile: 1 请求头的请求，或按比例随机对 /ask 与 /intervene 请求采集 CPU 采样剖析与任务等待时间线，
+# 剖析ID通过 X-Profile-Id 响应头返回（流式响应只剖析到响应头发出为止）。该中间件位于请求耗时中间件内层，可以读取到请求ID
+@app.middleware("http")
+async def request_profiling(request: Request, call_next):
+    profiler = get_profiler()
+    if profiler is None:
+        return await call_next(request)
+    requested = Config.PROFILING_ENABLED and request.headers.get("X-Profile") == "1"
+    sampled = request.method == "POST" and request.url.path in ("/ask", "/intervene") and random.random() < Config.PROFILING_SAMPLE_RATE
+    session = profiler.start(current_request_id(), request.method, request.url.path) if requested or sampled else None
+    if session is None:
+        return await call_next(request)
+    token = set_session(session)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_session(token)
+        profiler.stop(session)
+    response.headers["X-Profile-Id"] = session.profile_id
+    return response
+
+# 请求耗时明细与请求指标：为每个请求创建计时器，以 Server-Timing 响应头返回各阶段耗时，并输出一条结构化日志；
+# 同时按路由记录请求数、耗时与处理中的请求数（/metrics 自身不计入）；
+# 请求ID取自 X-Request-ID 请求头（没有时生成），附加到该请求输出的每条日志并通过响应头返回
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    timer = RequestTimer()
+    start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    status = "500"
+    with log_context(request_id=request_id):
+        try:
+            with timer.activate():
+                response = await call_next(request)
+            status = str(response.status_code)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # 使用路由模板（如 /runs/{run_id}）作为标签，未匹配到路由的请求统一记为 unmatched
+            route = request.scope["route"].path if "route" in request.scope else "unmatched"
+            HTTP_REQUESTS.labels(request.method, route, status).inc()
+            HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - start)
+        response.headers["X-Request-ID"] = request_id
+        # 只有执行了 Agent 相关阶段的请求才输出（统计类接口不记录任何阶段）
+        if Config.TIMING_ENABLED and timer.spans:
+            response.headers["Server-Timing"] = timer.server_timing()
+            logger.info("请求耗时明细", extra={"fields": {"method": request.method, "path": request.url.path, **timer.to_dict()}})
+    return response
+
 # 声明全局变量，用于在 lifespan 和路由函数之间共享数据库资源
-pool: Optional[AsyncConnectionPool] = None
+pool_manager: Optional[PoolManager] = None
 checkpointer: Optional[AsyncPostgresSaver] = None
 store: Optional[AsyncPostgresStore] = None
+# 异步任务队列与任务执行 worker 池
+run_queue: Optional[RunQueue] = None
+run_workers: Optional[RunWorkerPool] = None
+# 提示词模板注册表，请求处理过程中只从内存读取模板
+prompt_registry = PromptRegistry()
 
 
 # 内部辅助函数：读取指定用户的长期记忆内容
@@ -126,7 +247,8 @@ async def read_long_term_info(user_id: str) -> str:
     namespace = ("memories", user_id)
 
     # 在该命名空间下搜索所有记忆条目（不带语义过滤）
-    memories = await store.asearch(namespace, query="")
+    with span("memory_read"):
+        memories = await store.asearch(namespace, query="")
 
     # 如果有记忆，则将每个记忆的 data 字段用空格拼接
     long_term_info = " ".join(
@@ -149,11 +271,12 @@ async def write_long_term_info(user_id: str, memory_info: str) -> str:
     memory_id = str(uuid.uuid4())
 
     # 将记忆内容写入存储（value 包一层 dict，字段名为 data）
-    await store.aput(
-        namespace=namespace,
-        key=memory_id,
-        value={"data": memory_info}
-    )
+    with span("memory_write"):
+        await store.aput(
+            namespace=namespace,
+            key=memory_id,
+            value={"data": memory_info}
+        )
 
     # 记录写入成功的日志
     logger.info(f"成功为用户ID: {user_id} 存储记忆，记忆ID: {memory_id}")
@@ -162,19 +285,50 @@ async def write_long_term_info(user_id: str, memory_info: str) -> str:
     return "记忆存储成功"
 
 
-# 内部函数：为当前请求创建一个独立的 Agent 实例
+# 内部函数：根据配置创建上下文摘要中间件
+def create_summarization_middleware(llm_chat: Any) -> SummarizationMiddleware:
+    # 摘要中间件的公共参数，使用进程内共享的带缓存 token 计数器，历史消息只计数一次
+    summary_kwargs = {
+        "model": llm_chat,
+        "trigger": ("tokens", Config.SUMMARY_TRIGGER_TOKENS),
+        "keep": ("messages", Config.SUMMARY_KEEP_MESSAGES),
+        "token_counter": get_token_counter(),
+    }
+    # 后台模式：接近阈值时后台预计算摘要并写入 store，下一轮再替换历史
+    if Config.SUMMARY_MODE == "background":
+        return BackgroundSummarizationMiddleware(precompute_ratio=Config.SUMMARY_PRECOMPUTE_RATIO, **summary_kwargs)
+    # 同步模式：达到阈值时在本次请求中生成摘要
+    return SummarizationMiddleware(**summary_kwargs)
+
+
+# 内部函数：为当前请求创建一个独立的 Agent 实例（耗时记为 agent_build）
 async def create_agent_instance() -> Any:
+    with span("agent_build"):
+        return await build_agent()
+
+
+# 内部函数：构建 Agent 实例
+async def build_agent() -> Any:
     # 根据配置获取聊天模型和嵌入模型
     llm_chat, llm_embedding = get_llm(Config.LLM_TYPE)
 
-    # 获取可用工具列表以及 HITL 中间件实例
-    tools, hitl_middleware = await get_tools()
+    # 获取可用工具列表以及 HITL 中间件实例（包含一次 MCP 工具列表查询）
+    with span("tools_load"):
+        tools, hitl_middleware = await get_tools()
 
-    # 从文件读取系统提示词模板
-    system_prompt = PromptTemplate.from_file(
-        template_file=Config.SYSTEM_PROMPT_TMPL,
-        encoding="utf-8"
-    ).template
+    # 从提示词注册表读取系统提示词模板（内存读取，不访问文件系统）
+    system_prompt = prompt_registry.get_template(Config.SYSTEM_PROMPT_TMPL)
+
+    # 中间件列表：摘要 + 人工介入审核
+    middleware = [
+        # 上下文自动摘要中间件（token 超 4000 时触发，保留最后 3 条消息）
+        create_summarization_middleware(llm_chat),
+        # 人工介入审核中间件
+        hitl_middleware
+    ]
+    # 配置了消息窗口时，在摘要之前先裁剪滑出窗口的消息（只删除滑出的消息，不重写整个历史）
+    if Config.TRIM_MAX_MESSAGES or Config.TRIM_MAX_TOKENS:
+        middleware.insert(0, MessageWindowMiddleware(max_messages=Config.TRIM_MAX_MESSAGES, max_tokens=Config.TRIM_MAX_TOKENS))
 
     # 使用 LangChain 的 create_agent 创建一个 Agent 实例
     agent = create_agent(
@@ -184,13 +338,8 @@ async def create_agent_instance() -> Any:
         system_prompt=system_prompt,
         # 可调用工具列表
         tools=tools,
-        # 中间件列表：摘要 + 人工介入审核
-        middleware=[
-            # 上下文自动摘要中间件（token 超 4000 时触发，保留最后 3 条消息）
-            SummarizationMiddleware(model=llm_chat, trigger=("tokens", 4000), keep=("messages", 3)),
-            # 人工介入审核中间件
-            hitl_middleware
-        ],
+        # 中间件列表
+        middleware=middleware,
         # 上下文结构定义（包含 user_id 等业务字段）
         context_schema=Context,
         # 结构化输出格式（支持从状态中读取 structured_response）
@@ -205,14 +354,19 @@ async def create_agent_instance() -> Any:
 
 
 # 核心运行函数：执行 Agent 并处理 HITL 中断逻辑
-async def run_agent_with_hitl(agent: Any, user_content: str, config: dict, context: Context) -> Dict[str, Any]:
+async def run_agent_with_hitl(agent: Any, user_content: str, config: dict, context: Context, message_id: Optional[str] = None) -> Dict[str, Any]:
     # 写入一条固定的长期记忆（示例用，实际项目中应根据业务动态写入）
     await write_long_term_info("user_001", "南哥")
 
+    # 用户消息；异步任务为消息指定固定 ID，重试时据此判断本次问题是否已经写入会话
+    user_message = {"role": "user", "content": user_content}
+    if message_id:
+        user_message["id"] = message_id
+
     # 第一次调用 Agent，传入用户消息
     result = await agent.ainvoke(
         # 消息列表，初始只有一条用户消息
-        {"messages": [{"role": "user", "content": user_content}]},
+        {"messages": [user_message]},
         # 运行配置（包含 thread_id、user_id 等）
         config=config,
         # 上下文对象（包含 user_id 等信息）
@@ -242,47 +396,80 @@ async def run_agent_with_hitl(agent: Any, user_content: str, config: dict, conte
         final_result = result["messages"][-1].content
         return {
             "status": "completed",
-            "result": final_result
+            "result": final_result,
+            # 本轮调用过的工具，用于决定语义缓存的有效期
+            "tools_used": tools_used_in_turn(result["messages"])
         }
 
 
-# API 端点：接收用户问题并启动 Agent 执行
+# 获取一个执行槽位：启用准入控制时按用户排队/拒绝，未启用时直接执行
+def admission_slot(user_id: str):
+    admission = get_admission_controller()
+    return admission.slot(user_id) if admission is not None else nullcontext()
+
+
+# 请求中携带 debug=true 时，在响应中附带本次请求的耗时明细；同时记录 Agent 执行结果指标
+def with_timings(response: AgentResponse, debug: bool, endpoint: str) -> AgentResponse:
+    AGENT_RESULTS.labels(endpoint, response.status).inc()
+    timer = current_timer()
+    if debug and timer is not None:
+        response.timings = timer.to_dict()
+    return response
+
+
+# API 端点：接收用户问题并启动 Agent 执行（经过准入控制）
 @app.post("/ask", response_model=AgentResponse)
 async def ask(request: AskRequest):
+    async with admission_slot(request.user_id):
+        response = await handle_ask(request)
+    return with_timings(response, request.debug, "ask")
+
+
+# 处理 /ask 请求（批量请求时传入共享的 Agent 实例）
+async def handle_ask(request: AskRequest, agent: Any = None, message_id: Optional[str] = None) -> AgentResponse:
+    # 该请求后续的日志都携带用户ID与会话ID
+    bind_log_context(user_id=request.user_id, thread_id=request.thread_id)
     # 请求数据日志
-    logger.info(f"/ask接口接收用户问题并启动 Agent 执行，用户ID： {request.user_id} 会话ID： {request.thread_id} 用户问题： {request.question}")
+    logger.info("/ask接口接收用户问题并启动 Agent 执行，用户问题： %s", payload(request.question))
+
+    # 启用语义缓存时，先查找该用户语义相近且仍然有效的历史回答，命中则跳过 Agent 执行
+    semantic_cache = get_semantic_cache(get_llm(Config.LLM_TYPE)[1], store)
+    question_vector = None
+    if semantic_cache is not None:
+        try:
+            with span("semantic_cache_lookup") as attrs:
+                question_vector = await semantic_cache.aembed(request.question)
+                cached = await semantic_cache.alookup(request.user_id, question_vector)
+                attrs["hit"] = cached is not None
+            if cached is not None:
+                return AgentResponse(status="completed", result=cached.answer)
+        except Exception as e:
+            # 嵌入模型故障时跳过缓存，正常执行 Agent
+            logger.error(f"语义缓存查询失败: {e}")
 
     # 为本次请求创建独立的 Agent 实例
-    agent = await create_agent_instance()
+    if agent is None:
+        agent = await create_agent_instance()
 
     # 读取该用户的长期记忆内容（例如用户名、偏好等）
     name = await read_long_term_info(request.user_id)
 
-    # 读取用户提示模板文件
-    human_prompt = PromptTemplate.from_file(
-        template_file=Config.HUMAN_PROMPT_TMPL,
-        encoding="utf-8"
-    ).template
-
-    # 构建完整的聊天提示模板（system + human）
-    chat_prompt = ChatPromptTemplate.from_messages([
-        # 系统提示（角色、规则等）
-        ("system", PromptTemplate.from_file(template_file=Config.SYSTEM_PROMPT_TMPL, encoding="utf-8").template),
-        # 用户提示模板
-        ("human", human_prompt)
-    ])
-
-    # 使用模板渲染实际的消息内容（替换占位符）
-    messages = chat_prompt.format_messages(question=request.question, name=name)
+    with span("prompt"):
+        # 从提示词注册表获取预编译的聊天提示模板（system + human）
+        chat_prompt = prompt_registry.get_chat_prompt(Config.SYSTEM_PROMPT_TMPL, Config.HUMAN_PROMPT_TMPL)
+
+        # 使用模板渲染实际的消息内容（替换占位符）
+        messages = chat_prompt.format_messages(question=request.question, name=name)
     # 取出最后一条（即用户消息）
     human_msg = messages[-1]
 
-    # 构造运行时配置（thread_id 和 user_id）
+    # 构造运行时配置（thread_id 和 user_id），并挂载耗时采集回调
     config = {
         "configurable": {
             "thread_id": request.thread_id,
             "user_id": request.user_id,
-        }
+        },
+        "callbacks": [timing_callback]
     }
 
     # 创建上下文对象
@@ -293,15 +480,19 @@ async def ask(request: AskRequest):
         agent=agent,
         user_content=human_msg.content,
         config=config,
-        context=context
+        context=context,
+        message_id=message_id
     )
 
     # 根据执行结果返回不同响应
     if run_result["status"] == "completed":
         # 记录最终回答日志
-        logger.info(f"Agent最终回复是: {run_result['result']}")
+        logger.info("Agent最终回复是: %s", payload(run_result["result"]))
+        # 本轮未触发人工审批（触发时状态为 interrupted），回答可以写入语义缓存
+        if semantic_cache is not None and question_vector is not None:
+            await semantic_cache.astore(request.user_id, request.question, question_vector, run_result["result"], run_result["tools_used"])
         # 直接返回完成结果
-        return AgentResponse(**run_result)
+        return AgentResponse(status="completed", result=run_result["result"])
     else:
         # 需要人工介入，直接返回中断信息
         return AgentResponse(
@@ -310,23 +501,80 @@ async def ask(request: AskRequest):
         )
 
 
-# API 端点：人工提交决策，继续执行被中断的 Agent
+# API 端点：批量提问，按完成顺序以 NDJSON（每行一个 JSON）流式返回每个问题的结果
+@app.post("/ask/batch")
+async def ask_batch(request: BatchAskRequest):
+    logger.info("/ask/batch接口接收批量问题，问题数: %d", len(request.questions))
+    # 同一会话的多个问题并发执行会互相覆盖 checkpoint，要求批量内的 thread_id 互不相同
+    if len({question.thread_id for question in request.questions}) != len(request.questions):
+        raise HTTPException(status_code=400, detail="批量问题中的 thread_id 不能重复")
+    # 批量内所有问题共享一个 Agent 实例（Agent 本身无状态，会话状态保存在 checkpointer 中）
+    agent = await create_agent_instance()
+    # 每个问题的用户不同，运行时上下文不同，因此把单个问题的完整处理流程包装为 Runnable，再用 abatch_as_completed 并发执行
+    # 每个问题与 /ask 一样按各自的用户经过准入控制，批量请求不能绕过 worker 的并发上限与用户间的公平调度
+    async def run_item(item: AskRequest) -> AgentResponse:
+        async with admission_slot(item.user_id):
+            return await handle_ask(item, agent)
+
+    runner = RunnableLambda(run_item, name="ask_batch_item")
+    max_concurrency = min(request.max_concurrency or Config.BATCH_MAX_CONCURRENCY, Config.BATCH_MAX_CONCURRENCY)
+
+    async def result_stream():
+        async for index, output in runner.abatch_as_completed(
+                request.questions, config={"max_concurrency": max_concurrency}, return_exceptions=True):
+            question = request.questions[index]
+            line = {"index": index, "user_id": question.user_id, "thread_id": question.thread_id}
+            if isinstance(output, AdmissionRejected):
+                # 被准入控制拒绝：返回与 /ask 相同的状态码与重试时间，客户端可只重试这些问题
+                logger.warning(f"批量问题被准入控制拒绝，序号: {index} 会话ID: {question.thread_id} 原因: {output.reason}")
+                line.update(status="rejected", status_code=output.status_code, retry_after=output.retry_after, error=output.reason)
+            elif isinstance(output, Exception):
+                logger.error(f"批量问题执行失败，序号: {index} 会话ID: {question.thread_id} 错误: {output}")
+                line.update(status="failed", error=f"{type(output).__name__}: {output}")
+            else:
+                line.update(output.model_dump(exclude_none=True))
+            AGENT_RESULTS.labels("ask_batch", line["status"]).inc()
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+# API 端点：人工提交决策，继续执行被中断的 Agent（经过准入控制）
 @app.post("/intervene", response_model=AgentResponse)
 async def intervene(request: InterveneRequest):
+    async with admission_slot(request.user_id):
+        response = await handle_intervene(request)
+    return with_timings(response, request.debug, "intervene")
+
+
+# 处理 /intervene 请求
+async def handle_intervene(request: InterveneRequest) -> AgentResponse:
+    # 该请求后续的日志都携带用户ID与会话ID
+    bind_log_context(user_id=request.user_id, thread_id=request.thread_id)
     # 请求数据日志
-    logger.info(f"/intervene接口接收人工提交决策并继续执行被中断的 Agent，用户ID： {request.user_id} 会话ID： {request.thread_id} 人工决策反馈数据： {request.decisions}")
+    logger.info("/intervene接口接收人工提交决策并继续执行被中断的 Agent，人工决策反馈数据： %s", payload(request.decisions))
 
     # 为本次恢复创建一个新的 Agent 实例
     agent = await create_agent_instance()
 
-    # 恢复时携带 thread_id 和 user_id（checkpointer 会自动加载历史状态）
+    # 恢复时携带 thread_id 和 user_id（checkpointer 会自动加载历史状态），并挂载耗时采集回调
     config = {
         "configurable": {
             "thread_id": request.thread_id,
             "user_id": request.user_id
-        }
+        },
+        "callbacks": [timing_callback]
     }
 
+    # 人工审核等待时长：从中断时写入的 checkpoint 到收到决策的时间
+    # 额外读取一次 checkpoint，只在耗时明细会被输出（日志或 debug 响应）时执行
+    checkpoint_tuple = None
+    if (Config.TIMING_ENABLED or request.debug) and current_timer() is not None:
+        checkpoint_tuple = await checkpointer.aget_tuple(config)
+    if checkpoint_tuple is not None:
+        interrupted_at = datetime.fromisoformat(checkpoint_tuple.checkpoint["ts"])
+        record("hitl_wait", (datetime.now(timezone.utc) - interrupted_at).total_seconds() * 1000)
+
     # 使用 Command.resume 携带人工决策继续执行
     result = await agent.ainvoke(
         # 恢复执行并传入人工决策
@@ -354,13 +602,303 @@ async def intervene(request: InterveneRequest):
     # 成功完成，取出最终回答
     final_result = result["messages"][-1].content
     # 记录最终回答日志
-    logger.info(f"Agent最终回复是: {final_result}")
+    logger.info("Agent最终回复是: %s", payload(final_result))
 
     # 返回完成结果
     return AgentResponse(status="completed", result=final_result)
 
 
+# API 端点：查询数据库连接池运行指标（等待时间、借出时长、饱和度等）
+@app.get("/pool/stats")
+async def pool_stats() -> Dict[str, Any]:
+    # 返回 checkpointer 与 store 连接池的运行指标
+    return pool_manager.get_stats()
+
+
+# LLM 缓存统计接口：查看精确匹配缓存的命中情况
+@app.get("/llm_cache/stats")
+async def llm_cache_stats() -> Dict[str, Any]:
+    # 缓存未启用时返回 enabled=False
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    # 缓存后端可能是 SQLite/PostgreSQL，统计条目数涉及 IO，放到线程中执行
+    return {"enabled": True, **await asyncio.to_thread(cache.get_stats)}
+
+
+# 模型路由统计接口：查看各服务商的延迟、错误率、熔断状态与对冲情况（LLM_TYPE 为 "router" 时有效）
+@app.get("/router/stats")
+async def router_stats() -> Dict[str, Any]:
+    llm_chat, _ = get_llm(Config.LLM_TYPE)
+    if not isinstance(llm_chat, RoutedChatModel):
+        return {"enabled": False}
+    return {"enabled": True, **llm_chat.get_stats()}
+
+
+# 模型请求限流统计接口：查看各服务商/模型的并发上限、排队与 429 情况
+@app.get("/rate_limits/stats")
+async def rate_limit_stats() -> Dict[str, Any]:
+    return get_rate_limiters().get_stats()
+
+
+# 语义缓存统计接口：查看问答语义缓存的命中情况
+@app.get("/semantic_cache/stats")
+async def semantic_cache_stats() -> Dict[str, Any]:
+    # 缓存未启用时返回 enabled=False
+    cache = get_semantic_cache(get_llm(Config.LLM_TYPE)[1], store)
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
+# 准入控制统计接口：查看当前并发、排队与拒绝情况
+@app.get("/admission/stats")
+async def admission_stats() -> Dict[str, Any]:
+    admission = get_admission_controller()
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission.get_stats()}
+
+
+# 工具调用审批审计接口：查看指定用户最近的审批决策（策略自动决策、命中的规则以及人工审核的结果）
+@app.get("/hitl/audit")
+async def hitl_audit(user_id: str, limit: int = 50) -> Dict[str, Any]:
+    return {"user_id": user_id, "records": await list_audit_records(store, user_id, min(limit, 500))}
+
+
+# 异步任务执行函数：由任务执行 worker 调用，返回结构与 AgentResponse 一致
+async def execute_run(run: Dict[str, Any]) -> Dict[str, Any]:
+    # 后台任务不经过 HTTP 中间件，单独创建计时器并在结束时输出耗时明细；任务ID同时作为请求ID附加到日志
+    timer = RequestTimer()
+    status = "failed"
+    with log_context(request_id=run["run_id"], thread_id=run["thread_id"]):
+        try:
+            with timer.activate():
+                result = await execute_run_steps(run)
+            status = result["status"]
+            return result
+        finally:
+            AGENT_RESULTS.labels(f"runs_{run['kind']}", status).inc()
+            if Config.TIMING_ENABLED:
+                logger.info("任务耗时明细", extra={"fields": {"run_id": run["run_id"], "kind": run["kind"], **timer.to_dict()}})
+
+
+# 执行异步任务的各个步骤
+async def execute_run_steps(run: Dict[str, Any]) -> Dict[str, Any]:
+    run_payload = run["payload"]
+    if run["attempts"] > 1:
+        # 重试（上一次执行失败或进程崩溃）：根据 checkpoint 判断上一次执行是否已经产生进度
+        response = await resume_run(run)
+    elif run["kind"] == "intervene":
+        response = await handle_intervene(InterveneRequest(**run_payload))
+    else:
+        # 首次执行前刷新会话的最新 checkpoint（提交时已记录一次，排在同一会话之前的任务可能已经推进了会话）
+        progress = await checkpoint_progress(checkpointer, run["thread_id"])
+        await run_queue.set_checkpoint(run["run_id"], progress["checkpoint_id"] if progress else None)
+        response = await handle_ask(AskRequest(**run_payload), message_id=run_message_id(run))
+    return response.model_dump()
+
+
+# 异步提问任务写入会话的用户消息 ID：以任务 ID 为前缀，重试时据此判断本次问题是否已经写入会话；
+# 带上执行次数，重新执行时不会与会话中已有的同 ID 消息合并
+def run_message_id(run: Dict[str, Any]) -> str:
+    return f"run-{run['run_id']}-{run['attempts']}"
+
+
+# 重试异步任务：复用 checkpointer 中已保存的进度，不重复执行已经完成的步骤
+async def resume_run(run: Dict[str, Any]) -> AgentResponse:
+    run_payload = run["payload"]
+    progress = await checkpoint_progress(checkpointer, run["thread_id"])
+    current_checkpoint = progress["checkpoint_id"] if progress else ""
+    # 提问任务在上一次执行中未产生任何进度（会话 checkpoint 未变化），或没有记录执行前的 checkpoint（视为没有进度），直接重新执行
+    if run["kind"] == "ask" and (run["checkpoint_id"] is None or current_checkpoint == run["checkpoint_id"]):
+        return await handle_ask(AskRequest(**run_payload), message_id=run_message_id(run))
+
+    agent = await create_agent_instance()
+    config = {"configurable": {"thread_id": run["thread_id"], "user_id": run["user_id"]}, "callbacks": [timing_callback]}
+    context = Context(user_id=run["user_id"])
+    state = await agent.aget_state(config)
+    if run["kind"] == "ask":
+        # checkpoint 变化不一定来自本任务（例如同一会话之前的任务），会话中最新的用户消息不是本次问题时重新执行
+        last_human = next((m for m in reversed(state.values.get("messages", [])) if m.type == "human"), None)
+        if last_human is None or not (last_human.id or "").startswith(f"run-{run['run_id']}-"):
+            logger.info(f"会话中没有本次任务的用户问题，重新执行任务，任务ID: {run['run_id']}")
+            return await handle_ask(AskRequest(**run_payload), agent, message_id=run_message_id(run))
+    if state.interrupts:
+        # 人工决策任务的决策尚未生效，重新提交决策
+        if run["kind"] == "intervene":
+            return await handle_intervene(InterveneRequest(**run_payload))
+        # 提问任务已经执行到人工审核节点
+        return AgentResponse(
+            status="interrupted",
+            interrupt_details={
+                "action_requests": state.interrupts[0].value["action_requests"],
+                "review_configs": state.interrupts[0].value["review_configs"]
+            }
+        )
+    if state.next:
+        # 从最新的 checkpoint 继续执行未完成的步骤
+        logger.info(f"从 checkpoint 继续执行任务，任务ID: {run['run_id']} 待执行节点: {state.next}")
+        result = await agent.ainvoke(None, config=config, context=context)
+        if "__interrupt__" in result:
+            hitl_req = result["__interrupt__"][0]
+            return AgentResponse(
+                status="interrupted",
+                interrupt_details={
+                    "action_requests": hitl_req.value["action_requests"],
+                    "review_configs": hitl_req.value["review_configs"]
+                }
+            )
+        return AgentResponse(status="completed", result=result["messages"][-1].content)
+    # 上一次执行已经完成，只是结果未写回任务表
+    return AgentResponse(status="completed", result=state.values["messages"][-1].content)
+
+
+# 把任务记录转换为响应模型
+def to_run_info(run: Dict[str, Any]) -> RunInfo:
+    return RunInfo(**{field: run[field] for field in RunInfo.model_fields})
+
+
+# API 端点：提交异步提问任务，立即返回任务 ID
+@app.post("/runs", response_model=RunCreated)
+async def create_run(request: AskRequest):
+    # 提交时记录会话的最新 checkpoint，执行前进程崩溃时重试也能判断会话是否已有进度
+    progress = await checkpoint_progress(checkpointer, request.thread_id)
+    run_id = await run_queue.enqueue("ask", request.user_id, request.thread_id, request.model_dump(),
+                                     checkpoint_id=progress["checkpoint_id"] if progress else None)
+    logger.info(f"/runs接口提交异步任务，任务ID: {run_id} 用户ID: {request.user_id} 会话ID: {request.thread_id}")
+    # 唤醒本进程的空闲 worker，其他进程在下一次轮询时领取
+    if run_workers is not None:
+        run_workers.notify()
+    return RunCreated(run_id=run_id, status="queued")
+
+
+# API 端点：提交异步人工决策任务（对应任务状态为 interrupted 时）
+@app.post("/runs/intervene", response_model=RunCreated)
+async def create_intervene_run(request: InterveneRequest):
+    run_id = await run_queue.enqueue("intervene", request.user_id, request.thread_id, request.model_dump())
+    logger.info(f"/runs/intervene接口提交异步任务，任务ID: {run_id} 用户ID: {request.user_id} 会话ID: {request.thread_id}")
+    if run_workers is not None:
+        run_workers.notify()
+    return RunCreated(run_id=run_id, status="queued")
+
+
+# 异步任务统计接口：查看各状态的任务数与本进程 worker 的执行情况
+@app.get("/runs/stats")
+async def run_stats() -> Dict[str, Any]:
+    return {
+        "queue": await run_queue.get_stats(),
+        "workers": run_workers.get_stats() if run_workers is not None else {"enabled": False},
+    }
+
+
+# API 端点：查询异步任务的状态与结果
+@app.get("/runs/{run_id}", response_model=RunInfo)
+async def get_run(run_id: str):
+    run = await run_queue.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return to_run_info(run)
+
+
+# API 端点：以 SSE（text/event-stream）订阅异步任务的状态变化与执行进度，任务结束后推送结果并关闭
+@app.get("/runs/{run_id}/events")
+async def run_events(run_id: str):
+    if await run_queue.get(run_id) is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def event_stream():
+        last_status, last_checkpoint = None, None
+        while True:
+            run = await run_queue.get(run_id)
+            if run["status"] != last_status:
+                last_status = run["status"]
+                yield f"event: status\ndata: {json.dumps({'status': last_status, 'attempts': run['attempts']}, ensure_ascii=False)}\n\n"
+            if last_status == "running":
+                # 执行进度直接读取 checkpointer 中的最新 checkpoint
+                progress = await checkpoint_progress(checkpointer, run["thread_id"])
+                if progress is not None and progress["checkpoint_id"] != last_checkpoint:
+                    last_checkpoint = progress["checkpoint_id"]
+                    yield f"event: progress\ndata: {json.dumps(progress, ensure_ascii=False)}\n\n"
+            if last_status in TERMINAL_STATUSES:
+                yield f"event: result\ndata: {to_run_info(run).model_dump_json()}\n\n"
+                return
+            await asyncio.sleep(Config.RUN_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+# 日志统计接口：查看日志队列的积压条数与因队列已满被丢弃的日志条数
+@app.get("/logging/stats")
+async def logging_stats() -> Dict[str, Any]:
+    return LoggerManager.get_stats()
+
+
+# 请求剖析列表接口：列出已保存的剖析（最新的在前）
+@app.get("/profiles")
+async def list_profiles() -> Dict[str, Any]:
+    profiler = get_profiler()
+    if profiler is None:
+        return {"enabled": False}
+    return {"enabled": True, "profiles": await asyncio.to_thread(profiler.list_profiles)}
+
+
+# 请求剖析下载接口：format=speedscope 返回 speedscope 文件（可在 https://www.speedscope.app 打开），format=pstats 返回 pstats 文件
+@app.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: str = "speedscope"):
+    profiler = get_profiler()
+    if format not in ("speedscope", "pstats"):
+        raise HTTPException(status_code=400, detail="format 只能为 speedscope 或 pstats")
+    path = profiler.profile_path(profile_id, format) if profiler is not None else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="剖析不存在")
+    return FileResponse(path, filename=os.path.basename(path),
+                        media_type="application/json" if format == "speedscope" else "application/octet-stream")
+
+
+# 后台协程：定时把连接池统计写入 Prometheus 指标，不在请求路径上读取连接池状态
+async def refresh_pool_metrics() -> None:
+    while True:
+        if pool_manager is not None:
+            update_pool_metrics(pool_manager.get_stats())
+        await asyncio.sleep(Config.METRICS_POOL_INTERVAL)
+
+
+# Prometheus 指标接口：多 worker 部署时汇总全部 worker 进程的指标
+@app.get("/metrics")
+async def metrics() -> Response:
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+# 存活检查接口：进程能处理请求即返回 200，不检查外部依赖
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    return {"status": "ok", "pid": os.getpid()}
+
+
+# 就绪检查接口：PostgreSQL 与 MCP Server 均可用时返回 200，否则返回 503，供负载均衡/编排系统判断是否转发流量
+@app.get("/ready")
+async def ready():
+    result = await check_readiness(pool_manager)
+    result["pid"] = os.getpid()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
+
+
 # 主程序入口：使用 uvicorn 启动 FastAPI 服务
 if __name__ == "__main__":
-    # 启动服务
-    uvicorn.run(app, host=Config.API_SERVER_HOST, port=Config.API_SERVER_PORT)
\ No newline at end of file
+    # 解析启动参数
+    parser = argparse.ArgumentParser(description="启动 Agent API 服务")
+    parser.add_argument("--workers", type=int, default=Config.API_WORKERS, help="worker 进程数（默认读取 WEB_CONCURRENCY）")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # worker 子进程会重新导入配置，通过 WEB_CONCURRENCY 传递 worker 数，使各进程按 worker 数计算连接池与限流配额
+        os.environ["WEB_CONCURRENCY"] = str(args.workers)
+        # 启用 Prometheus 多进程模式：worker 子进程继承环境变量，把指标写入共享目录，由 /metrics 汇总
+        prepare_multiprocess_dir(Config.METRICS_MULTIPROC_DIR)
+        # 多进程模式需要以导入字符串的形式传入应用，每个 worker 独立执行 lifespan 初始化
+        uvicorn.run("agent_api:app", host=Config.API_SERVER_HOST, port=Config.API_SERVER_PORT, workers=args.workers)
+    else:
+        # 单进程模式
+        uvicorn.run(app, host=Config.API_SERVER_HOST, port=Config.API_SERVER_PORT)
\ No newline at end of file
@@ -0,0 +1,45 @@
+# 导入 os 模块，用于读取环境变量
+import os
+# 导入项目自定义配置模块，读取服务地址与 worker 数
+from utils.config import Config
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# gunicorn 多 worker 部署配置，启动命令：gunicorn -c gunicorn.conf.py agent_api:app
+# worker 数通过 WEB_CONCURRENCY 配置（gunicorn 与 utils/config.py 读取同一个环境变量，连接池与限流配额据此按进程折算）
+
+# Prometheus 多进程模式：必须在 worker 导入 prometheus_client 之前设置，worker 进程继承该环境变量
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", Config.METRICS_MULTIPROC_DIR)
+
+# 监听地址
+bind = f"{Config.API_SERVER_HOST}:{Config.API_SERVER_PORT}"
+# worker 进程数
+workers = Config.API_WORKERS
+# 使用 uvicorn 的 worker，每个 worker 运行独立的事件循环并执行 FastAPI 的 lifespan
+worker_class = "uvicorn.workers.UvicornWorker"
+# 不预加载应用：连接池、HTTP 客户端、模型实例等在各 worker 内部创建，避免 fork 后共享连接
+preload_app = False
+# 单次请求的超时时间（秒），Agent 多轮工具调用耗时较长，需大于最慢请求的耗时
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+# 优雅退出的等待时间（秒），给正在执行的请求留出完成时间
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+# 长连接保持时间（秒）
+keepalive = 5
+# 每个 worker 处理的最大请求数，超过后自动重启以回收内存（加随机抖动，避免所有 worker 同时重启）
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+
+# master 启动时清空上次运行遗留的指标文件
+def on_starting(server):
+    from utils.metrics import prepare_multiprocess_dir
+    prepare_multiprocess_dir(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+# worker 退出后清理其实时指标（处理中请求数、连接池连接数），避免已退出进程的数值继续计入汇总
+def child_exit(server, worker):
+    from utils.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
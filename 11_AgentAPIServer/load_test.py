@@ -0,0 +1,300 @@
+# 导入 asyncio，用于并发发起大量会话
+import asyncio
+# 导入 argparse 模块，用于解析命令行参数
+import argparse
+# 导入 json 模块，用于读取问题集与保存压测结果
+import json
+# 导入 random 模块，用于随机选择问题、用户与人工决策
+import random
+# 导入 time 模块，用于统计延迟与吞吐
+import time
+# 导入 uuid 模块，用于区分不同压测批次的会话 ID
+import uuid
+# 导入 dataclass，用于记录单次请求的结果
+from dataclasses import dataclass, field
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, List, Optional
+# 导入 httpx，使用异步客户端发起请求
+import httpx
+# 导入项目自定义配置模块，读取 API 服务地址
+from utils.config import Config
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 默认问题集：覆盖天气（多轮工具调用）、文章检索（MCP 工具）与闲聊（无工具调用）三类路径
+DEFAULT_QUESTIONS = [
+    "我这边的天气怎么样？",
+    "北京的天气怎么样？",
+    "外面的天气怎么样？",
+    "搜索关于多模态大模型持续学习系列研究的文章",
+    "检索一下新智元发布的文章",
+    "给我讲个笑话",
+    "你好，你是谁？",
+]
+
+
+# 使用 @dataclass 记录单次 HTTP 请求的结果
+@dataclass
+class RequestRecord:
+    # 接口名称（/ask 或 /intervene）
+    endpoint: str
+    # 请求总耗时（秒）；开环模式下会话的首个请求从计划到达时间开始计时
+    latency: float
+    # 收到响应头的耗时（秒）；/ask 与 /intervene 一次性返回完整 JSON，不代表首 token 时间
+    header_latency: float
+    # HTTP 状态码，网络异常时为 None
+    status_code: Optional[int]
+    # 业务状态（completed / interrupted）
+    status: Optional[str] = None
+    # 异常类型
+    error: Optional[str] = None
+
+
+# 使用 @dataclass 记录一次完整会话（/ask + 若干轮 /intervene）的结果
+@dataclass
+class SessionRecord:
+    # 会话端到端耗时（秒）；开环模式下从计划到达时间开始计时
+    latency: float
+    # 人工介入轮数
+    interventions: int
+    # 是否最终完成
+    completed: bool
+    # 会话内的请求记录
+    requests: List[RequestRecord] = field(default_factory=list)
+    # 开环模式下从计划到达到实际发出请求的客户端等待时间（秒），等待并发名额或空闲会话时增大
+    client_wait: float = 0.0
+
+
+# 计算分位数（数据为空时返回 None）
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# 把秒转换为保留两位小数的毫秒
+def ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
+
+
+# 定义压测器
+class LoadTester:
+    """
+    Agent API 压测器：
+
+      - 每个会话先调用 /ask，出现人工介入时按策略自动生成决策并调用 /intervene，直到完成或达到最大轮数
+      - 会话在 users × threads_per_user 个 (user_id, thread_id) 中轮转，同一 thread_id 同一时间只被一个会话使用
+      - 支持固定 RPS（开环，按到达率发起会话）与固定并发（闭环）两种模式
+      - 开环模式的延迟从会话的计划到达时间开始计算，客户端排队的时间也计入延迟，避免协调遗漏（coordinated omission）
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        # 本次压测批次 ID，避免与历史会话的 checkpoint 混在一起
+        self.run_id = uuid.uuid4().hex[:8]
+        # 问题集
+        self.questions = DEFAULT_QUESTIONS
+        if args.questions:
+            with open(args.questions, encoding="utf-8") as f:
+                self.questions = json.load(f)
+        # 空闲的 (user_id, thread_id) 队列
+        self.free_threads: asyncio.Queue = asyncio.Queue()
+        for u in range(args.users):
+            for t in range(args.threads_per_user):
+                self.free_threads.put_nowait((f"lt_user_{u:04d}", f"lt_{self.run_id}_{u:04d}_{t:02d}"))
+        # 固定种子，保证问题与决策序列可复现
+        self.rng = random.Random(args.seed)
+        # 会话结果
+        self.sessions: List[SessionRecord] = []
+
+    def decide(self, interrupt_details: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """按策略为每个待审核的工具调用生成决策"""
+        decisions = []
+        for action in interrupt_details.get("action_requests", []):
+            policy = self.args.decision
+            if policy == "mix":
+                policy = self.rng.choices(["approve", "reject", "edit"], weights=[0.8, 0.1, 0.1])[0]
+            if policy == "reject":
+                decisions.append({"type": "reject", "message": "压测脚本自动拒绝"})
+            elif policy == "edit":
+                decisions.append({"type": "edit", "edited_action": {"name": action["name"], "args": action.get("args", {})}})
+            else:
+                decisions.append({"type": "approve"})
+        return decisions
+
+    async def post(self, client: httpx.AsyncClient, endpoint: str, payload: Dict[str, Any],
+                   start: Optional[float] = None) -> tuple[RequestRecord, Optional[Dict[str, Any]]]:
+        """发送一次请求，分别记录收到响应头的时间与总耗时；start 为计时起点（默认为发出请求的时间）"""
+        if start is None:
+            start = time.perf_counter()
+        header_latency = None
+        try:
+            async with client.stream("POST", endpoint, json=payload) as response:
+                header_latency = time.perf_counter() - start
+                body = await response.aread()
+            latency = time.perf_counter() - start
+            if response.status_code != 200:
+                return RequestRecord(endpoint, latency, header_latency, response.status_code, error=f"HTTP {response.status_code}"), None
+            data = json.loads(body)
+            return RequestRecord(endpoint, latency, header_latency, 200, status=data.get("status")), data
+        except Exception as e:
+            latency = time.perf_counter() - start
+            return RequestRecord(endpoint, latency, header_latency or latency, None, error=type(e).__name__), None
+
+    async def run_session(self, client: httpx.AsyncClient, scheduled: Optional[float] = None) -> None:
+        """执行一次完整会话；scheduled 为开环模式下会话的计划到达时间，延迟从该时间开始计算"""
+        user_id, thread_id = await self.free_threads.get()
+        start = scheduled if scheduled is not None else time.perf_counter()
+        client_wait = time.perf_counter() - start
+        records = []
+        interventions = 0
+        completed = False
+        try:
+            question = self.rng.choice(self.questions)
+            record, data = await self.post(client, "/ask", {"user_id": user_id, "thread_id": thread_id, "question": question}, start=start)
+            records.append(record)
+            # 自动处理多轮人工介入
+            while data and data.get("status") == "interrupted" and interventions < self.args.max_interventions:
+                interventions += 1
+                decisions = self.decide(data.get("interrupt_details") or {})
+                record, data = await self.post(client, "/intervene", {"user_id": user_id, "thread_id": thread_id, "decisions": decisions})
+                records.append(record)
+            completed = bool(data) and data.get("status") == "completed"
+        finally:
+            self.free_threads.put_nowait((user_id, thread_id))
+            self.sessions.append(SessionRecord(time.perf_counter() - start, interventions, completed, records, client_wait))
+
+    async def run(self) -> Dict[str, Any]:
+        """按配置的模式执行压测并返回报告"""
+        limits = httpx.Limits(max_connections=self.args.max_in_flight, max_keepalive_connections=self.args.max_in_flight)
+        async with httpx.AsyncClient(base_url=self.args.base_url, timeout=self.args.timeout, limits=limits) as client:
+            # 预热：顺序执行若干会话，不计入结果（建立连接、加载模板、初始化模型实例）
+            for _ in range(self.args.warmup):
+                await self.run_session(client)
+            self.sessions.clear()
+
+            start = time.perf_counter()
+            deadline = start + self.args.duration
+            if self.args.rps:
+                # 开环模式：按泊松到达发起会话，不等待前一个会话完成
+                tasks = set()
+                # 限制同时进行的会话数，防止服务端变慢时客户端无限堆积（等待名额的时间计入延迟）
+                semaphore = asyncio.Semaphore(self.args.max_in_flight)
+
+                async def guarded(scheduled: float):
+                    async with semaphore:
+                        await self.run_session(client, scheduled)
+
+                # 到达时间按累计间隔预先排定，不受事件循环调度延迟的影响
+                scheduled = start
+                while scheduled < deadline:
+                    await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                    task = asyncio.create_task(guarded(scheduled))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    scheduled += self.rng.expovariate(self.args.rps)
+                await asyncio.gather(*tasks)
+            else:
+                # 闭环模式：固定数量的虚拟用户循环执行会话
+                async def worker():
+                    while time.perf_counter() < deadline:
+                        await self.run_session(client)
+
+                await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+            elapsed = time.perf_counter() - start
+
+            # 采集服务端的运行指标快照
+            server_stats = {}
+            for path in ("/pool/stats", "/rate_limits/stats", "/llm_cache/stats", "/semantic_cache/stats", "/router/stats"):
+                try:
+                    response = await client.get(path)
+                    if response.status_code == 200:
+                        server_stats[path] = response.json()
+                except Exception:
+                    pass
+        return self.report(elapsed, server_stats)
+
+    def report(self, elapsed: float, server_stats: Dict[str, Any]) -> Dict[str, Any]:
+        """汇总吞吐、延迟分位数、响应头时间与错误率"""
+        requests = [r for s in self.sessions for r in s.requests]
+        endpoints = {}
+        for endpoint in sorted({r.endpoint for r in requests}):
+            items = [r for r in requests if r.endpoint == endpoint]
+            ok = [r for r in items if r.error is None]
+            errors: Dict[str, int] = {}
+            for r in items:
+                if r.error:
+                    errors[r.error] = errors.get(r.error, 0) + 1
+            endpoints[endpoint] = {
+                "count": len(items),
+                "throughput_rps": round(len(items) / elapsed, 2),
+                "error_rate": round(1 - len(ok) / len(items), 4),
+                "errors": errors,
+                "latency_ms": {f"p{int(q * 100)}": ms(percentile([r.latency for r in ok], q)) for q in (0.5, 0.95, 0.99)},
+                "header_latency_ms": {f"p{int(q * 100)}": ms(percentile([r.header_latency for r in ok], q)) for q in (0.5, 0.95, 0.99)},
+            }
+        completed = [s for s in self.sessions if s.completed]
+        return {
+            "config": {k: v for k, v in vars(self.args).items()},
+            "duration_s": round(elapsed, 2),
+            "sessions": {
+                "count": len(self.sessions),
+                "completed": len(completed),
+                "throughput_per_s": round(len(self.sessions) / elapsed, 2) if elapsed else 0.0,
+                "avg_interventions": round(sum(s.interventions for s in self.sessions) / len(self.sessions), 2) if self.sessions else 0.0,
+                "latency_ms": {f"p{int(q * 100)}": ms(percentile([s.latency for s in completed], q)) for q in (0.5, 0.95, 0.99)},
+                "client_wait_ms": {f"p{int(q * 100)}": ms(percentile([s.client_wait for s in self.sessions], q)) for q in (0.5, 0.95, 0.99)},
+            },
+            "endpoints": endpoints,
+            "server_stats": server_stats,
+        }
+
+
+# 以表格形式打印压测报告
+def print_report(report: Dict[str, Any]) -> None:
+    print("=" * 90)
+    sessions = report["sessions"]
+    print(f"压测时长: {report['duration_s']} 秒  会话数: {sessions['count']}  完成: {sessions['completed']}  "
+          f"会话吞吐: {sessions['throughput_per_s']}/s  平均人工介入轮数: {sessions['avg_interventions']}")
+    print(f"会话端到端延迟(ms): {sessions['latency_ms']}  客户端等待(ms): {sessions['client_wait_ms']}")
+    print("-" * 90)
+    print(f"{'接口':<12}{'请求数':>8}{'RPS':>8}{'错误率':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'响应头 p50':>11}{'响应头 p95':>11}")
+    for endpoint, stats in report["endpoints"].items():
+        latency, header = stats["latency_ms"], stats["header_latency_ms"]
+        print(f"{endpoint:<12}{stats['count']:>8}{stats['throughput_rps']:>8}{stats['error_rate']:>8}"
+              f"{str(latency['p50']):>10}{str(latency['p95']):>10}{str(latency['p99']):>10}{str(header['p50']):>11}{str(header['p95']):>11}")
+        if stats["errors"]:
+            print(f"{'':<12}错误分布: {stats['errors']}")
+    print("=" * 90)
+
+
+# 主程序入口
+if __name__ == "__main__":
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description="Agent API 压测工具（建议配合 LLM_TYPE=mock 与本地 Postgres/Milvus 使用）")
+    parser.add_argument("--base-url", default=Config.API_BASE_URL, help="API 服务地址")
+    parser.add_argument("--rps", type=float, default=0, help="开环模式：每秒发起的会话数（设置后忽略 --concurrency）")
+    parser.add_argument("--concurrency", type=int, default=10, help="闭环模式：并发虚拟用户数")
+    parser.add_argument("--duration", type=float, default=60, help="压测时长（秒）")
+    parser.add_argument("--warmup", type=int, default=3, help="预热会话数（不计入结果）")
+    parser.add_argument("--users", type=int, default=50, help="user_id 数量")
+    parser.add_argument("--threads-per-user", type=int, default=4, help="每个用户的 thread_id 数量")
+    parser.add_argument("--decision", choices=["approve", "reject", "edit", "mix"], default="approve", help="人工介入的自动决策策略")
+    parser.add_argument("--max-interventions", type=int, default=5, help="每个会话最多的人工介入轮数")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="最多同时进行的会话数（同时也是连接池大小）")
+    parser.add_argument("--timeout", type=float, default=120, help="单次请求超时时间（秒）")
+    parser.add_argument("--questions", default=None, help="问题集 JSON 文件（字符串列表）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", default=None, help="压测报告 JSON 保存路径，用于前后版本对比")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTester(args).run())
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"压测报告已保存到 {args.output}")
@@ -14,6 +14,8 @@ from utils.config import Config
 from utils.llms import get_llm
 # 导入日志管理器模块
 from utils.logger import LoggerManager
+# 导入限流优先级设置，数据入库的向量化请求作为后台请求，让行给在线的交互请求
+from utils.rate_limiter import set_default_priority, BACKGROUND
 
 
 
@@ -509,6 +511,9 @@ class MilvusDataInserter:
 # 主程序执行
 # 判断是否为主程序运行（而非被导入）
 if __name__ == "__main__":
+    # 本脚本发起的模型请求均为后台请求
+    set_default_priority(BACKGROUND)
+
     # 实例化插入管理器
     # 创建MilvusDataInserter实例，指定URI和数据库名称
     inserter = MilvusDataInserter(
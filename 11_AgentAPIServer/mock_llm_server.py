@@ -0,0 +1,326 @@
+# 导入 asyncio，用于模拟首 token 延迟与逐 token 输出
+import asyncio
+# 导入 argparse 模块，用于解析命令行参数
+import argparse
+# 导入 hashlib，用于根据文本生成确定性的嵌入向量
+import hashlib
+# 导入 json 模块，用于读取轨迹脚本与序列化流式数据
+import json
+# 导入 math 模块，用于嵌入向量归一化与对数正态分布
+import math
+# 导入 os 模块，用于读取环境变量中的运行参数（通过 uvicorn mock_llm_server:app 启动时使用）
+import os
+# 导入 random 模块，用于按分布采样延迟与注入错误
+import random
+# 导入正则模块，用于把回答切分成 token
+import re
+# 导入 time 模块，用于生成响应时间戳
+import time
+# 导入 uuid 模块，用于生成响应 ID 与工具调用 ID
+import uuid
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, AsyncIterator, Dict, List, Optional
+# 导入 uvicorn，用于运行 FastAPI 服务
+import uvicorn
+# 导入 FastAPI 及请求、响应类型
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+# 导入日志管理器模块
+from utils.logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志记录器
+logger = LoggerManager.get_logger()
+
+# 内置的工具调用轨迹脚本：按用户问题中的关键词匹配规则，规则中的 steps 依次为每一轮模型调用的输出
+# - {"tool": 工具名, "args": 参数}：发起工具调用（参数中的 {question} 会替换为用户问题）
+# - {"content": 文本}：给出最终回答
+DEFAULT_SCRIPT = {
+    # 没有匹配到任何规则时的回答
+    "default_reply": "这是来自本地模拟模型服务的回答。",
+    # 需要结构化输出（tool_choice 为 required）时调用的工具名称
+    "structured_tool": "ResponseFormat",
+    "rules": [
+        {
+            "match": ["天气"],
+            "steps": [
+                {"tool": "get_user_location", "args": {}},
+                {"tool": "get_weather_for_location", "args": {"city": "上海"}},
+                {"content": "上海今天是晴天，适合出门晒晒“太阳能”。"}
+            ]
+        },
+        {
+            "match": ["文章", "搜索", "检索"],
+            "steps": [
+                {"tool": "search_documents", "args": {"query_text": "{question}"}},
+                {"content": "根据检索到的文章，相关研究主要集中在多模态大模型的持续学习方向。"}
+            ]
+        }
+    ]
+}
+
+
+# 定义延迟分布：fixed（固定值）、uniform（均匀分布）、lognormal（对数正态分布，更接近真实服务的长尾）
+class LatencyModel:
+
+    def __init__(self, dist: str, median: float, sigma: float, rng: random.Random):
+        # 分布类型
+        self.dist = dist
+        # 中位数（秒），uniform 分布时取值范围为 [0, 2 * median]
+        self.median = median
+        # 对数正态分布的形状参数，越大长尾越明显
+        self.sigma = sigma
+        # 带种子的随机数生成器，保证多次压测的延迟序列可复现
+        self.rng = rng
+
+    def sample(self) -> float:
+        if self.dist == "uniform":
+            return self.rng.uniform(0, 2 * self.median)
+        if self.dist == "lognormal":
+            return self.median * math.exp(self.sigma * self.rng.gauss(0, 1))
+        return self.median
+
+
+# 定义模拟模型服务的运行参数
+class MockSettings:
+
+    def __init__(self, args: argparse.Namespace):
+        rng = random.Random(args.seed)
+        # 首 token 延迟分布
+        self.ttft = LatencyModel(args.ttft_dist, args.ttft_median, args.ttft_sigma, rng)
+        # 每秒输出的 token 数，0 表示不模拟输出耗时
+        self.tokens_per_sec = args.tokens_per_sec
+        # 嵌入接口延迟分布
+        self.embed_latency = LatencyModel(args.ttft_dist, args.embed_median, args.ttft_sigma, rng)
+        # 嵌入向量维度
+        self.embedding_dim = args.embedding_dim
+        # 返回 429 与 500 的概率，用于验证限流与重试逻辑
+        self.rate_limit_prob = args.rate_limit_prob
+        self.error_prob = args.error_prob
+        # 返回 429 时携带的 Retry-After（秒）
+        self.retry_after = args.retry_after
+        # 工具调用轨迹脚本
+        self.script = DEFAULT_SCRIPT
+        if args.script:
+            with open(args.script, encoding="utf-8") as f:
+                self.script = json.load(f)
+        self.rng = rng
+
+
+# 构建命令行参数解析器：除监听地址与端口外，各参数的默认值可通过 MOCK_ 前缀的环境变量设置（如 MOCK_TTFT_MEDIAN）
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟模型服务（llm_type=\"mock\"）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8300, help="监听端口")
+    parser.add_argument("--ttft-dist", choices=["fixed", "uniform", "lognormal"], default=os.getenv("MOCK_TTFT_DIST", "lognormal"), help="首 token 延迟分布")
+    parser.add_argument("--ttft-median", type=float, default=float(os.getenv("MOCK_TTFT_MEDIAN", 0.3)), help="首 token 延迟中位数（秒）")
+    parser.add_argument("--ttft-sigma", type=float, default=float(os.getenv("MOCK_TTFT_SIGMA", 0.5)), help="对数正态分布的形状参数")
+    parser.add_argument("--tokens-per-sec", type=float, default=float(os.getenv("MOCK_TOKENS_PER_SEC", 50)), help="每秒输出的 token 数，0 表示不模拟输出耗时")
+    parser.add_argument("--embed-median", type=float, default=float(os.getenv("MOCK_EMBED_MEDIAN", 0.05)), help="嵌入接口延迟中位数（秒）")
+    parser.add_argument("--embedding-dim", type=int, default=int(os.getenv("MOCK_EMBEDDING_DIM", 1536)), help="嵌入向量维度（与 Milvus 集合的 dim 保持一致）")
+    parser.add_argument("--rate-limit-prob", type=float, default=float(os.getenv("MOCK_RATE_LIMIT_PROB", 0.0)), help="返回 429 的概率")
+    parser.add_argument("--error-prob", type=float, default=float(os.getenv("MOCK_ERROR_PROB", 0.0)), help="返回 500 的概率")
+    parser.add_argument("--retry-after", type=float, default=float(os.getenv("MOCK_RETRY_AFTER", 1.0)), help="429 响应中的 Retry-After（秒）")
+    parser.add_argument("--script", default=os.getenv("MOCK_SCRIPT"), help="工具调用轨迹脚本（JSON），格式同 DEFAULT_SCRIPT")
+    parser.add_argument("--seed", type=int, default=int(os.getenv("MOCK_SEED", 42)), help="随机种子，保证延迟与错误注入序列可复现")
+    return parser
+
+
+# 创建 FastAPI 应用实例
+app = FastAPI(title="Mock OpenAI-compatible LLM Server", description="本地模拟模型服务，用于离线压测(南哥AGI研习社)")
+# 运行参数：导入时按环境变量构建默认值，通过 uvicorn mock_llm_server:app 或多 worker 启动时同样可用；直接运行脚本时由命令行参数覆盖
+settings: MockSettings = MockSettings(build_parser().parse_args([]))
+
+
+# 把文本切分成 token：中文按字，英文按单词，其余按单个符号
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[一-鿿]|[A-Za-z0-9]+|\s+|[^\sA-Za-z0-9一-鿿]", text)
+
+
+# 粗略估算输入 token 数
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(tokenize(json.dumps(m.get("content") or "", ensure_ascii=False))) for m in messages)
+
+
+# 读取消息的文本内容（兼容多模态内容块）
+def message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content
+
+
+# 按轨迹脚本决定本轮输出：返回 ("tool", 工具名, 参数) 或 ("content", 文本)
+def plan_step(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], tool_choice: Any) -> tuple:
+    script = settings.script
+    # 最后一条用户消息及其之后已经发起的工具调用轮数
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    question = message_text(messages[last_user]) if last_user >= 0 else ""
+    step_index = sum(1 for m in messages[last_user + 1:] if m.get("role") == "assistant" and m.get("tool_calls"))
+    tool_names = {t.get("function", {}).get("name") for t in tools}
+
+    # 按关键词匹配规则
+    rule = next((r for r in script.get("rules", []) if any(k in question for k in r["match"])), None)
+    steps = rule["steps"] if rule else [{"content": script.get("default_reply", "")}]
+    # 跳过请求中未提供的工具（例如 rag_mcp 的过滤表达式生成请求不带工具）
+    available = [s for s in steps if "content" in s or s.get("tool") in tool_names]
+    step = available[min(step_index, len(available) - 1)] if available else {"content": script.get("default_reply", "")}
+    if "tool" in step:
+        args = json.loads(json.dumps(step.get("args", {}), ensure_ascii=False).replace("{question}", json.dumps(question, ensure_ascii=False)[1:-1]))
+        return "tool", step["tool"], args
+
+    # 要求必须调用工具（结构化输出）时，把最终回答填入结构化输出工具的字符串参数
+    content = step["content"]
+    forced = tool_choice.get("function", {}).get("name") if isinstance(tool_choice, dict) else None
+    if forced or tool_choice in ("required", "any"):
+        name = forced or script.get("structured_tool")
+        tool = next((t["function"] for t in tools if t.get("function", {}).get("name") == name), None)
+        if tool is not None:
+            properties = tool.get("parameters", {}).get("properties", {})
+            required = tool.get("parameters", {}).get("required", list(properties))
+            args = {key: content for key in required if properties.get(key, {}).get("type", "string") == "string"}
+            return "tool", name, args
+    return "content", content
+
+
+# 注入 429 / 500 错误，返回 None 表示正常处理
+def injected_error() -> Optional[JSONResponse]:
+    roll = settings.rng.random()
+    if roll < settings.rate_limit_prob:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(settings.retry_after)},
+            content={"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}}
+        )
+    if roll < settings.rate_limit_prob + settings.error_prob:
+        return JSONResponse(status_code=500, content={"error": {"message": "Internal error (mock)", "type": "server_error"}})
+    return None
+
+
+# 接口：对话补全（支持流式与非流式、工具调用）
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = injected_error()
+    if error is not None:
+        return error
+
+    messages = body.get("messages", [])
+    model = body.get("model", "mock-chat")
+    kind, *payload = plan_step(messages, body.get("tools") or [], body.get("tool_choice"))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    prompt_tokens = estimate_prompt_tokens(messages)
+
+    # 构造本轮输出：工具调用或文本回答
+    if kind == "tool":
+        name, args = payload
+        arguments = json.dumps(args, ensure_ascii=False)
+        tool_call = {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function", "function": {"name": name, "arguments": arguments}}
+        tokens = tokenize(arguments)
+        message = {"role": "assistant", "content": None, "tool_calls": [tool_call]}
+        finish_reason = "tool_calls"
+    else:
+        tokens = tokenize(payload[0])
+        message = {"role": "assistant", "content": payload[0]}
+        finish_reason = "stop"
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+    # 每个 token 的输出间隔
+    per_token = 1 / settings.tokens_per_sec if settings.tokens_per_sec > 0 else 0
+
+    # 非流式：等待首 token 延迟 + 全部 token 输出时间后一次性返回
+    if not body.get("stream"):
+        await asyncio.sleep(settings.ttft.sample() + per_token * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    # 流式：首 token 延迟后按 tokens/sec 逐块输出（SSE）
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def event_stream() -> AsyncIterator[str]:
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        await asyncio.sleep(settings.ttft.sample())
+        if kind == "tool":
+            # 先输出工具调用的名称与 ID，再逐块输出参数
+            call = message["tool_calls"][0]
+            yield chunk({"role": "assistant", "content": None, "tool_calls": [
+                {"index": 0, "id": call["id"], "type": "function", "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            for token in tokens:
+                await asyncio.sleep(per_token)
+                yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": token}}]})
+        else:
+            yield chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                await asyncio.sleep(per_token)
+                yield chunk({"content": token})
+        yield chunk({}, finish_reason)
+        if include_usage:
+            yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+# 根据文本生成确定性的单位向量：相同文本得到相同向量，便于复现检索结果
+def embed_text(item: Any, dim: int) -> List[float]:
+    # OpenAIEmbeddings 默认会先分词再发送 token ID 列表
+    key = json.dumps(item, ensure_ascii=False) if not isinstance(item, str) else item
+    rng = random.Random(hashlib.sha256(key.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+# 接口：文本向量化
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    error = injected_error()
+    if error is not None:
+        return error
+    inputs = body.get("input", [])
+    # 单条输入统一为列表（token ID 列表本身也是一条输入）
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    dim = body.get("dimensions") or settings.embedding_dim
+    await asyncio.sleep(settings.embed_latency.sample())
+    prompt_tokens = sum(len(item) if isinstance(item, list) else len(tokenize(item)) for item in inputs)
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": embed_text(item, dim)} for i, item in enumerate(inputs)],
+        "model": body.get("model", "mock-embedding"),
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+    }
+
+
+# 接口：模型列表
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [
+        {"id": "mock-chat", "object": "model", "created": 0, "owned_by": "mock"},
+        {"id": "mock-embedding", "object": "model", "created": 0, "owned_by": "mock"},
+    ]}
+
+
+# 主程序入口
+if __name__ == "__main__":
+    # 解析命令行参数
+    args = build_parser().parse_args()
+
+    settings = MockSettings(args)
+    logger.info(f"模拟模型服务启动：http://{args.host}:{args.port}/v1 首 token 延迟: {args.ttft_dist}({args.ttft_median}s) 输出速度: {args.tokens_per_sec} token/s")
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -8,8 +8,13 @@ import contextlib
 from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
 # 导入Starlette应用程序类
 from starlette.applications import Starlette
-# 导入Starlette路由Mount类，用于挂载子应用
-from starlette.routing import Mount
+# 导入Starlette路由Mount类，用于挂载子应用；Route类用于注册指标接口
+from starlette.routing import Mount, Route
+# 导入Starlette中间件声明类
+from starlette.middleware import Middleware
+# 导入Starlette请求与响应类，用于实现指标接口
+from starlette.requests import Request
+from starlette.responses import Response
 # 导入Starlette的类型定义
 from starlette.types import Receive, Scope, Send
 # 导入AsyncIterator类型，用于异步迭代器的类型注解
@@ -18,6 +23,8 @@ from collections.abc import AsyncIterator
 from utils.config import Config
 # 导入日志管理器模块
 from utils.logger import LoggerManager
+# 导入Prometheus指标中间件与指标输出函数
+from utils.metrics import MetricsMiddleware, render_metrics
 
 
 
@@ -61,6 +68,11 @@ async def handle_streamable_http(
     # 将请求委托给会话管理器进行处理
     await session_manager.handle_request(scope, receive, send)
 
+# 定义Prometheus指标接口，返回请求数、工具调用耗时与Milvus检索耗时等指标
+async def metrics(request: Request) -> Response:
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 # 使用contextlib.asynccontextmanager装饰器定义异步上下文管理器
 @contextlib.asynccontextmanager
 # 定义生命周期管理函数，用于启动和关闭应用程序资源
@@ -86,9 +98,13 @@ starlette_app = Starlette(
     # 设置调试模式为True，在开发环境中显示详细错误信息
     debug=True,
     routes=[
+        # 注册Prometheus指标接口
+        Route("/metrics", endpoint=metrics),
         # 将/mcp路径挂载到handle_streamable_http处理函数
         Mount("/mcp", app=handle_streamable_http),
     ],
+    # 统计请求数、耗时与处理中的请求数
+    middleware=[Middleware(MetricsMiddleware)],
     # 使用lifespan函数管理应用程序的启动和关闭
     lifespan=lifespan,
 )
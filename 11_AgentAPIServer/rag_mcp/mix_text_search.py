@@ -24,6 +24,8 @@ from utils.config import Config
 from utils.llms import get_llm
 # 导入日志管理器模块
 from utils.logger import LoggerManager
+# 导入 span，用于把向量化、检索与过滤表达式生成的耗时记入当前工具调用的耗时明细
+from utils.timing import span
 
 
 
@@ -362,7 +364,8 @@ class MilvusSearchManager:
 
             # 使用LangChain的embed_query方法
             # 调用嵌入模型的embed_query方法生成向量
-            embedding = self.llm_embedding.embed_query(text)
+            with span("embedding"):
+                embedding = self.llm_embedding.embed_query(text)
 
             # 记录成功生成向量的调试日志，包含向量维度
             logger.debug(f"成功生成 {len(embedding)} 维向量")
@@ -474,15 +477,16 @@ class MilvusSearchManager:
             # search_params: 搜索参数
             # filter: 过滤表达式
             # output_fields: 要返回的字段列表
-            res = self.milvus_client.search(
-                collection_name=collection_name,
-                anns_field="title_sparse",
-                data=[query_text],
-                limit=limit,
-                search_params=search_params,
-                filter=filter_expr,
-                output_fields=output_fields
-            )
+            with span("milvus_search"):
+                res = self.milvus_client.search(
+                    collection_name=collection_name,
+                    anns_field="title_sparse",
+                    data=[query_text],
+                    limit=limit,
+                    search_params=search_params,
+                    filter=filter_expr,
+                    output_fields=output_fields
+                )
 
             # 记录搜索完成的日志，包含结果数量
             logger.info(f"稀疏向量搜索完成，返回 {len(res[0]) if res else 0} 个结果")
@@ -522,15 +526,16 @@ class MilvusSearchManager:
             # search_params: 搜索参数，使用余弦相似度
             # filter: 过滤表达式
             # output_fields: 要返回的字段列表
-            res = self.milvus_client.search(
-                collection_name=collection_name,
-                anns_field="content_dense",
-                data=[query_vector],
-                limit=limit,
-                search_params={"metric_type": "COSINE"},
-                filter=filter_expr,
-                output_fields=output_fields
-            )
+            with span("milvus_search"):
+                res = self.milvus_client.search(
+                    collection_name=collection_name,
+                    anns_field="content_dense",
+                    data=[query_vector],
+                    limit=limit,
+                    search_params={"metric_type": "COSINE"},
+                    filter=filter_expr,
+                    output_fields=output_fields
+                )
 
             # 记录搜索完成的日志，包含结果数量
             logger.info(f"密集向量搜索完成，返回 {len(res[0]) if res else 0} 个结果")
@@ -615,6 +620,10 @@ class MilvusSearchManager:
     # limit: 返回结果数量限制
     # filter_query: 过滤查询的自然语言描述
     # embedding_function: 自定义的嵌入函数（可选）
+    # ranker: 混合搜索的融合方式（rrf/weighted）
+    # rrf_k: RRF算法的参数k
+    # weights: 加权融合时密集、稀疏两路的权重
+    # candidate_limit: 混合搜索时每一路召回的候选数量（默认取limit和2的较小值）
     # 返回值: 搜索结果列表
     def search_documents(self,
                          collection_name: str,
@@ -622,7 +631,11 @@ class MilvusSearchManager:
                          search_type: str,
                          limit: int = 5,
                          filter_query: str = "##None##",
-                         embedding_function: Optional[Callable[[str], List[float]]] = None
+                         embedding_function: Optional[Callable[[str], List[float]]] = None,
+                         ranker: str = "rrf",
+                         rrf_k: int = 100,
+                         weights: Optional[List[float]] = None,
+                         candidate_limit: Optional[int] = None
                          ) -> List[Dict[str, Any]]:
         # 使用try-except捕获可能的异常
         try:
@@ -647,7 +660,8 @@ class MilvusSearchManager:
             # 如果有过滤查询
             if filter_query != "##None##":
                 # 调用过滤表达式生成器生成过滤表达式
-                filter_expr = self.filter_generator.generate_filter_expression(filter_query)
+                with span("filter_generation"):
+                    filter_expr = self.filter_generator.generate_filter_expression(filter_query)
                 # 如果成功生成过滤表达式
                 if filter_expr:
                     # 记录生成的过滤表达式
@@ -689,26 +703,28 @@ class MilvusSearchManager:
                 # data: 查询向量，通过embedding_function将查询文本转换为向量
                 # anns_field: 用于搜索的密集向量字段
                 # param: 搜索参数
-                # limit: 返回结果数量，取limit和2的较小值
+                # limit: 每一路召回的候选数量，未指定时取limit和2的较小值
                 # expr: 过滤表达式
+                if candidate_limit is None:
+                    candidate_limit = min(2, limit)
                 search_param_1 = {
                     "data": [embedding_function(query_text)],
                     "anns_field": "content_dense",
                     "param": {"nprobe": 10, "metric_type": "COSINE"},
-                    "limit": min(2, limit),
+                    "limit": candidate_limit,
                     "expr": filter_expr  # 添加过滤表达式
                 }
                 # 创建第二个搜索请求（稀疏向量搜索）
                 # data: 查询文本
                 # anns_field: 用于搜索的稀疏向量字段（标题的稀疏向量）
                 # param: 搜索参数
-                # limit: 返回结果数量，取limit和2的较小值
+                # limit: 每一路召回的候选数量
                 # expr: 过滤表达式
                 search_param_2 = {
                     "data": [query_text],
                     "anns_field": "title_sparse",
                     "param": {"drop_ratio_search": 0.2},
-                    "limit": min(2, limit),
+                    "limit": candidate_limit,
                     "expr": filter_expr  # 添加过滤表达式
                 }
                 # 创建AnnSearchRequest对象，封装第一个搜索请求
@@ -717,9 +733,12 @@ class MilvusSearchManager:
                 request_2 = AnnSearchRequest(**search_param_2)
 
                 # 选择排名器，默认使用RRF
-                # 调用_create_rrf_ranker方法创建RRF排名器
-                rrf_ranker = self._create_rrf_ranker(k=100)
-                # weight_ranker = self._create_weight_ranker(weights=[0.9, 0.1], norm_score=True)
+                if ranker == "weighted":
+                    # 调用_create_weight_ranker方法创建加权排名器
+                    hybrid_ranker = self._create_weight_ranker(weights=weights or [0.9, 0.1], norm_score=True)
+                else:
+                    # 调用_create_rrf_ranker方法创建RRF排名器
+                    hybrid_ranker = self._create_rrf_ranker(k=rrf_k)
 
                 # 执行混合搜索
                 # collection_name: 要搜索的集合名称
@@ -727,14 +746,14 @@ class MilvusSearchManager:
                 # ranker: 排名器，用于融合多路搜索结果
                 # limit: 最终返回的结果数量
                 # output_fields: 要返回的字段列表
-                res = self.milvus_client.hybrid_search(
-                    collection_name=collection_name,
-                    reqs=[request_1, request_2],
-                    ranker=rrf_ranker,
-                    # ranker=weight_ranker,
-                    limit=limit,
-                    output_fields=output_fields
-                )
+                with span("milvus_search"):
+                    res = self.milvus_client.hybrid_search(
+                        collection_name=collection_name,
+                        reqs=[request_1, request_2],
+                        ranker=hybrid_ranker,
+                        limit=limit,
+                        output_fields=output_fields
+                    )
                 # 记录混合搜索完成的日志，包含结果数量
                 logger.info(f"混合搜索完成，返回结果数: {len(res[0]) if res else 0}")
                 # 返回搜索结果
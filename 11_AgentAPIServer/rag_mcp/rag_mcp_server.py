@@ -7,7 +7,13 @@ from utils.config import Config
 # 导入自定义的Milvus搜索管理器类
 from mix_text_search import MilvusSearchManager
 # 导入日志管理器模块
-from utils.logger import LoggerManager
+from utils.logger import LoggerManager, log_context, payload
+# 导入 time 模块，用于统计工具调用耗时
+import time
+# 导入请求计时器，用于统计工具调用中各阶段的耗时
+from utils.timing import RequestTimer, span
+# 导入工具调用与检索各阶段耗时的 Prometheus 指标
+from utils.metrics import TOOL_LATENCY, STAGE_LATENCY
 
 
 
@@ -97,8 +103,35 @@ async def list_tools() -> list[Tool]:
 # 定义异步函数，处理工具调用请求
 # name: 要调用的工具名称
 # arguments: 工具参数字典
+# 返回值: (TextContent对象的列表, 结构化内容)
+async def call_tool(name: str, arguments: dict) -> tuple[list[TextContent], dict]:
+    # 为本次工具调用创建计时器，统计向量化、Milvus 检索与过滤表达式生成等阶段的耗时
+    timer = RequestTimer()
+    start = time.perf_counter()
+    status = "error"
+    # API 服务通过 X-Request-ID 请求头传入请求ID，本次工具调用的日志都携带该请求ID与工具名
+    http_request = mcp.request_context.request
+    request_id = http_request.headers.get("X-Request-ID", "") if http_request is not None else ""
+    try:
+        with log_context(request_id=request_id, tool=name), timer.activate():
+            contents = await run_tool(name, arguments)
+        status = "ok"
+    finally:
+        TOOL_LATENCY.labels(name, status).observe(time.perf_counter() - start)
+    timings = {stage: item["total_ms"] for stage, item in timer.summary().items()}
+    # 按搜索类型记录各阶段耗时指标（Milvus 检索、向量化、过滤表达式生成等）
+    search_type = arguments.get("search_type") if arguments.get("search_type") in ("dense", "sparse", "hybrid") else "other"
+    for stage, duration_ms in timings.items():
+        STAGE_LATENCY.labels(stage, search_type).observe(duration_ms / 1000)
+    # 文本内容返回给模型；结构化内容（structuredContent）携带各阶段耗时（毫秒），由 API 服务记入请求耗时明细
+    return contents, {"timings": timings}
+
+
+# 定义异步函数，执行工具调用
+# name: 要调用的工具名称
+# arguments: 工具参数字典
 # 返回值: TextContent对象的列表
-async def call_tool(name: str, arguments: dict) -> list[TextContent]:
+async def run_tool(name: str, arguments: dict) -> list[TextContent]:
     # 检查工具名称 name 是否是 search_documents
     # 如果 query_text 为空或未提供，抛出 ValueError 异常，提示用户必须提供查询语句
     # 验证工具名称是否为"search_documents"
@@ -134,10 +167,11 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     # 使用try-except捕获可能的异常
     try:
         # 创建MilvusSearchManager实例，指定Milvus服务器地址和数据库名称
-        search_manager = MilvusSearchManager(
-            milvus_uri = Config.MILVUS_URI,
-            db_name = Config.MILVUS_DB_NAME
-        )
+        with span("search_manager_init"):
+            search_manager = MilvusSearchManager(
+                milvus_uri = Config.MILVUS_URI,
+                db_name = Config.MILVUS_DB_NAME
+            )
 
         # 执行混合搜索示例
         # 调用search_with_filter方法执行带过滤条件的搜索
@@ -189,8 +223,8 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
                     )
                     # 将记录追加到结果字符串
                     filtered_result_string += record
-                # 打印完整的搜索结果字符串
-                logger.info(f"过滤搜索结果:\n{filtered_result_string}")
+                # 记录搜索结果（默认只记录长度、摘要与开头片段，LOG_PAYLOAD_MODE=full 时记录完整内容）
+                logger.info("过滤搜索结果: %s", payload(filtered_result_string))
                 # 返回一个包含查询结果的 TextContent 对象
                 # 创建TextContent对象，将搜索结果封装为文本内容并返回
                 return [TextContent(type="text", text=filtered_result_string)]
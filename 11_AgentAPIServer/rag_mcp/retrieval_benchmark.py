@@ -0,0 +1,246 @@
+# 导入 argparse 模块，用于解析命令行参数
+import argparse
+# 导入 json 模块，用于读取标注问题集与保存评测结果
+import json
+# 导入 math 模块，用于计算 nDCG 的对数折扣
+import math
+# 导入 os 模块，用于创建结果目录
+import os
+# 导入 time 模块，用于统计检索延迟
+import time
+# 导入线程池，用于测量并发检索吞吐
+from concurrent.futures import ThreadPoolExecutor
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, List, Optional
+# 导入配置模块，包含Milvus连接信息
+from utils.config import Config
+# 导入日志管理器模块
+from utils.logger import LoggerManager
+# 导入Milvus搜索管理器
+from mix_text_search import MilvusSearchManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志记录器，用于输出运行过程中的日志信息
+logger = LoggerManager.get_logger()
+
+
+# 默认评测的检索配置：三种检索模式 + 混合检索下不同的 RRF k 与加权融合权重
+# hybrid_default 与线上 search_documents 的默认参数一致（每路召回 min(2, limit) 个候选），作为对照
+# 其余混合检索配置每路召回 limit（默认 10，不小于 max(ks)）个候选，避免融合后不足 k 条导致 recall@k/nDCG@k 失真
+DEFAULT_CONFIGS = [
+    {"name": "dense", "search_type": "dense"},
+    {"name": "sparse", "search_type": "sparse"},
+    {"name": "hybrid_default", "search_type": "hybrid"},
+    {"name": "hybrid_rrf_k10", "search_type": "hybrid", "ranker": "rrf", "rrf_k": 10, "candidate_limit": 10},
+    {"name": "hybrid_rrf_k60", "search_type": "hybrid", "ranker": "rrf", "rrf_k": 60, "candidate_limit": 10},
+    {"name": "hybrid_rrf_k100", "search_type": "hybrid", "ranker": "rrf", "rrf_k": 100, "candidate_limit": 10},
+    {"name": "hybrid_weighted_0.9_0.1", "search_type": "hybrid", "ranker": "weighted", "weights": [0.9, 0.1], "candidate_limit": 10},
+    {"name": "hybrid_weighted_0.5_0.5", "search_type": "hybrid", "ranker": "weighted", "weights": [0.5, 0.5], "candidate_limit": 10},
+    {"name": "hybrid_weighted_0.1_0.9", "search_type": "hybrid", "ranker": "weighted", "weights": [0.1, 0.9], "candidate_limit": 10},
+]
+
+
+# 计算分位数（数据为空时返回 None）
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# 计算 recall@k：前 k 个结果中命中的相关文档数 / 相关文档总数
+def recall_at_k(ranked: List[str], relevant: set, k: int) -> float:
+    return len(set(ranked[:k]) & relevant) / len(relevant) if relevant else 0.0
+
+
+# 计算 MRR：第一个相关文档排名的倒数
+def reciprocal_rank(ranked: List[str], relevant: set) -> float:
+    for rank, doc in enumerate(ranked, 1):
+        if doc in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+# 计算 nDCG@k（二值相关性）
+def ndcg_at_k(ranked: List[str], relevant: set, k: int) -> float:
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, doc in enumerate(ranked[:k], 1) if doc in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+# 把检索结果（文档块）按文章标题去重，得到文章级排序
+def ranked_titles(results: List[Any]) -> List[str]:
+    titles = []
+    for hit in (results[0] if results else []):
+        title = hit.entity.get("title", "")
+        if title not in titles:
+            titles.append(title)
+    return titles
+
+
+# 定义检索评测器
+class RetrievalBenchmark:
+    """
+    Milvus 检索评测：
+
+      - 质量指标：基于标注问题集计算 recall@k、MRR 与 nDCG@k（按文章去重后评估）
+      - 性能指标：顺序执行得到单次检索延迟的 p50/p99，线程池并发执行得到 QPS
+      - 稠密检索与混合检索的延迟包含查询向量化的耗时
+    """
+
+    def __init__(self, search_manager: MilvusSearchManager, collection_name: str, queries: List[Dict[str, Any]],
+                 limit: int = 10, ks: List[int] = (1, 3, 5), repeat: int = 3, concurrency: int = 8):
+        self.search_manager = search_manager
+        self.collection_name = collection_name
+        self.queries = queries
+        # 每次检索返回的文档块数量
+        self.limit = limit
+        # 评估的 k 值
+        self.ks = list(ks)
+        # 延迟测量的重复次数
+        self.repeat = repeat
+        # 吞吐测量的并发线程数
+        self.concurrency = concurrency
+
+    def search(self, query: str, config: Dict[str, Any]) -> List[Any]:
+        """按配置执行一次检索"""
+        # 显式指定的每路候选数不低于 max(ks)，保证 recall@k/nDCG@k 有足够的融合结果可评估
+        candidate_limit = config.get("candidate_limit")
+        if candidate_limit is not None:
+            candidate_limit = max(candidate_limit, max(self.ks))
+        return self.search_manager.search_documents(
+            collection_name=self.collection_name,
+            query_text=query,
+            search_type=config["search_type"],
+            limit=self.limit,
+            ranker=config.get("ranker", "rrf"),
+            rrf_k=config.get("rrf_k", 100),
+            weights=config.get("weights"),
+            candidate_limit=candidate_limit
+        )
+
+    def evaluate(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """评测单个检索配置"""
+        latencies = []
+        metrics = {f"recall@{k}": 0.0 for k in self.ks}
+        metrics.update({f"ndcg@{k}": 0.0 for k in self.ks})
+        metrics["mrr"] = 0.0
+        per_query = []
+        # 质量与延迟：顺序执行，每个问题重复 repeat 次，质量指标取第一次的结果
+        for item in self.queries:
+            relevant = set(item["relevant_titles"])
+            ranked = None
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                results = self.search(item["query"], config)
+                latencies.append(time.perf_counter() - start)
+                if ranked is None:
+                    ranked = ranked_titles(results)
+            for k in self.ks:
+                metrics[f"recall@{k}"] += recall_at_k(ranked, relevant, k)
+                metrics[f"ndcg@{k}"] += ndcg_at_k(ranked, relevant, k)
+            rr = reciprocal_rank(ranked, relevant)
+            metrics["mrr"] += rr
+            per_query.append({"id": item["id"], "query": item["query"], "reciprocal_rank": rr, "ranked_titles": ranked[:max(self.ks)]})
+        metrics = {name: round(value / len(self.queries), 4) for name, value in metrics.items()}
+
+        # 吞吐：线程池并发执行全部问题
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(lambda item: self.search(item["query"], config), self.queries * self.repeat))
+        elapsed = time.perf_counter() - start
+
+        return {
+            "config": config,
+            "metrics": metrics,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.5) * 1000, 2),
+                "p99": round(percentile(latencies, 0.99) * 1000, 2),
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+            },
+            "qps": round(len(self.queries) * self.repeat / elapsed, 2),
+            "per_query": per_query,
+        }
+
+    def run(self, configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """依次评测全部检索配置"""
+        results = []
+        for config in configs:
+            logger.info(f"开始评测检索配置: {config['name']}")
+            # 预热：每个配置先执行一次，排除首次加载与连接建立的耗时
+            self.search(self.queries[0]["query"], config)
+            results.append(self.evaluate(config))
+        return results
+
+
+# 打印评测结果表格，提供基线结果时同时打印与基线的差值
+def print_results(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None) -> None:
+    baseline_by_name = {r["config"]["name"]: r for r in (baseline or {}).get("results", [])}
+    metric_names = list(results[0]["metrics"].keys())
+    print("=" * 120)
+    print(f"{'配置':<26}" + "".join(f"{name:>11}" for name in metric_names) + f"{'p50(ms)':>10}{'p99(ms)':>10}{'QPS':>9}")
+    for r in results:
+        print(f"{r['config']['name']:<26}" + "".join(f"{r['metrics'][name]:>11}" for name in metric_names)
+              + f"{r['latency_ms']['p50']:>10}{r['latency_ms']['p99']:>10}{r['qps']:>9}")
+        base = baseline_by_name.get(r["config"]["name"])
+        if base:
+            print(f"{'  Δ 基线':<25}" + "".join(f"{round(r['metrics'][name] - base['metrics'].get(name, 0), 4):>+11}" for name in metric_names)
+                  + f"{round(r['latency_ms']['p50'] - base['latency_ms']['p50'], 2):>+10}"
+                  + f"{round(r['latency_ms']['p99'] - base['latency_ms']['p99'], 2):>+10}{round(r['qps'] - base['qps'], 2):>+9}")
+    print("=" * 120)
+
+
+# 主程序入口
+if __name__ == "__main__":
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description="Milvus 检索质量与性能评测")
+    parser.add_argument("--collection", default="my_collection_demo_chunked", help="集合名称")
+    parser.add_argument("--queries", default="../milvus/data/test_queries.json", help="标注问题集 JSON 文件")
+    parser.add_argument("--configs", default=None, help="检索配置 JSON 文件（默认评测 DEFAULT_CONFIGS）")
+    parser.add_argument("--candidate-limit", type=int, default=None, help="混合检索每一路召回的候选数量（覆盖除 hybrid_default 外的混合检索配置）")
+    parser.add_argument("--limit", type=int, default=10, help="每次检索返回的文档块数量")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="评估的 k 值")
+    parser.add_argument("--repeat", type=int, default=3, help="每个问题的重复次数（用于延迟与吞吐测量）")
+    parser.add_argument("--concurrency", type=int, default=8, help="吞吐测量的并发线程数")
+    parser.add_argument("--output", default=None, help="评测结果 JSON 保存路径（默认保存到 benchmark_results 目录）")
+    parser.add_argument("--baseline", default=None, help="基线评测结果 JSON，用于回归对比")
+    args = parser.parse_args()
+
+    # 读取标注问题集与检索配置
+    with open(args.queries, encoding="utf-8") as f:
+        queries = json.load(f)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, encoding="utf-8") as f:
+            configs = json.load(f)
+    if args.candidate_limit:
+        configs = [dict(c, candidate_limit=args.candidate_limit) if c["search_type"] == "hybrid" and c["name"] != "hybrid_default" else c for c in configs]
+
+    # 初始化搜索管理器
+    search_manager = MilvusSearchManager(milvus_uri=Config.MILVUS_URI, db_name=Config.MILVUS_DB_NAME)
+    benchmark = RetrievalBenchmark(search_manager, args.collection, queries,
+                                   limit=args.limit, ks=args.k, repeat=args.repeat, concurrency=args.concurrency)
+    results = benchmark.run(configs)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    # 保存评测结果
+    output = args.output or os.path.join("benchmark_results", f"retrieval_milvus_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "collection": args.collection,
+            "queries": args.queries,
+            "llm_type": Config.LLM_TYPE,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"评测结果已保存到 {output}")
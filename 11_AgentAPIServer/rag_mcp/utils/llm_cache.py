@@ -0,0 +1,352 @@
+# 导入 hashlib，用于把 (模型参数, 消息) 压缩成定长的缓存键
+import hashlib
+# 导入 json 模块，用于序列化缓存内容
+import json
+# 导入正则模块，用于从模型参数串中解析 temperature
+import re
+# 导入 sqlite3，用于本地文件缓存后端
+import sqlite3
+# 导入线程锁，保证缓存后端在多线程下的读写安全
+import threading
+# 导入 time 模块，用于计算缓存过期时间
+import time
+# 导入有序字典，用于实现按最近使用顺序淘汰的 LRU 缓存
+from collections import OrderedDict
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Optional, Tuple
+# 导入 LangChain 缓存基类，模型实例通过 cache 参数接入
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+# 导入消息序列化工具，缓存中只保存普通 JSON
+from langchain_core.messages import messages_from_dict, messages_to_dict
+# 导入生成结果类型
+from langchain_core.outputs import ChatGeneration, Generation
+# 从当前包中导入 Config 配置类，用于读取缓存后端与容量配置
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+# 匹配序列化后的模型参数中的 temperature，例如 "temperature": 0.0
+_SERIALIZED_TEMPERATURE = re.compile(r'"temperature":\s*(-?[0-9.eE+-]+|null)')
+# 匹配调用时通过 bind/kwargs 传入的 temperature，例如 ('temperature', 0.7)
+_CALL_TEMPERATURE = re.compile(r"\('temperature',\s*(-?[0-9.eE+-]+|None)\)")
+
+
+# 定义内存 LRU 缓存后端
+class MemoryCacheBackend:
+    """进程内 LRU 缓存，按条目数淘汰最久未使用的结果"""
+
+    def __init__(self, max_entries: int):
+        # 最大缓存条目数
+        self.max_entries = max_entries
+        # 缓存键 -> (过期时间, 序列化后的结果)
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # 保护缓存的锁
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            # 已过期的条目直接删除
+            if entry[0] < time.time():
+                del self._data[key]
+                return None
+            # 命中时移动到最近使用的位置
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str, expire_at: float) -> None:
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            # 超过容量时淘汰最久未使用的条目
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+# 定义 SQLite 缓存后端：进程重启后缓存仍然有效，适合单机多次评测复跑
+class SQLiteCacheBackend:
+    """基于 SQLite 文件的缓存，按写入时间淘汰超出容量的条目"""
+
+    def __init__(self, path: str, max_entries: int, cleanup_every: int = 100):
+        # 最大缓存条目数
+        self.max_entries = max_entries
+        # 每写入多少次执行一次过期清理与容量淘汰
+        self.cleanup_every = cleanup_every
+        # 写入计数
+        self._writes = 0
+        # 同一连接在多个线程中使用，由锁串行化访问
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL 模式下读写互不阻塞
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND expire_at >= ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, expire_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expire_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, expire_at, time.time())
+            )
+            self._writes += 1
+            # 定期删除过期条目，并按写入时间淘汰超出容量的条目
+            if self._writes % self.cleanup_every == 0:
+                self._conn.execute("DELETE FROM llm_cache WHERE expire_at < ?", (time.time(),))
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+# 定义 PostgreSQL 缓存后端：多个 worker 进程、多台机器共享同一份缓存
+class PostgresCacheBackend:
+    """基于 PostgreSQL 的缓存，复用 Config.DB_URI，按写入时间淘汰超出容量的条目"""
+
+    def __init__(self, conninfo: str, max_entries: int, cleanup_every: int = 100):
+        # 按需导入 psycopg_pool，只有选择 postgres 后端时才需要
+        from psycopg_pool import ConnectionPool
+        # 最大缓存条目数
+        self.max_entries = max_entries
+        # 每写入多少次执行一次过期清理与容量淘汰
+        self.cleanup_every = cleanup_every
+        # 写入计数
+        self._writes = 0
+        # 缓存读写都是单条 SQL，使用一个很小的独立连接池，不占用 checkpointer/store 的连接配额
+        self._pool = ConnectionPool(conninfo=conninfo, min_size=1, max_size=2, kwargs={"autocommit": True}, name="llm-cache", open=True)
+        with self._pool.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at DOUBLE PRECISION NOT NULL, created_at DOUBLE PRECISION NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM llm_cache WHERE key = %s AND expire_at >= %s", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, expire_at: float) -> None:
+        with self._pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO llm_cache (key, value, expire_at, created_at) VALUES (%s, %s, %s, %s) "
+                "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expire_at = EXCLUDED.expire_at, created_at = EXCLUDED.created_at",
+                (key, value, expire_at, time.time())
+            )
+            self._writes += 1
+            # 定期删除过期条目，并按写入时间淘汰超出容量的条目
+            if self._writes % self.cleanup_every == 0:
+                conn.execute("DELETE FROM llm_cache WHERE expire_at < %s", (time.time(),))
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY created_at DESC OFFSET %s)",
+                    (self.max_entries,)
+                )
+
+    def clear(self) -> None:
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def size(self) -> int:
+        with self._pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+# 定义 LLM 精确匹配缓存：只缓存 temperature 为 0 的确定性调用
+class LLMResponseCache(BaseCache):
+    """
+    LLM 精确匹配缓存：
+
+      - 缓存键为 sha256(模型序列化参数 + 调用参数 + 消息)，模型名、base_url、temperature、绑定的工具、stop 等任一不同都不会命中
+      - 只缓存 temperature 为 0 的调用，非确定性调用直接跳过
+      - 条目带 TTL，并按容量淘汰；统计命中、未命中与跳过次数
+    """
+
+    def __init__(self, backend: Any, ttl: float):
+        # 具体的存储后端（内存、SQLite 或 PostgreSQL）
+        self.backend = backend
+        # 缓存条目的有效期（秒）
+        self.ttl = ttl
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.writes = 0
+        self.errors = 0
+        # 保护统计计数的锁
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def is_deterministic(llm_string: str) -> bool:
+        """根据模型参数串判断本次调用是否为 temperature 为 0 的确定性调用"""
+        # 调用时传入的参数优先于模型实例上的参数
+        values = _CALL_TEMPERATURE.findall(llm_string) or _SERIALIZED_TEMPERATURE.findall(llm_string)
+        # 未显式设置 temperature 时使用服务端默认值（通常不为 0），不缓存
+        if not values or values[-1] in ("None", "null"):
+            return False
+        try:
+            return float(values[-1]) == 0
+        except ValueError:
+            return False
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        """计算缓存键"""
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _dumps(generations: RETURN_VAL_TYPE) -> str:
+        """将生成结果序列化为 JSON"""
+        items = []
+        for generation in generations:
+            if isinstance(generation, ChatGeneration):
+                message = messages_to_dict([generation.message])[0]
+                # 不保存消息 ID，命中缓存时由 LangChain 按本次运行重新生成，避免同一会话中出现重复 ID 的消息
+                message["data"]["id"] = None
+                items.append({"message": message, "generation_info": generation.generation_info})
+            else:
+                items.append({"text": generation.text, "generation_info": generation.generation_info})
+        return json.dumps(items, ensure_ascii=False)
+
+    @staticmethod
+    def _loads(value: str) -> RETURN_VAL_TYPE:
+        """从 JSON 还原生成结果"""
+        generations = []
+        for item in json.loads(value):
+            if "message" in item:
+                generations.append(ChatGeneration(message=messages_from_dict([item["message"]])[0], generation_info=item.get("generation_info")))
+            else:
+                generations.append(Generation(text=item["text"], generation_info=item.get("generation_info")))
+        return generations
+
+    def _count(self, name: str) -> None:
+        """线程安全地累加统计计数"""
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """查询缓存，未命中或不可缓存时返回 None"""
+        if not self.is_deterministic(llm_string):
+            self._count("skipped")
+            return None
+        try:
+            value = self.backend.get(self.make_key(prompt, llm_string))
+        except Exception as e:
+            # 缓存后端故障不影响正常调用模型
+            self._count("errors")
+            logger.error(f"LLM 缓存读取失败: {e}")
+            return None
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return self._loads(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """写入缓存（非确定性调用不写入）"""
+        if not self.is_deterministic(llm_string):
+            return
+        try:
+            self.backend.set(self.make_key(prompt, llm_string), self._dumps(return_val), time.time() + self.ttl)
+            self._count("writes")
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"LLM 缓存写入失败: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        """清空缓存"""
+        self.backend.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计信息"""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "writes": self.writes,
+                "errors": self.errors,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+        try:
+            stats["entries"] = self.backend.size()
+        except Exception:
+            stats["entries"] = None
+        return stats
+
+
+# 进程内共享的缓存实例
+_shared_cache: Optional[LLMResponseCache] = None
+# 是否已根据配置初始化过（缓存关闭时 _shared_cache 保持为 None）
+_initialized = False
+# 保护共享实例创建的锁
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """根据 Config.LLM_CACHE_BACKEND 获取进程内共享的 LLM 缓存，关闭或初始化失败时返回 None"""
+    global _shared_cache, _initialized
+    with _cache_lock:
+        if _initialized:
+            return _shared_cache
+        _initialized = True
+        backend_name = Config.LLM_CACHE_BACKEND
+        try:
+            if backend_name == "memory":
+                backend = MemoryCacheBackend(Config.LLM_CACHE_MAX_ENTRIES)
+            elif backend_name == "sqlite":
+                backend = SQLiteCacheBackend(Config.LLM_CACHE_SQLITE_PATH, Config.LLM_CACHE_MAX_ENTRIES)
+            elif backend_name == "postgres":
+                backend = PostgresCacheBackend(Config.DB_URI, Config.LLM_CACHE_MAX_ENTRIES)
+            else:
+                logger.info("LLM 缓存未启用")
+                return None
+            _shared_cache = LLMResponseCache(backend, Config.LLM_CACHE_TTL)
+            logger.info(f"LLM 缓存已启用，后端: {backend_name} 容量: {Config.LLM_CACHE_MAX_ENTRIES} TTL: {Config.LLM_CACHE_TTL} 秒")
+        except Exception as e:
+            # 缓存后端不可用时退化为不缓存，不影响服务启动
+            logger.error(f"LLM 缓存初始化失败，已禁用缓存: {e}")
+            _shared_cache = None
+        return _shared_cache
@@ -0,0 +1,72 @@
+# 导入 os 模块，用于读取 Prometheus 多进程目录的环境变量
+import os
+# 导入 time 模块，用于统计请求耗时
+import time
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Tuple
+# 导入 Prometheus 客户端：指标类型、注册表、多进程汇总与文本格式输出
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+# 导入 Starlette 的 ASGI 类型定义
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 多 worker 部署时，各进程把指标写入 PROMETHEUS_MULTIPROC_DIR 目录下的文件，/metrics 汇总全部进程的数据
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# 延迟直方图的分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# HTTP 请求：route 为挂载路径（/mcp），MCP 的流式响应统计到响应结束
+HTTP_REQUESTS = Counter("rag_mcp_requests_total", "HTTP 请求数", ["method", "route", "status"])
+HTTP_LATENCY = Histogram("rag_mcp_request_duration_seconds", "HTTP 请求耗时", ["method", "route"], buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge("rag_mcp_requests_in_flight", "处理中的 HTTP 请求数", multiprocess_mode="livesum")
+
+# 工具调用
+TOOL_LATENCY = Histogram("rag_mcp_tool_call_duration_seconds", "工具调用耗时", ["tool", "status"], buckets=LATENCY_BUCKETS)
+
+# 工具调用中各阶段的耗时：search_type 为 dense、sparse、hybrid，stage 为 embedding、milvus_search、filter_generation、search_manager_init
+STAGE_LATENCY = Histogram("rag_mcp_stage_duration_seconds", "检索各阶段耗时", ["stage", "search_type"], buckets=LATENCY_BUCKETS)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成 Prometheus 文本格式的指标，多进程模式下汇总全部 worker 的数据"""
+    if os.getenv(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+# 定义 ASGI 中间件：按挂载路径统计请求数、耗时与处理中的请求数（纯 ASGI 实现，不缓冲流式响应）
+class MetricsMiddleware:
+
+    def __init__(self, app: ASGIApp, routes: Tuple[str, ...] = ("/mcp",)):
+        self.app = app
+        # 作为标签的路径前缀，其余路径统一记为 other，避免标签数量膨胀
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        route = next((prefix for prefix in self.routes if scope["path"].startswith(prefix)), "other")
+        status = "500"
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUESTS.labels(scope["method"], route, status).inc()
+            HTTP_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - start)
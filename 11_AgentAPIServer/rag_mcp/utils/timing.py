@@ -0,0 +1,105 @@
+# 导入 time 模块，用于高精度计时
+import time
+# 导入 ContextVar，用于在一次请求的所有异步任务之间共享计时器
+from contextvars import ContextVar
+# 导入上下文管理器装饰器与空上下文
+from contextlib import contextmanager, nullcontext
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Iterator, List, Optional
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 当前工具调用的计时器，call_tool 在调用开始时设置
+_current_timer: ContextVar[Optional["RequestTimer"]] = ContextVar("request_timer", default=None)
+
+
+# 定义请求计时器：记录一次请求中各阶段的耗时片段（span）
+class RequestTimer:
+    """
+    请求级耗时明细：
+
+      - 每个 span 记录名称、相对请求开始的起始时间与耗时（毫秒），以及可选的附加属性（如工具名）
+      - summary 按名称汇总次数与总耗时，用于生成 Server-Timing 响应头与结构化日志
+      - 并发执行的 span（如并行工具调用）各自计时，汇总耗时可能大于请求总耗时
+    """
+
+    def __init__(self):
+        # 请求开始时间
+        self._start = time.perf_counter()
+        # 已记录的耗时片段
+        self.spans: List[Dict[str, Any]] = []
+
+    def elapsed_ms(self) -> float:
+        """请求开始至今的耗时（毫秒）"""
+        return (time.perf_counter() - self._start) * 1000
+
+    def record(self, name: str, duration_ms: float, start_ms: Optional[float] = None, **attrs: Any) -> None:
+        """记录一个耗时片段，未指定起始时间时视为刚刚结束"""
+        if start_ms is None:
+            start_ms = self.elapsed_ms() - duration_ms
+        span = {"name": name, "start_ms": round(start_ms, 2), "duration_ms": round(duration_ms, 2)}
+        span.update(attrs)
+        self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """统计代码块的耗时，代码块内可以向返回的字典追加属性"""
+        start_ms = self.elapsed_ms()
+        try:
+            yield attrs
+        finally:
+            self.record(name, self.elapsed_ms() - start_ms, start_ms, **attrs)
+
+    @contextmanager
+    def activate(self) -> Iterator["RequestTimer"]:
+        """把计时器设置为当前上下文的计时器"""
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """按名称汇总各阶段的次数与总耗时（保持首次出现的顺序）"""
+        summary: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            item = summary.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+            item["count"] += 1
+            item["total_ms"] = round(item["total_ms"] + span["duration_ms"], 2)
+        return summary
+
+    def server_timing(self) -> str:
+        """生成 Server-Timing 响应头，例如 agent_build;dur=12.3, llm;dur=850.1;desc="x2", total;dur=1020.5"""
+        metrics = []
+        for name, item in self.summary().items():
+            metric = f"{name};dur={item['total_ms']}"
+            if item["count"] > 1:
+                metric += f';desc="x{item["count"]}"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={round(self.elapsed_ms(), 2)}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回完整的耗时明细，用于结构化日志与调试响应"""
+        return {"total_ms": round(self.elapsed_ms(), 2), "summary": self.summary(), "spans": list(self.spans)}
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """获取当前上下文的计时器，不在请求中时返回 None"""
+    return _current_timer.get()
+
+
+def span(name: str, **attrs: Any):
+    """在当前请求的计时器上统计代码块耗时，不在请求中时不做任何事"""
+    timer = _current_timer.get()
+    return timer.span(name, **attrs) if timer is not None else nullcontext(attrs)
+
+
+def record(name: str, duration_ms: float, **attrs: Any) -> None:
+    """在当前请求的计时器上记录一个刚结束的耗时片段，不在请求中时不做任何事"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(name, duration_ms, **attrs)
@@ -0,0 +1,11 @@
+# 导入 os 与 sys 模块，用于把 11_AgentAPIServer 目录加入模块搜索路径
+import os
+import sys
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 测试从 tests 目录运行时也能导入 utils 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,125 @@
+# 导入 asyncio，用于并发占用执行槽位
+import asyncio
+# 导入 pytest，用于断言拒绝异常
+import pytest
+# 导入被测试的准入控制器
+from utils import admission
+from utils.admission import AdmissionController, AdmissionRejected
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+async def hold(controller: AdmissionController, user_id: str, release: asyncio.Event, order: list = None) -> None:
+    """占用执行槽位直到 release 被设置，获得槽位时记录用户"""
+    async with controller.slot(user_id):
+        if order is not None:
+            order.append(user_id)
+        await release.wait()
+
+
+async def settle() -> None:
+    """让已创建的任务运行到各自的等待点"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_per_user_limit_returns_429():
+    async def main():
+        controller = AdmissionController(max_in_flight=4, max_queue=4, queue_timeout=1, max_per_user=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, "u1", release))
+        await settle()
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.slot("u1"):
+                pass
+        # 其他用户不受影响
+        async with controller.slot("u2"):
+            pass
+        release.set()
+        await holder
+        return controller, exc.value
+    controller, rejected = asyncio.run(main())
+    assert rejected.status_code == 429 and rejected.retry_after >= 1
+    assert controller.rejected_user_limit == 1 and controller.get_stats()["in_flight"] == 0
+
+
+def test_full_queue_returns_503():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=1, max_per_user=10)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(controller, user_id, release)) for user_id in ("u1", "u2")]
+        await settle()
+        assert controller.get_stats()["queued"] == 1
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.slot("u3"):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return controller, exc.value
+    controller, rejected = asyncio.run(main())
+    assert rejected.status_code == 503
+    assert controller.rejected_queue_full == 1 and controller.admitted == 2
+
+
+def test_queue_timeout_returns_503():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0.05, max_per_user=10)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, "u1", release))
+        await settle()
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.slot("u2"):
+                pass
+        # 超时的请求已移出队列，不占用用户计数
+        stats = controller.get_stats()
+        assert (stats["queued"], stats["active_users"]) == (0, 1)
+        release.set()
+        await holder
+        return controller, exc.value
+    controller, rejected = asyncio.run(main())
+    assert rejected.status_code == 503
+    assert controller.rejected_timeout == 1 and controller.get_stats()["in_flight"] == 0
+
+
+def test_timeout_racing_wake_releases_slot(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=1, max_per_user=10)
+
+    async def wake_then_timeout(awaitable, timeout):
+        # 等待超时的同时，前一个请求归还槽位并唤醒了本请求
+        controller._release("u1")
+        awaitable.cancel()
+        raise asyncio.TimeoutError
+    monkeypatch.setattr(admission.asyncio, "wait_for", wake_then_timeout)
+
+    async def main():
+        await controller._acquire("u1")
+        with pytest.raises(AdmissionRejected) as exc:
+            await controller._acquire("u2")
+        return exc.value
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 503
+    # 分配给本请求的槽位已经归还
+    stats = controller.get_stats()
+    assert (stats["in_flight"], stats["queued"], stats["active_users"]) == (0, 0, 0)
+
+
+def test_wake_next_round_robin_across_users():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, max_queue=10, queue_timeout=5, max_per_user=10)
+        order = []
+        releases = {}
+        tasks = []
+        # u1 先占用槽位并连续排入 3 个请求，随后 u2、u3 各排入 1 个请求
+        for user_id in ["u1", "u1", "u1", "u1", "u2", "u3"]:
+            releases[len(tasks)] = release = asyncio.Event()
+            tasks.append(asyncio.create_task(hold(controller, user_id, release, order)))
+            await settle()
+        for index in range(len(tasks)):
+            releases[index].set()
+            await settle()
+        await asyncio.gather(*tasks)
+        return order
+    # 槽位释放时按用户轮转，u2、u3 不必等 u1 的请求全部完成
+    assert asyncio.run(main()) == ["u1", "u1", "u2", "u3", "u1", "u1"]
@@ -0,0 +1,100 @@
+# 导入 asyncio，用于执行异步的 get_tools
+import asyncio
+# 导入 json，用于解析子进程输出的 MCP 工具 schema
+import json
+# 导入 os 与 sys，用于定位 MCP Server 目录与当前解释器
+import os
+import sys
+# 导入 subprocess，MCP Server 与 API 服务各自有名为 utils 的包，在子进程中读取其工具 schema
+import subprocess
+# 导入 SimpleNamespace，用于构造运行时上下文
+from types import SimpleNamespace
+# 导入 pytest，用于替换 MCP 客户端
+import pytest
+# 导入消息类型，用于构造模型输出
+from langchain_core.messages import AIMessage, HumanMessage
+# 导入内存存储，保存审计记录
+from langgraph.store.memory import InMemoryStore
+# 导入被测试的审批策略、中间件与默认规则
+from utils import hitl_policy
+from utils import tools as tools_module
+from utils.hitl_policy import HITLPolicy, PolicyHumanInTheLoopMiddleware
+from utils.tools import DEFAULT_POLICY_RULES
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# MCP Server 所在目录
+RAG_MCP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rag_mcp")
+
+
+def mcp_tool_args() -> dict:
+    """读取 rag_mcp_server.py 中 list_tools 声明的 inputSchema，返回 工具名 -> 参数名集合"""
+    script = ("import asyncio, json, rag_mcp_server; "
+              "print(json.dumps({t.name: list(t.inputSchema['properties']) for t in asyncio.run(rag_mcp_server.list_tools())}))")
+    result = subprocess.run([sys.executable, "-c", script], cwd=RAG_MCP_DIR, capture_output=True, text=True, check=True)
+    return {name: set(args) for name, args in json.loads(result.stdout.strip().splitlines()[-1]).items()}
+
+
+class _NoMCPClient:
+    """替代 MultiServerMCPClient：不连接 MCP Server，只返回本地定义的工具"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def get_tools(self):
+        return []
+
+
+@pytest.fixture(scope="module")
+def tool_args(tmp_path_factory) -> dict:
+    """真实工具 schema 中的参数名：本地工具取自 get_tools，MCP 工具取自 MCP Server 的 list_tools"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(tools_module, "MultiServerMCPClient", _NoMCPClient)
+        local_tools, _ = asyncio.run(tools_module.get_tools())
+    return {**{t.name: set(t.args) for t in local_tools}, **mcp_tool_args()}
+
+
+def test_default_rules_match_tool_schemas(tool_args):
+    for rule in DEFAULT_POLICY_RULES:
+        assert rule["tool"] in tool_args, f"规则 {rule['name']} 引用了不存在的工具 {rule['tool']}"
+        unknown = set(rule.get("args", {})) - tool_args[rule["tool"]]
+        assert not unknown, f"规则 {rule['name']} 的参数 {unknown} 不在工具 {rule['tool']} 的 schema 中"
+
+
+def test_oversized_query_is_rejected(tool_args):
+    policy = HITLPolicy(DEFAULT_POLICY_RULES)
+    assert "query_text" in tool_args["search_documents"]
+    decision = policy.evaluate("search_documents", {"query_text": "血" * 600}, "user_001")
+    assert decision["action"] == "reject"
+    assert decision["rule"] == "reject_oversized_query"
+    decision = policy.evaluate("search_documents", {"query_text": "血压偏高怎么办"}, "user_001")
+    assert decision["action"] == "approve"
+
+
+def _run_after_model(middleware, message, thread_id, store, monkeypatch):
+    """在指定会话中对一条 AIMessage 执行一次审批策略节点"""
+    monkeypatch.setattr(hitl_policy, "get_config", lambda: {"configurable": {"thread_id": thread_id}})
+    runtime = SimpleNamespace(context=SimpleNamespace(user_id="user_001"), store=store)
+    return asyncio.run(middleware.aafter_model({"messages": [HumanMessage("北京天气"), message]}, runtime))
+
+
+def test_audit_records_are_per_thread_and_message(monkeypatch):
+    store = InMemoryStore()
+    policy = HITLPolicy([{"name": "weather", "tool": "get_weather_for_location",
+                          "rate": {"max_calls": 1, "window_seconds": 60}, "action": "approve"}])
+    middleware = PolicyHumanInTheLoopMiddleware({"get_weather_for_location": True}, policy=policy)
+    # LLM 缓存在新会话中重放的 AIMessage：消息 ID 与工具调用 ID 都相同
+    message = AIMessage("", id="cached-ai", tool_calls=[{"name": "get_weather_for_location", "args": {"city": "北京"}, "id": "call_1"}])
+    assert _run_after_model(middleware, message, "thread_a", store, monkeypatch) is None
+    # 同一会话中同一条消息的重新执行（中断恢复）沿用已有决策，不重复计入频率限制
+    assert _run_after_model(middleware, message, "thread_a", store, monkeypatch) is None
+    assert len(asyncio.run(hitl_policy.list_audit_records(store, "user_001"))) == 1
+    # 其他会话中的相同工具调用重新决策：频率限制已用完，转人工审核并写入新的审计记录
+    with pytest.raises(RuntimeError):
+        # 转人工审核时调用 interrupt，在图外执行会抛出异常，此前策略决策已经写入
+        _run_after_model(middleware, message, "thread_b", store, monkeypatch)
+    records = asyncio.run(hitl_policy.list_audit_records(store, "user_001"))
+    assert sorted((record["thread_id"], record["action"]) for record in records) == [("thread_a", "approve"), ("thread_b", "escalate")]
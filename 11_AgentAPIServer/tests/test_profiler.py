@@ -0,0 +1,69 @@
+# 导入 asyncio，用于在标准事件循环中运行被采样的协程
+import asyncio
+# 导入 sys，用于读取事件循环线程的调用栈
+import sys
+# 导入 threading，用于后台采样线程
+import threading
+# 导入 time，用于制造 CPU 占用
+import time
+# 导入 pytest，用于参数化测试与跳过缺少依赖的用例
+import pytest
+# 导入被测试的调用栈提取函数
+from utils.profiler import _frame_stack
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 在事件循环线程中占用 CPU 的函数，采样结果中应能看到它
+def busy_loop(seconds: float) -> None:
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        pass
+
+
+async def workload() -> None:
+    for _ in range(20):
+        busy_loop(0.01)
+        await asyncio.sleep(0.005)
+
+
+def sample_loop(run) -> list:
+    """在后台线程中对事件循环线程采样，返回每次采样的调用栈"""
+    samples, stop = [], threading.Event()
+    loop_thread_id = threading.get_ident()
+
+    def sampler() -> None:
+        while not stop.is_set():
+            time.sleep(0.003)
+            samples.append(_frame_stack(sys._current_frames().get(loop_thread_id)))
+
+    switch_interval = sys.getswitchinterval()
+    # 缩短线程切换间隔，让采样线程能在 CPU 密集的回调中获得 GIL
+    sys.setswitchinterval(0.001)
+    thread = threading.Thread(target=sampler, daemon=True)
+    thread.start()
+    try:
+        run(workload())
+    finally:
+        stop.set()
+        thread.join()
+        sys.setswitchinterval(switch_interval)
+    return samples
+
+
+def _uvloop_run(coro) -> None:
+    uvloop = pytest.importorskip("uvloop")
+    uvloop.run(coro)
+
+
+@pytest.mark.parametrize("run", [asyncio.run, _uvloop_run], ids=["asyncio", "uvloop"])
+def test_frame_stack_captures_callbacks(run):
+    samples = sample_loop(run)
+    busy = [stack for stack in samples if any(name == "busy_loop" for _, name, _ in stack)]
+    # 一半左右的时间在执行 busy_loop，采样结果中必须能看到
+    assert len(busy) >= len(samples) // 4
+    for stack in busy:
+        # 调用栈从协程开始，不包含事件循环的调度代码
+        assert stack[0][1] == "workload"
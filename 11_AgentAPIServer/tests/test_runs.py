@@ -0,0 +1,232 @@
+# 导入 asyncio，用于执行异步的任务执行与恢复逻辑
+import asyncio
+# 导入 pytest，用于替换 agent_api 中的全局对象
+import pytest
+# 导入 create_agent 与人工审核中间件，用于构造带检查点的 Agent
+from langchain.agents import create_agent
+from langchain.agents.middleware import HumanInTheLoopMiddleware
+# 导入假模型、消息类型与工具装饰器，用于构造不调用真实大模型的 Agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+# 导入内存检查点，替代 PostgreSQL checkpointer
+from langgraph.checkpoint.memory import InMemorySaver
+# 导入被测试的 API 模块、任务 worker 池与会话进度读取函数
+import agent_api
+from utils.models import AgentResponse, Context
+from utils.runs import RunWorkerPool, checkpoint_progress
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+class FakeQueue:
+    """替代 RunQueue：记录 finish/retry 调用，续期结果由 lease_ok 控制"""
+
+    def __init__(self, lease_ok: bool = True):
+        self.lease_ok = lease_ok
+        self.calls = []
+
+    async def extend_lease(self, run_id, worker_id, lease_seconds):
+        return self.lease_ok
+
+    async def finish(self, run_id, worker_id, status, result=None, error=None):
+        self.calls.append(("finish", status, error))
+
+    async def retry(self, run_id, worker_id, error):
+        self.calls.append(("retry", error))
+
+
+def make_run(attempts: int = 1) -> dict:
+    return {"run_id": "r1", "kind": "ask", "thread_id": "t1", "attempts": attempts, "error": "ValueError: boom"}
+
+
+async def slow_execute(run):
+    await asyncio.sleep(1)
+    return {"status": "completed"}
+
+
+async def failing_execute(run):
+    raise ValueError("boom")
+
+
+def test_run_completed():
+    async def execute(run):
+        return {"status": "completed"}
+    queue = FakeQueue()
+    pool = RunWorkerPool(queue, execute, lease_seconds=60)
+    asyncio.run(pool._run("w1", make_run()))
+    assert queue.calls == [("finish", "completed", None)]
+    assert pool.get_stats()["completed"] == 1 and pool.running == 0
+
+
+def test_run_lease_lost_cancels_without_writing():
+    queue = FakeQueue(lease_ok=False)
+    pool = RunWorkerPool(queue, slow_execute, lease_seconds=0.03)
+    asyncio.run(pool._run("w1", make_run()))
+    # 租约已被其他 worker 接管：不写入结果，也不放回队列
+    assert queue.calls == []
+    assert pool.lease_lost == 1 and pool.running == 0
+
+
+def test_run_failure_is_retried():
+    queue = FakeQueue()
+    pool = RunWorkerPool(queue, failing_execute, max_attempts=3)
+    asyncio.run(pool._run("w1", make_run(attempts=1)))
+    assert queue.calls == [("retry", "ValueError: boom")]
+    assert pool.retried == 1 and pool.failed == 0
+
+
+def test_run_failure_on_last_attempt_is_failed():
+    queue = FakeQueue()
+    pool = RunWorkerPool(queue, failing_execute, max_attempts=3)
+    asyncio.run(pool._run("w1", make_run(attempts=3)))
+    assert queue.calls == [("finish", "failed", "ValueError: boom")]
+    assert pool.retried == 0 and pool.failed == 1
+
+
+def test_run_over_max_attempts_is_failed_without_executing():
+    executed = []
+
+    async def execute(run):
+        executed.append(run)
+        return {"status": "completed"}
+    queue = FakeQueue()
+    pool = RunWorkerPool(queue, execute, max_attempts=3)
+    asyncio.run(pool._run("w1", make_run(attempts=4)))
+    assert executed == []
+    assert queue.calls == [("finish", "failed", "超过最大重试次数，最后一次错误: ValueError: boom")]
+
+
+def test_run_shutdown_cancellation_propagates():
+    queue = FakeQueue()
+    pool = RunWorkerPool(queue, slow_execute, lease_seconds=60)
+
+    async def main():
+        task = asyncio.create_task(pool._run("w1", make_run()))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(main())
+    # 服务关闭时被取消：不更新任务状态，租约过期后由其他进程重新领取
+    assert queue.calls == []
+    assert pool.lease_lost == 0 and pool.running == 0
+
+
+@tool
+def send_email(to: str) -> str:
+    """发送邮件"""
+    return f"已发送给 {to}"
+
+
+class ToolChatModel(FakeMessagesListChatModel):
+    """支持 bind_tools 的假模型，首次调用可按 fail_first 抛出异常模拟进程中断"""
+    fail_first: bool = False
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, *args, **kwargs):
+        if self.fail_first:
+            self.fail_first = False
+            raise RuntimeError("worker crashed")
+        return super()._generate(*args, **kwargs)
+
+
+RUN = {"run_id": "R", "kind": "ask", "thread_id": "t", "user_id": "u", "attempts": 2,
+       "payload": {"user_id": "u", "thread_id": "t", "question": "new q"}}
+CONFIG = {"configurable": {"thread_id": "t", "user_id": "u"}}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """用内存检查点替换 agent_api 的 checkpointer，记录重新执行与重新提交决策的调用"""
+    saver = InMemorySaver()
+    calls = []
+
+    async def fake_handle_ask(request, agent=None, message_id=None):
+        calls.append(("ask", message_id))
+        return AgentResponse(status="completed", result="RERUN")
+
+    async def fake_handle_intervene(request):
+        calls.append(("intervene", request.decisions))
+        return AgentResponse(status="completed", result="RESUBMIT")
+    monkeypatch.setattr(agent_api, "checkpointer", saver)
+    monkeypatch.setattr(agent_api, "handle_ask", fake_handle_ask)
+    monkeypatch.setattr(agent_api, "handle_intervene", fake_handle_intervene)
+
+    def use_agent(model, **kwargs):
+        agent = create_agent(model, checkpointer=saver, context_schema=Context, **kwargs)
+
+        async def create_agent_instance():
+            return agent
+        monkeypatch.setattr(agent_api, "create_agent_instance", create_agent_instance)
+        return agent
+    return saver, calls, use_agent
+
+
+def ask(agent, content: str, message_id: str, **kwargs):
+    return asyncio.run(agent.ainvoke({"messages": [{"role": "user", "content": content, "id": message_id}]},
+                                     CONFIG, context=Context(user_id="u"), **kwargs))
+
+
+def test_resume_ask_without_progress_reruns(api):
+    saver, calls, use_agent = api
+    agent = use_agent(ToolChatModel(responses=[AIMessage("old answer")]))
+    ask(agent, "old q", "old")
+    baseline = asyncio.run(checkpoint_progress(saver, "t"))["checkpoint_id"]
+    # 没有记录执行前的 checkpoint
+    assert asyncio.run(agent_api.resume_run({**RUN, "checkpoint_id": None})).result == "RERUN"
+    # 会话 checkpoint 未变化
+    assert asyncio.run(agent_api.resume_run({**RUN, "checkpoint_id": baseline})).result == "RERUN"
+    assert calls == [("ask", "run-R-2"), ("ask", "run-R-2")]
+
+
+def test_resume_ask_reruns_when_progress_is_another_turn(api):
+    saver, calls, use_agent = api
+    agent = use_agent(ToolChatModel(responses=[AIMessage("old answer")]))
+    ask(agent, "old q", "old")
+    # checkpoint 已变化，但最新的用户消息来自之前的任务
+    assert asyncio.run(agent_api.resume_run({**RUN, "checkpoint_id": "stale"})).result == "RERUN"
+    assert calls == [("ask", "run-R-2")]
+
+
+def test_resume_ask_returns_finished_turn(api):
+    saver, calls, use_agent = api
+    agent = use_agent(ToolChatModel(responses=[AIMessage("new answer")]))
+    ask(agent, "new q", "run-R-1")
+    # 上一次执行已经完成，只是结果未写回任务表
+    response = asyncio.run(agent_api.resume_run({**RUN, "checkpoint_id": "stale"}))
+    assert (response.status, response.result) == ("completed", "new answer")
+    assert calls == []
+
+
+def test_resume_continues_from_checkpoint(api):
+    saver, calls, use_agent = api
+    agent = use_agent(ToolChatModel(responses=[AIMessage("new answer")], fail_first=True))
+    with pytest.raises(RuntimeError):
+        ask(agent, "new q", "run-R-1")
+    assert asyncio.run(agent.aget_state(CONFIG)).next
+    response = asyncio.run(agent_api.resume_run({**RUN, "checkpoint_id": "stale"}))
+    assert (response.status, response.result) == ("completed", "new answer")
+    assert calls == []
+
+
+def test_resume_interrupted_run(api):
+    saver, calls, use_agent = api
+    tool_call = AIMessage("", tool_calls=[{"name": "send_email", "args": {"to": "a@b.c"}, "id": "call_1"}])
+    agent = use_agent(ToolChatModel(responses=[tool_call]), tools=[send_email],
+                      middleware=[HumanInTheLoopMiddleware(interrupt_on={"send_email": True})])
+    ask(agent, "new q", "run-R-1")
+    # 提问任务已经执行到人工审核节点
+    response = asyncio.run(agent_api.resume_run({**RUN, "checkpoint_id": "stale"}))
+    assert response.status == "interrupted"
+    assert response.interrupt_details["action_requests"][0]["name"] == "send_email"
+    # 人工决策任务的决策尚未生效，重新提交决策
+    decisions = [{"type": "approve"}]
+    intervene = {**RUN, "kind": "intervene", "checkpoint_id": None,
+                 "payload": {"user_id": "u", "thread_id": "t", "decisions": decisions}}
+    assert asyncio.run(agent_api.resume_run(intervene)).result == "RESUBMIT"
+    assert calls == [("intervene", decisions)]
@@ -0,0 +1,65 @@
+# 导入 asyncio，用于执行异步的后台摘要任务
+import asyncio
+# 导入 pytest，用于参数化测试
+import pytest
+# 导入假模型与消息类型，用于构造会话与摘要模型
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+# 导入被测试的后台摘要中间件
+from utils import summarization
+from utils.summarization import BackgroundSummarizationMiddleware
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+MESSAGES = [HumanMessage("a", id="1"), AIMessage("b", id="2"), HumanMessage("c", id="3")]
+
+
+# 调用即失败的摘要模型
+class FailingChatModel(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        raise RuntimeError("provider down")
+
+
+def make_middleware(model) -> BackgroundSummarizationMiddleware:
+    return BackgroundSummarizationMiddleware(model=model, trigger=("messages", 4), keep=("messages", 1))
+
+
+def precompute(middleware: BackgroundSummarizationMiddleware, is_async: bool) -> None:
+    summarization._inflight_tasks["thread"] = object()
+    if is_async:
+        asyncio.run(middleware._aprecompute("thread", None, MESSAGES))
+    else:
+        middleware._precompute("thread", None, MESSAGES)
+
+
+@pytest.fixture(autouse=True)
+def clear_local_summaries():
+    summarization._local_summaries.clear()
+    yield
+    summarization._local_summaries.clear()
+
+
+@pytest.mark.parametrize("is_async", [True, False], ids=["async", "sync"])
+@pytest.mark.parametrize("case", ["model_error", "empty_reply", "trimmed_away"])
+def test_failed_summary_is_not_stored(monkeypatch, case, is_async):
+    if case == "model_error":
+        middleware = make_middleware(FailingChatModel(responses=["unused"]))
+    else:
+        middleware = make_middleware(FakeListChatModel(responses=["  " if case == "empty_reply" else "summary"]))
+    if case == "trimmed_away":
+        # 父类在裁剪后没有消息时返回 "Previous conversation was too long to summarize."
+        monkeypatch.setattr(middleware, "_trim_messages_for_summary", lambda messages: [])
+    precompute(middleware, is_async)
+    # 失败的摘要不会写入，后台任务槽位已释放，下一轮可以重新预计算
+    assert summarization._local_summaries == {}
+    assert "thread" not in summarization._inflight_tasks
+
+
+@pytest.mark.parametrize("is_async", [True, False], ids=["async", "sync"])
+def test_summary_is_stored(is_async):
+    precompute(make_middleware(FakeListChatModel(responses=["summary"])), is_async)
+    assert summarization._local_summaries["thread"]["summary"] == "summary"
+    assert summarization._local_summaries["thread"]["cutoff_id"] == "3"
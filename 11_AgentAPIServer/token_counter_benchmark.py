@@ -0,0 +1,78 @@
+# 导入 time 模块，用于统计耗时
+import time
+# 导入 uuid 模块，用于为模拟消息生成唯一 ID
+import uuid
+# 导入 argparse 模块，用于解析命令行参数
+import argparse
+# 导入 LangChain 消息类型，用于构造模拟的长会话
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, messages_from_dict, messages_to_dict
+# 导入默认的近似 token 计数函数，作为对照组
+from langchain_core.messages.utils import count_tokens_approximately
+# 导入带缓存的 token 计数器
+from utils.token_counter import CachedTokenCounter
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 构造一轮对话：用户提问 -> 模型发起工具调用 -> 工具返回 -> 模型回答
+def build_turn(turn: int, payload_chars: int) -> list:
+    # 工具调用 ID
+    call_id = f"call_{turn}"
+    return [
+        HumanMessage(id=str(uuid.uuid4()), content=f"第{turn}轮问题：搜索关于多模态大模型持续学习系列研究的文章"),
+        AIMessage(id=str(uuid.uuid4()), content="", tool_calls=[{"name": "search_documents", "args": {"query_text": "多模态大模型"}, "id": call_id}]),
+        ToolMessage(id=str(uuid.uuid4()), content="文章内容片段：" + "检" * payload_chars, tool_call_id=call_id),
+        AIMessage(id=str(uuid.uuid4()), content=f"第{turn}轮回答：" + "答" * (payload_chars // 4)),
+    ]
+
+
+# 模拟一个长会话中每轮调用模型前的 token 统计，返回总耗时（秒）
+def simulate(counter, turns: int, payload_chars: int, summarize_every: int, restore_every: int) -> float:
+    # 当前会话的消息列表
+    messages = []
+    # 累计耗时
+    elapsed = 0.0
+    for turn in range(1, turns + 1):
+        # 追加本轮新消息
+        messages.extend(build_turn(turn, payload_chars))
+        # 模拟从 checkpointer 恢复历史：消息对象被重新反序列化，但 ID 保持不变
+        if restore_every and turn % restore_every == 0:
+            messages = messages_from_dict(messages_to_dict(messages))
+        # 模拟摘要：历史被替换为一条摘要消息 + 最近 3 条消息
+        if summarize_every and turn % summarize_every == 0:
+            summary = HumanMessage(id=str(uuid.uuid4()), content="Here is a summary of the conversation to date:\n\n" + "摘" * 500)
+            messages = [summary] + messages[-3:]
+        # 每轮模型调用前（包括工具调用后的再次调用）都会统计两次 token
+        for _ in range(2):
+            start = time.perf_counter()
+            counter(messages)
+            elapsed += time.perf_counter() - start
+    return elapsed
+
+
+# 主程序入口
+if __name__ == "__main__":
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description="SummarizationMiddleware token 计数缓存基准测试")
+    parser.add_argument("--turns", type=int, default=200, help="会话轮数")
+    parser.add_argument("--payload-chars", type=int, default=2000, help="每次工具返回内容的字符数")
+    parser.add_argument("--summarize-every", type=int, default=0, help="每隔多少轮模拟一次摘要，0 表示不摘要（模拟未达阈值的长会话）")
+    parser.add_argument("--restore-every", type=int, default=1, help="每隔多少轮模拟一次从 checkpointer 恢复历史")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"会话轮数: {args.turns}  工具返回字符数: {args.payload_chars}  摘要间隔: {args.summarize_every}  恢复间隔: {args.restore_every}")
+    print("-" * 70)
+
+    # 对照组：每次都对全部历史重新计数
+    baseline = simulate(count_tokens_approximately, args.turns, args.payload_chars, args.summarize_every, args.restore_every)
+    print(f"count_tokens_approximately 总耗时: {baseline * 1000:.2f} ms")
+
+    # 实验组：带缓存的计数器
+    cached_counter = CachedTokenCounter()
+    cached = simulate(cached_counter, args.turns, args.payload_chars, args.summarize_every, args.restore_every)
+    print(f"CachedTokenCounter 总耗时:        {cached * 1000:.2f} ms")
+    print(f"加速比: {baseline / cached:.1f}x" if cached else "加速比: N/A")
+    print(f"缓存统计: {cached_counter.get_stats()}")
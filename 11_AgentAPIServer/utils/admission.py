@@ -0,0 +1,207 @@
+# 导入 asyncio，用于实现请求排队与等待超时
+import asyncio
+# 导入 math 模块，用于计算 Retry-After 秒数
+import math
+# 导入 time 模块，用于统计请求处理耗时
+import time
+# 导入有序字典与双端队列，用于按用户轮转出队
+from collections import OrderedDict, deque
+# 导入异步上下文管理器装饰器
+from contextlib import asynccontextmanager
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+# 从当前包中导入 Config 配置类，用于读取准入控制配置
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+# 从当前包中导入 record，用于把排队等待时间记入当前请求的耗时明细
+from .timing import record
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+
+# 定义准入拒绝异常，由 API 层转换为 429/503 响应
+class AdmissionRejected(Exception):
+
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        # HTTP 状态码：429 表示该用户超出配额，503 表示服务整体饱和
+        self.status_code = status_code
+        # 建议客户端重试的等待时间（秒）
+        self.retry_after = retry_after
+        # 拒绝原因
+        self.reason = reason
+
+
+# 定义准入控制器：限制单个 worker 同时处理的请求数，超出部分短暂排队，排不上或等待超时则快速拒绝
+class AdmissionController:
+    """
+    请求准入控制（单个 worker 进程内生效，基于 asyncio 单线程调度，无需加锁）：
+
+      - 同时处理的请求数不超过 max_in_flight，被接纳的请求不会因为过载而互相拖慢
+      - 超出部分进入有界队列，等待超过 queue_timeout 秒仍未获得执行槽位则返回 503
+      - 队列已满时直接返回 503；单个用户处理中与排队中的请求合计超过 max_per_user 时返回 429
+      - 执行槽位释放时按用户轮转出队，请求量大的用户不会饿死其他用户
+      - Retry-After 根据平均处理耗时与当前排队长度估算
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float, max_per_user: int):
+        # 同时处理的最大请求数
+        self.max_in_flight = max_in_flight
+        # 排队请求的最大数量
+        self.max_queue = max_queue
+        # 排队的最长等待时间（秒）
+        self.queue_timeout = queue_timeout
+        # 单个用户处理中与排队中的请求合计上限
+        self.max_per_user = max_per_user
+        # 当前处理中的请求数
+        self._in_flight = 0
+        # 当前排队中的请求数
+        self._queued = 0
+        # user_id -> 该用户处理中与排队中的请求数
+        self._per_user: Dict[str, int] = {}
+        # user_id -> 该用户的等待队列（按用户到达顺序轮转）
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # 请求处理耗时的指数移动平均（秒），用于估算 Retry-After
+        self._avg_service_time = 1.0
+        # 统计信息
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected_user_limit = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def retry_after(self) -> int:
+        """估算排在当前队尾的请求需要等待的时间（秒）"""
+        return max(1, math.ceil(self._avg_service_time * (self._queued + 1) / self.max_in_flight))
+
+    def _reject(self, status_code: int, reason: str, user_id: str) -> AdmissionRejected:
+        retry_after = self.retry_after()
+        logger.warning(f"请求被准入控制拒绝，用户ID: {user_id} 原因: {reason} 处理中: {self._in_flight} 排队中: {self._queued} Retry-After: {retry_after}")
+        return AdmissionRejected(status_code, retry_after, reason)
+
+    def _wake_next(self) -> None:
+        """有空闲槽位时，按用户轮转唤醒等待中的请求"""
+        while self._in_flight < self.max_in_flight and self._waiters:
+            user_id, waiters = next(iter(self._waiters.items()))
+            # 本轮已服务该用户，移到队尾
+            self._waiters.move_to_end(user_id)
+            future = waiters.popleft()
+            if not waiters:
+                del self._waiters[user_id]
+            self._queued -= 1
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _remove_waiter(self, user_id: str, future: asyncio.Future) -> None:
+        """从等待队列中移除超时或被取消的请求"""
+        waiters = self._waiters.get(user_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[user_id]
+
+    def _release(self, user_id: str) -> None:
+        """归还执行槽位"""
+        self._in_flight -= 1
+        self._leave(user_id)
+        self._wake_next()
+
+    def _leave(self, user_id: str) -> None:
+        """减少用户的请求计数"""
+        self._per_user[user_id] -= 1
+        if self._per_user[user_id] <= 0:
+            del self._per_user[user_id]
+
+    async def _acquire(self, user_id: str) -> None:
+        """获取执行槽位，必要时排队，失败时抛出 AdmissionRejected"""
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            self.rejected_user_limit += 1
+            raise self._reject(429, "该用户的并发请求过多", user_id)
+        # 有空闲槽位且没有人排队时直接执行
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            return
+        if self._queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise self._reject(503, "服务繁忙，等待队列已满", user_id)
+        # 进入该用户的等待队列
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_id, deque()).append(future)
+        self._queued += 1
+        self.queued_total += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # 超时与唤醒同时发生：槽位已经分配给本请求，需要归还
+                self._release(user_id)
+            else:
+                future.cancel()
+                self._remove_waiter(user_id, future)
+                self._leave(user_id)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            raise self._reject(503, "服务繁忙，排队等待超时", user_id)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str) -> AsyncIterator[None]:
+        """占用一个执行槽位，退出时归还"""
+        queued_at = time.monotonic()
+        await self._acquire(user_id)
+        self.admitted += 1
+        start = time.monotonic()
+        record("admission_wait", (start - queued_at) * 1000)
+        try:
+            yield
+        finally:
+            # 更新平均处理耗时
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * (time.monotonic() - start)
+            self._release(user_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回准入控制的运行指标"""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "max_per_user": self.max_per_user,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "active_users": len(self._per_user),
+            "avg_service_time_s": round(self._avg_service_time, 3),
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected_user_limit": self.rejected_user_limit,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+# 进程内共享的准入控制器实例
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """获取进程内共享的准入控制器，未启用时返回 None"""
+    global _admission
+    if not Config.ADMISSION_ENABLED:
+        return None
+    if _admission is None:
+        _admission = AdmissionController(
+            max_in_flight=Config.ADMISSION_MAX_IN_FLIGHT,
+            max_queue=Config.ADMISSION_MAX_QUEUE,
+            queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT,
+            max_per_user=Config.ADMISSION_MAX_PER_USER
+        )
+        logger.info(f"准入控制已启用，最大并发: {Config.ADMISSION_MAX_IN_FLIGHT} 队列长度: {Config.ADMISSION_MAX_QUEUE} 排队超时: {Config.ADMISSION_QUEUE_TIMEOUT} 秒 单用户上限: {Config.ADMISSION_MAX_PER_USER}")
+    return _admission
@@ -0,0 +1,161 @@
+# 导入 time 模块，用于统计连接池运行时长
+import time
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Dict, Any, Optional, Tuple
+# 导入异步 PostgreSQL 连接池
+from psycopg_pool import AsyncConnectionPool
+# 导入异步 PostgreSQL 检查点保存器，用于派生带耗时统计的 checkpointer
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+# 从当前包中导入 Config 配置类，用于读取数据库连接与连接池配置
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+# 从当前包中导入 span，用于把 checkpoint 读写耗时记入当前请求的耗时明细
+from .timing import span
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例，用于记录连接池创建、关闭等信息
+logger = LoggerManager.get_logger()
+
+
+# 定义数据库连接池管理器类，为 checkpointer 与 store 分别维护独立的连接池
+class PoolManager:
+    """数据库连接池管理器，按 worker 数自动计算连接池大小并提供连接池运行指标"""
+
+    def __init__(self, workers: Optional[int] = None):
+        # 当前部署的 worker 进程数，未指定时从配置中读取
+        self.workers = max(1, workers or Config.API_WORKERS)
+        # checkpointer 专用连接池
+        self.checkpointer_pool: Optional[AsyncConnectionPool] = None
+        # store 专用连接池
+        self.store_pool: Optional[AsyncConnectionPool] = None
+        # 记录连接池打开的时间点，用于计算运行时长
+        self._opened_at: Optional[float] = None
+
+    def pool_sizes(self) -> Dict[str, Tuple[int, int]]:
+        """根据连接总配额和 worker 数计算每个连接池的 (min_size, max_size)"""
+        # 单个 worker 进程可使用的连接配额
+        per_worker = max(2 * Config.POOL_MIN_SIZE, Config.DB_MAX_CONNECTIONS // self.workers)
+        # checkpointer 连接池的最大连接数
+        checkpointer_max = max(Config.POOL_MIN_SIZE, int(per_worker * Config.CHECKPOINTER_POOL_SHARE))
+        # store 连接池使用剩余的连接配额
+        store_max = max(Config.POOL_MIN_SIZE, per_worker - checkpointer_max)
+        # checkpointer 预热一半的连接以应对突发流量，store 访问较少只保留配置下限
+        return {
+            "checkpointer": (min(checkpointer_max, max(Config.POOL_MIN_SIZE, checkpointer_max // 2)), checkpointer_max),
+            "store": (min(store_max, Config.POOL_MIN_SIZE), store_max),
+        }
+
+    def _connection_kwargs(self) -> Dict[str, Any]:
+        """构造连接参数：启用自动提交，并在安全时启用服务端预处理语句"""
+        # 经过 PgBouncer 事务级连接池时，预处理语句会落在不同的后端连接上，必须禁用（None 表示禁用）
+        prepare_threshold = None if Config.DB_BEHIND_PGBOUNCER else Config.DB_PREPARE_THRESHOLD
+        return {"autocommit": True, "prepare_threshold": prepare_threshold}
+
+    def _create_pool(self, name: str, min_size: int, max_size: int) -> AsyncConnectionPool:
+        """创建一个命名的异步连接池（暂不打开）"""
+        return AsyncConnectionPool(
+            # 数据库连接字符串，从配置读取
+            conninfo=Config.DB_URI,
+            # 连接池最小连接数
+            min_size=min_size,
+            # 连接池最大连接数
+            max_size=max_size,
+            # 连接池名称，便于在日志和指标中区分
+            name=name,
+            # 获取连接的最长等待时间
+            timeout=Config.POOL_TIMEOUT,
+            # 等待队列最大长度
+            max_waiting=Config.POOL_MAX_WAITING,
+            # 连接参数
+            kwargs=self._connection_kwargs(),
+            # 启动时不立即打开（稍后手动打开）
+            open=False
+        )
+
+    async def open(self) -> None:
+        """创建并打开 checkpointer 与 store 两个连接池"""
+        # 计算两个连接池的大小
+        sizes = self.pool_sizes()
+        # 创建 checkpointer 连接池
+        self.checkpointer_pool = self._create_pool("checkpointer", *sizes["checkpointer"])
+        # 创建 store 连接池
+        self.store_pool = self._create_pool("store", *sizes["store"])
+        # 显式打开连接池，并等待最小连接数建立完成
+        await self.checkpointer_pool.open(wait=True)
+        await self.store_pool.open(wait=True)
+        # 记录打开时间
+        self._opened_at = time.monotonic()
+        # 记录连接池大小日志
+        logger.info(f"数据库连接池已打开，worker数: {self.workers}，checkpointer(min,max)={sizes['checkpointer']}，store(min,max)={sizes['store']}，预处理语句阈值: {self._connection_kwargs()['prepare_threshold']}")
+
+    async def close(self) -> None:
+        """关闭所有连接池"""
+        for pool in (self.checkpointer_pool, self.store_pool):
+            # 如果连接池存在，则关闭它
+            if pool is not None:
+                await pool.close()
+        # 记录连接池关闭日志
+        logger.info("数据库连接池已关闭")
+
+    @staticmethod
+    def _pool_stats(pool: AsyncConnectionPool) -> Dict[str, Any]:
+        """整理单个连接池的运行指标：等待时间、借出时长与饱和度"""
+        # psycopg_pool 提供的累计统计数据
+        stats = pool.get_stats()
+        # 累计的取连接请求数
+        requests_num = stats.get("requests_num", 0)
+        # 当前连接池中已建立的连接数与空闲连接数
+        pool_size = stats.get("pool_size", 0)
+        pool_available = stats.get("pool_available", 0)
+        # 当前被借出的连接数
+        in_use = max(0, pool_size - pool_available)
+        return {
+            "pool_min": stats.get("pool_min", pool.min_size),
+            "pool_max": stats.get("pool_max", pool.max_size),
+            "pool_size": pool_size,
+            "pool_available": pool_available,
+            "in_use": in_use,
+            # 饱和度：借出连接数占最大连接数的比例，接近 1 表示连接池成为瓶颈
+            "saturation": round(in_use / pool.max_size, 4) if pool.max_size else 0.0,
+            # 正在排队等待连接的请求数
+            "requests_waiting": stats.get("requests_waiting", 0),
+            "requests_num": requests_num,
+            # 需要排队才拿到连接的请求数
+            "requests_queued": stats.get("requests_queued", 0),
+            # 获取连接失败（包括等待超时）的请求数
+            "requests_errors": stats.get("requests_errors", 0),
+            # 平均等待时间（毫秒）
+            "avg_wait_ms": round(stats.get("requests_wait_ms", 0) / requests_num, 3) if requests_num else 0.0,
+            # 平均借出时长（毫秒），即单次使用连接的时间
+            "avg_checkout_ms": round(stats.get("usage_ms", 0) / requests_num, 3) if requests_num else 0.0,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回所有连接池的运行指标"""
+        return {
+            "workers": self.workers,
+            "uptime_seconds": round(time.monotonic() - self._opened_at, 1) if self._opened_at else 0.0,
+            "checkpointer": self._pool_stats(self.checkpointer_pool) if self.checkpointer_pool else {},
+            "store": self._pool_stats(self.store_pool) if self.store_pool else {},
+        }
+
+
+# 定义带耗时统计的检查点保存器：checkpoint 的每次读写都记入当前请求的耗时明细
+class TimedPostgresSaver(AsyncPostgresSaver):
+
+    async def aget_tuple(self, config):
+        with span("checkpoint_read"):
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with span("checkpoint_write"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with span("checkpoint_write"):
+            return await super().aput_writes(config, writes, task_id, task_path)
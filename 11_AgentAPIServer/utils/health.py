@@ -0,0 +1,66 @@
+# 导入 asyncio，用于为依赖检查设置超时与重试间隔
+import asyncio
+# 导入 time 模块，用于统计检查耗时
+import time
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Optional
+# 导入 httpx，用于探测 MCP Server 是否可达
+import httpx
+# 从当前包中导入 Config 配置类，用于读取 MCP 地址与超时配置
+from .config import Config
+# 从当前包中导入 PoolManager，用于借用连接检查 PostgreSQL
+from .db import PoolManager
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+
+async def check_postgres(pool_manager: Optional[PoolManager]) -> Dict[str, Any]:
+    """从 checkpointer 与 store 连接池各借用一个连接执行 SELECT 1"""
+    start = time.perf_counter()
+    try:
+        if pool_manager is None or pool_manager.checkpointer_pool is None:
+            raise RuntimeError("连接池尚未初始化")
+        for pool in (pool_manager.checkpointer_pool, pool_manager.store_pool):
+            async with pool.connection(timeout=Config.READY_CHECK_TIMEOUT) as conn:
+                await conn.execute("SELECT 1")
+        return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+async def check_mcp() -> Dict[str, Any]:
+    """探测 MCP Server：能收到 HTTP 响应（非 5xx）即认为可达，不建立 MCP 会话"""
+    start = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=Config.READY_CHECK_TIMEOUT) as client:
+            response = await client.get(Config.MCP_SERVER_URL, headers={"Accept": "text/event-stream"})
+        if response.status_code >= 500:
+            return {"ok": False, "error": f"HTTP {response.status_code}"}
+        return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+async def check_readiness(pool_manager: Optional[PoolManager]) -> Dict[str, Any]:
+    """并发检查全部依赖，返回总体状态与各项检查结果"""
+    postgres, mcp = await asyncio.gather(check_postgres(pool_manager), check_mcp())
+    return {"ready": postgres["ok"] and mcp["ok"], "checks": {"postgres": postgres, "mcp": mcp}}
+
+
+async def wait_until_ready(pool_manager: Optional[PoolManager], timeout: float, interval: float = 1.0) -> Dict[str, Any]:
+    """worker 启动时等待依赖就绪，超时后返回最后一次检查结果"""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = await check_readiness(pool_manager)
+        if result["ready"] or time.monotonic() >= deadline:
+            return result
+        logger.info(f"等待依赖服务就绪: {result['checks']}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,381 @@
+# 导入 asyncio，用于并发读取多个工具调用的审计记录
+import asyncio
+# 导入 hashlib，用于在工具调用没有 ID 时按工具名与参数生成审计记录的键
+import hashlib
+# 导入 json 模块，用于读取策略规则文件并把非字符串参数转换为文本匹配
+import json
+# 导入 re 模块，用于按正则表达式匹配工具参数
+import re
+# 导入 threading，用于保护频率限制窗口与进程内审计记录
+import threading
+# 导入 time 模块，用于频率限制计时与记录决策时间
+import time
+# 导入有序字典与双端队列：进程内审计记录按写入顺序淘汰，频率限制使用滑动时间窗口
+from collections import OrderedDict, deque
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, List, Optional, Tuple
+# 导入 LangChain 人工介入中间件，带审批策略的中间件在其基础上扩展
+from langchain.agents.middleware import HumanInTheLoopMiddleware
+from langchain.agents.middleware.human_in_the_loop import Decision, HITLRequest, InterruptOnConfig
+from langchain.agents.middleware.types import AgentState
+# 导入消息类型：从最后一条 AIMessage 中读取工具调用，自动拒绝时以 ToolMessage 把结果返回给模型
+from langchain_core.messages import AIMessage, ToolCall, ToolMessage
+# 导入 get_config，用于在中间件中读取当前运行的 thread_id
+from langgraph.config import get_config
+# 导入 Runtime，表示运行时上下文（包含 context 与 store）
+from langgraph.runtime import Runtime
+# 导入键值存储基类
+from langgraph.store.base import BaseStore
+# 导入 interrupt，用于对转人工审核的工具调用发起中断
+from langgraph.types import interrupt
+# 从当前包中导入 LoggerManager 与 current_request_id，审计记录附带请求ID
+from .logger import LoggerManager, current_request_id
+# 从当前包中导入审批决策的 Prometheus 指标
+from .metrics import HITL_DECISIONS
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+# 审计记录在 store 中的命名空间前缀，完整命名空间为 ("hitl_audit", user_id)，键为工具调用ID
+AUDIT_NAMESPACE = "hitl_audit"
+# 策略支持的处理方式
+POLICY_ACTIONS = ("approve", "reject", "escalate")
+
+# 各规则按用户统计的自动同意时间窗口（(规则名, user_id) -> 时间戳队列），Agent 实例按请求创建，因此放在模块级别共享
+_rate_windows: Dict[Tuple[str, str], deque] = {}
+# 保护 _rate_windows 的锁
+_rate_lock = threading.Lock()
+# 没有配置 store 时使用的进程内兜底审计记录（"user_id/记录键" -> 审计记录），超过上限时淘汰最早的记录
+_local_audit: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_LOCAL_AUDIT_MAX = 10000
+# 保护 _local_audit 的锁
+_audit_lock = threading.Lock()
+
+
+def load_policy_rules(path: str) -> List[Dict[str, Any]]:
+    """从 JSON 文件读取策略规则列表"""
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError(f"审批策略规则文件必须是 JSON 数组: {path}")
+    return rules
+
+
+# 定义工具调用审批策略
+class HITLPolicy:
+    """
+    工具调用审批策略：按顺序匹配规则，第一条匹配的规则决定处理方式，没有规则匹配时使用 default_action
+
+      - name：规则名称，记录在审计记录中
+      - tool：适用的工具名（字符串或列表，"*" 表示全部工具）
+      - users：适用的用户ID列表（可选）
+      - args：参数名 -> 正则表达式（可选），全部参数都匹配时规则才生效，非字符串参数转换为 JSON 文本后匹配
+      - rate：{"max_calls": N, "window_seconds": S}（可选，仅用于 approve 规则），每个用户在时间窗口内最多自动同意 N 次，
+        超出后转人工审核（计数在 worker 进程内统计）
+      - action：approve（自动同意）、reject（自动拒绝，message 作为工具结果返回给模型）或 escalate（转人工审核）
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], default_action: str = "escalate"):
+        if default_action not in POLICY_ACTIONS:
+            raise ValueError(f"无效的默认审批方式: {default_action}")
+        self.default_action = default_action
+        # 预编译参数正则，规则配置错误时在启动阶段暴露
+        self.rules = []
+        for index, rule in enumerate(rules):
+            if rule.get("action") not in POLICY_ACTIONS:
+                raise ValueError(f"审批策略规则 {rule.get('name', index)} 的 action 无效: {rule.get('action')}")
+            tools = rule.get("tool", "*")
+            self.rules.append({
+                **rule,
+                "name": rule.get("name", f"rule_{index}"),
+                "tools": [tools] if isinstance(tools, str) else list(tools),
+                "args": {name: re.compile(pattern) for name, pattern in (rule.get("args") or {}).items()},
+            })
+
+    @staticmethod
+    def _arg_text(value: Any) -> str:
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+    def _matches(self, rule: Dict[str, Any], tool_name: str, args: Dict[str, Any], user_id: str) -> bool:
+        """判断规则是否适用于本次工具调用"""
+        if "*" not in rule["tools"] and tool_name not in rule["tools"]:
+            return False
+        if rule.get("users") and user_id not in rule["users"]:
+            return False
+        for name, pattern in rule["args"].items():
+            if name not in args or not pattern.search(self._arg_text(args[name])):
+                return False
+        return True
+
+    @staticmethod
+    def _take_rate(rule: Dict[str, Any], user_id: str) -> bool:
+        """未超过规则的频率限制时记录一次自动同意并返回 True"""
+        rate = rule.get("rate")
+        if not rate:
+            return True
+        now = time.monotonic()
+        with _rate_lock:
+            window = _rate_windows.setdefault((rule["name"], user_id), deque())
+            # 移除滑出时间窗口的记录
+            while window and window[0] <= now - rate["window_seconds"]:
+                window.popleft()
+            if len(window) >= rate["max_calls"]:
+                return False
+            window.append(now)
+            # 用户数较多时清理已经为空的窗口，避免字典无限增长
+            if len(_rate_windows) > _LOCAL_AUDIT_MAX:
+                for key in [key for key, value in _rate_windows.items() if not value]:
+                    del _rate_windows[key]
+            return True
+
+    def evaluate(self, tool_name: str, args: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        """返回本次工具调用的处理方式、命中的规则与原因"""
+        for rule in self.rules:
+            if not self._matches(rule, tool_name, args, user_id):
+                continue
+            if rule["action"] == "approve" and not self._take_rate(rule, user_id):
+                rate = rule["rate"]
+                return {"action": "escalate", "rule": rule["name"],
+                        "reason": f"超过频率限制（{rate['window_seconds']} 秒内最多自动同意 {rate['max_calls']} 次）"}
+            return {"action": rule["action"], "rule": rule["name"], "reason": rule.get("message", "")}
+        return {"action": self.default_action, "rule": None, "reason": "没有匹配的规则"}
+
+
+def _record_key(tool_call: ToolCall, message: AIMessage, thread_id: Optional[str]) -> str:
+    """
+    审计记录的键：由会话ID、AIMessage ID 与工具调用ID（没有 ID 时为工具名与参数）共同生成。
+    工具调用ID 本身会重复（例如 LLM 缓存在新会话中重放相同的 AIMessage），只有同一会话中同一条 AIMessage 的重新执行
+    （中断恢复）才会读到已有的决策，其他调用都重新决策并写入新的审计记录
+    """
+    call = tool_call.get("id") or [tool_call["name"], tool_call["args"]]
+    text = json.dumps([thread_id, message.id, call], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def _local_get(user_id: str, key: str) -> Optional[Dict[str, Any]]:
+    with _audit_lock:
+        return _local_audit.get(f"{user_id}/{key}")
+
+
+def _local_put(user_id: str, key: str, record: Dict[str, Any]) -> None:
+    with _audit_lock:
+        _local_audit[f"{user_id}/{key}"] = record
+        while len(_local_audit) > _LOCAL_AUDIT_MAX:
+            _local_audit.popitem(last=False)
+
+
+async def list_audit_records(store: Optional[BaseStore], user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """读取指定用户的审计记录，按决策时间倒序返回"""
+    if store is not None:
+        items = await store.asearch((AUDIT_NAMESPACE, user_id), limit=limit)
+        records = [{"key": item.key, **item.value} for item in items]
+    else:
+        prefix = f"{user_id}/"
+        with _audit_lock:
+            records = [{"key": key[len(prefix):], **value} for key, value in _local_audit.items() if key.startswith(prefix)]
+    records.sort(key=lambda record: record.get("decided_at", 0), reverse=True)
+    return records[:limit]
+
+
+# 定义带审批策略的人工介入中间件：安全的工具调用由策略自动放行，只有需要人工判断的调用才会中断
+class PolicyHumanInTheLoopMiddleware(HumanInTheLoopMiddleware):
+    """
+    带审批策略的人工介入中间件：
+
+      - interrupt_on 中的工具调用先由审批策略决策：自动同意的直接执行，自动拒绝的以错误结果返回给模型，
+        只有转人工审核的调用才会中断（中断内容与 HumanInTheLoopMiddleware 相同，只包含转人工审核的调用）
+      - 每个决策写入 store 的 ("hitl_audit", user_id) 命名空间作为审计记录，人工审核的结果追加到同一条记录中
+      - 中断恢复时 LangGraph 会重新执行本节点，策略决策从审计记录中读取而不是重新计算，保证恢复前后转人工审核的调用一致、
+        频率限制不重复计数（恢复请求由其他 worker 处理时同样适用）；审计记录按会话、AIMessage 与工具调用区分，
+        其他会话中出现相同的工具调用ID（如 LLM 缓存重放）时重新决策
+    """
+
+    def __init__(self, interrupt_on: Dict[str, bool | InterruptOnConfig], *, policy: Optional[HITLPolicy],
+                 description_prefix: str = "Tool execution requires approval") -> None:
+        super().__init__(interrupt_on, description_prefix=description_prefix)
+        # 审批策略，为 None 时全部转人工审核（与 HumanInTheLoopMiddleware 行为一致）
+        self.policy = policy
+
+    @staticmethod
+    def _identity(runtime: Runtime) -> Tuple[str, Optional[str]]:
+        """读取当前运行的 user_id 与 thread_id"""
+        user_id = getattr(runtime.context, "user_id", None) or "anonymous"
+        try:
+            thread_id = get_config().get("configurable", {}).get("thread_id")
+        except RuntimeError:
+            thread_id = None
+        return user_id, thread_id
+
+    def _reviewed_calls(self, state: AgentState) -> Tuple[Optional[AIMessage], List[ToolCall]]:
+        """返回最后一条 AIMessage 以及其中需要审批的工具调用"""
+        last_ai_msg = next((msg for msg in reversed(state["messages"]) if isinstance(msg, AIMessage)), None)
+        if not last_ai_msg or not last_ai_msg.tool_calls:
+            return None, []
+        return last_ai_msg, [tool_call for tool_call in last_ai_msg.tool_calls if tool_call["name"] in self.interrupt_on]
+
+    def _new_record(self, tool_call: ToolCall, message: AIMessage, user_id: str, thread_id: Optional[str]) -> Dict[str, Any]:
+        """按审批策略决策并生成审计记录"""
+        if self.policy is None:
+            decision = {"action": "escalate", "rule": None, "reason": "审批策略未启用"}
+        else:
+            decision = self.policy.evaluate(tool_call["name"], tool_call["args"], user_id)
+        HITL_DECISIONS.labels(tool_call["name"], decision["action"], "policy").inc()
+        logger.info("工具调用审批策略决策: %s -> %s", tool_call["name"], decision["action"],
+                    extra={"fields": {"rule": decision["rule"], "reason": decision["reason"]}})
+        return {
+            "tool": tool_call["name"],
+            "args": tool_call["args"],
+            "user_id": user_id,
+            "thread_id": thread_id,
+            "message_id": message.id,
+            "tool_call_id": tool_call.get("id"),
+            "request_id": current_request_id(),
+            **decision,
+            "decided_at": time.time(),
+        }
+
+    @staticmethod
+    def _with_human_decision(record: Dict[str, Any], decision: Decision) -> Dict[str, Any]:
+        """在审计记录中追加人工审核的结果"""
+        HITL_DECISIONS.labels(record["tool"], decision["type"], "human").inc()
+        logger.info("工具调用人工审核结果: %s -> %s", record["tool"], decision["type"])
+        return {
+            **record,
+            "human_decision": decision["type"],
+            "human_edited_args": decision["edited_action"]["args"] if decision["type"] == "edit" else None,
+            "human_request_id": current_request_id(),
+            "human_decided_at": time.time(),
+        }
+
+    def _escalate(self, escalated: List[ToolCall], state: AgentState, runtime: Runtime) -> List[Decision]:
+        """对转人工审核的工具调用发起中断，返回人工决策（恢复执行时直接返回恢复时传入的决策）"""
+        action_requests, review_configs = [], []
+        for tool_call in escalated:
+            action_request, review_config = self._create_action_and_config(
+                tool_call, self.interrupt_on[tool_call["name"]], state, runtime
+            )
+            action_requests.append(action_request)
+            review_configs.append(review_config)
+        decisions = interrupt(HITLRequest(action_requests=action_requests, review_configs=review_configs))["decisions"]
+        if len(decisions) != len(escalated):
+            raise ValueError(
+                f"Number of human decisions ({len(decisions)}) does not match "
+                f"number of hanging tool calls ({len(escalated)})."
+            )
+        return decisions
+
+    def _apply(self, last_ai_msg: AIMessage, thread_id: Optional[str], records: Dict[str, Dict[str, Any]],
+               human: Dict[str, Decision]) -> Optional[Dict[str, Any]]:
+        """按策略决策与人工决策重建工具调用列表，全部自动同意时不更新状态"""
+        revised_tool_calls: List[ToolCall] = []
+        artificial_tool_messages: List[ToolMessage] = []
+        changed = False
+        for tool_call in last_ai_msg.tool_calls:
+            key = _record_key(tool_call, last_ai_msg, thread_id)
+            record = records.get(key)
+            if record is None or record["action"] == "approve":
+                revised_tool_calls.append(tool_call)
+                continue
+            changed = True
+            if record["action"] == "reject":
+                # 与人工拒绝相同：保留工具调用，并以错误状态的工具结果告知模型
+                revised_tool_calls.append(tool_call)
+                artificial_tool_messages.append(ToolMessage(
+                    content=record["reason"] or f"工具调用 `{tool_call['name']}` 被审批策略拒绝（规则: {record['rule']}）",
+                    name=tool_call["name"],
+                    tool_call_id=tool_call["id"],
+                    status="error",
+                ))
+                continue
+            revised_tool_call, tool_message = self._process_decision(human[key], tool_call, self.interrupt_on[tool_call["name"]])
+            if revised_tool_call is not None:
+                revised_tool_calls.append(revised_tool_call)
+            if tool_message:
+                artificial_tool_messages.append(tool_message)
+        if not changed:
+            return None
+        last_ai_msg.tool_calls = revised_tool_calls
+        return {"messages": [last_ai_msg, *artificial_tool_messages]}
+
+    def after_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        """调用模型后：按审批策略处理工具调用，只对转人工审核的调用发起中断"""
+        last_ai_msg, reviewed = self._reviewed_calls(state)
+        if not reviewed:
+            return None
+        user_id, thread_id = self._identity(runtime)
+        store = runtime.store
+        namespace = (AUDIT_NAMESPACE, user_id)
+        records: Dict[str, Dict[str, Any]] = {}
+        for tool_call in reviewed:
+            key = _record_key(tool_call, last_ai_msg, thread_id)
+            # 已有审计记录说明是同一会话中同一条 AIMessage 在中断恢复后的重新执行，沿用原来的策略决策
+            item = store.get(namespace, key) if store is not None else None
+            record = item.value if item else _local_get(user_id, key)
+            if record is None:
+                record = self._new_record(tool_call, last_ai_msg, user_id, thread_id)
+                if store is not None:
+                    store.put(namespace, key, record, index=False)
+                else:
+                    _local_put(user_id, key, record)
+            records[key] = record
+
+        escalated = [tool_call for tool_call in reviewed if records[_record_key(tool_call, last_ai_msg, thread_id)]["action"] == "escalate"]
+        human: Dict[str, Decision] = {}
+        if escalated:
+            for tool_call, decision in zip(escalated, self._escalate(escalated, state, runtime)):
+                key = _record_key(tool_call, last_ai_msg, thread_id)
+                human[key] = decision
+                records[key] = self._with_human_decision(records[key], decision)
+                if store is not None:
+                    store.put(namespace, key, records[key], index=False)
+                else:
+                    _local_put(user_id, key, records[key])
+        return self._apply(last_ai_msg, thread_id, records, human)
+
+    async def aafter_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        """调用模型后：按审批策略处理工具调用，只对转人工审核的调用发起中断"""
+        last_ai_msg, reviewed = self._reviewed_calls(state)
+        if not reviewed:
+            return None
+        user_id, thread_id = self._identity(runtime)
+        store = runtime.store
+        namespace = (AUDIT_NAMESPACE, user_id)
+        keys = [_record_key(tool_call, last_ai_msg, thread_id) for tool_call in reviewed]
+        # 并发读取全部工具调用的审计记录，已有记录说明是同一会话中同一条 AIMessage 在中断恢复后的重新执行，沿用原来的策略决策
+        if store is not None:
+            items = await asyncio.gather(*(store.aget(namespace, key) for key in keys))
+            existing = [item.value if item else None for item in items]
+        else:
+            existing = [_local_get(user_id, key) for key in keys]
+        records: Dict[str, Dict[str, Any]] = {}
+        new_keys = []
+        for tool_call, key, record in zip(reviewed, keys, existing):
+            if record is None:
+                record = self._new_record(tool_call, last_ai_msg, user_id, thread_id)
+                new_keys.append(key)
+            records[key] = record
+        # 在发起中断之前写入策略决策，恢复执行时才能读取到
+        if store is not None:
+            await asyncio.gather(*(store.aput(namespace, key, records[key], index=False) for key in new_keys))
+        else:
+            for key in new_keys:
+                _local_put(user_id, key, records[key])
+
+        escalated = [tool_call for tool_call, key in zip(reviewed, keys) if records[key]["action"] == "escalate"]
+        human: Dict[str, Decision] = {}
+        if escalated:
+            for tool_call, decision in zip(escalated, self._escalate(escalated, state, runtime)):
+                key = _record_key(tool_call, last_ai_msg, thread_id)
+                human[key] = decision
+                records[key] = self._with_human_decision(records[key], decision)
+            if store is not None:
+                await asyncio.gather(*(store.aput(namespace, key, records[key], index=False) for key in human))
+            else:
+                for key in human:
+                    _local_put(user_id, key, records[key])
+        return self._apply(last_ai_msg, thread_id, records, human)
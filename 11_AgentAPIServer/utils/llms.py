@@ -1,11 +1,25 @@
 # 导入操作系统模块，用于读取环境变量或进行其他与操作系统相关的配置
 import os
+# 导入 threading，用于保护 LLM 实例缓存的并发初始化
+import threading
+# 导入 importlib.util，用于检测是否安装了 HTTP/2 所需的 h2 库
+import importlib.util
+# 导入 httpx，用于创建所有模型实例共享的、长连接复用的 HTTP 客户端
+import httpx
 # 从 langchain_openai 包中导入 ChatOpenAI 和 OpenAIEmbeddings
 # ChatOpenAI：用于与 OpenAI 的对话类模型交互
 # OpenAIEmbeddings：用于调用 OpenAI 的向量/嵌入模型生成文本向量表示
 from langchain_openai import ChatOpenAI,OpenAIEmbeddings
 # 从当前包中导入 LoggerManager，用于获取日志记录器实例以输出运行和调试信息
 from .logger import LoggerManager
+# 从当前包中导入 Config 配置类，用于读取 worker 数以折算限流配额
+from .config import Config
+# 从当前包中导入限流器，所有模型请求在共享 HTTP 客户端的 transport 层统一限流
+from .rate_limiter import RateLimiterRegistry, RateLimitedTransport, AsyncRateLimitedTransport
+# 从当前包中导入 RoutedChatModel，用于在多个服务商之间路由、对冲与故障切换
+from .router import RoutedChatModel
+# 从当前包中导入 get_llm_cache，为对话模型接入精确匹配缓存
+from .llm_cache import get_llm_cache
 
 
 
@@ -26,7 +40,11 @@ MODEL_CONFIGS = {
         # 对话模型名称
         "chat_model": "deepseek-v3.2",
         # 向量嵌入模型名称
-        "embedding_model": "text-embedding-3-small"
+        "embedding_model": "text-embedding-3-small",
+        # 客户端限流：每分钟请求数、每分钟 token 数、最大并发数（收到 429 时自动下调）
+        "rpm": 500,
+        "tpm": 200000,
+        "max_concurrency": 16
     },
     # 使用 oneapi 网关服务的配置
     "oneapi": {
@@ -37,7 +55,11 @@ MODEL_CONFIGS = {
         # 对话模型名称
         "chat_model": "qwen-max",
         # 向量嵌入模型名称
-        "embedding_model": "text-embedding-v1"
+        "embedding_model": "text-embedding-v1",
+        # 客户端限流：每分钟请求数、每分钟 token 数、最大并发数（收到 429 时自动下调）
+        "rpm": 300,
+        "tpm": 100000,
+        "max_concurrency": 8
     },
     # 直连通义千问兼容 OpenAI 协议的配置
     "qwen": {
@@ -48,7 +70,11 @@ MODEL_CONFIGS = {
         # 对话模型名称
         "chat_model": "qwen-turbo-latest",
         # 向量嵌入模型名称
-        "embedding_model": "text-embedding-v1"
+        "embedding_model": "text-embedding-v1",
+        # 客户端限流：每分钟请求数、每分钟 token 数、最大并发数（收到 429 时自动下调）
+        "rpm": 300,
+        "tpm": 100000,
+        "max_concurrency": 8
     },
     # 本地 ollama 服务的配置
     "ollama": {
@@ -59,7 +85,28 @@ MODEL_CONFIGS = {
         # 使用的本地 LLaMA 对话模型
         "chat_model": "llama3.1:8b",
         # 使用的本地嵌入模型名称
-        "embedding_model": "nomic-embed-text:latest"
+        "embedding_model": "nomic-embed-text:latest",
+        # 客户端限流：每分钟请求数、每分钟 token 数、最大并发数（收到 429 时自动下调）
+        "rpm": 600,
+        "tpm": 1000000,
+        "max_concurrency": 4
+    },
+    # 本地模拟模型服务（python mock_llm_server.py），用于离线、可复现的压测
+    "mock": {
+        # 模拟服务地址，可通过环境变量 MOCK_LLM_BASE_URL 修改
+        "base_url": os.getenv("MOCK_LLM_BASE_URL", "http://127.0.0.1:8300/v1"),
+        # 模拟服务不校验 API Key
+        "api_key": "mock",
+        # 对话模型名称
+        "chat_model": "mock-chat",
+        # 向量嵌入模型名称
+        "embedding_model": "mock-embedding",
+        # 直接发送原始文本，不在本地用 tiktoken 分词（tiktoken 首次使用需要联网下载词表）
+        "check_embedding_ctx_length": False,
+        # 模拟服务不需要客户端限流保护，给足配额以免限流影响压测结果
+        "rpm": 1000000,
+        "tpm": 1000000000,
+        "max_concurrency": 1000
     }
 }
 
@@ -69,6 +116,92 @@ DEFAULT_LLM_TYPE = "openai"
 # 默认温度为 0，使模型输出更稳定、更可控
 DEFAULT_TEMPERATURE = 0
 
+# 路由模式的 llm_type：在多个服务商之间按延迟选择、对冲慢请求并在失败时自动切换
+ROUTER_LLM_TYPE = "router"
+# 路由模式下参与路由的服务商（MODEL_CONFIGS 中的键），按优先级排列，嵌入模型使用第一个服务商的
+ROUTER_PROVIDERS = ["openai", "qwen", "oneapi"]
+
+
+# 共享 HTTP 连接池配置：所有模型实例复用同一组长连接，避免每个实例各自建立 TCP/TLS 连接
+# 最大连接数
+HTTP_MAX_CONNECTIONS = 100
+# 最大保持活跃（keep-alive）的空闲连接数
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+# 空闲连接保持时间（秒）
+HTTP_KEEPALIVE_EXPIRY = 60
+# 建立连接的超时时间（秒），读写超时沿用模型实例上的 timeout 配置
+HTTP_CONNECT_TIMEOUT = 10
+# 安装了 h2 库（pip install "httpx[http2]"）时启用 HTTP/2，多个请求复用同一条连接
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# 未在 MODEL_CONFIGS 中配置限流参数时使用的默认值
+DEFAULT_RATE_LIMITS = {"rpm": 300, "tpm": 100000, "max_concurrency": 8}
+
+# 进程内共享的同步/异步 HTTP 客户端
+_http_client: httpx.Client | None = None
+_http_async_client: httpx.AsyncClient | None = None
+# 进程内共享的限流器注册表（按 host/模型 分配限流器）
+_rate_limiters: RateLimiterRegistry | None = None
+# 按 llm_type 缓存的 (chat, embedding) 实例
+_llm_instances: dict[str, tuple[ChatOpenAI, OpenAIEmbeddings]] = {}
+# 保护共享 HTTP 客户端创建的锁
+_http_lock = threading.Lock()
+# 保护模型实例缓存的锁，避免并发请求重复初始化（可重入：路由模式初始化时会获取各服务商的实例）
+_llm_lock = threading.RLock()
+
+
+# 按 worker 数折算单个进程可使用的限流配额（至少保留 1）
+def _per_worker_limits(limits: dict) -> dict:
+    return {key: max(1, value // max(1, Config.API_WORKERS)) for key, value in limits.items()}
+
+
+# 获取进程内共享的同步与异步 HTTP 客户端（首次调用时创建）
+def get_http_clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    获取共享的 httpx 客户端，所有 ChatOpenAI 与 OpenAIEmbeddings 实例复用同一个连接池
+
+    Returns:
+        tuple[httpx.Client, httpx.AsyncClient]: 同步客户端与异步客户端
+    """
+    global _http_client, _http_async_client, _rate_limiters
+    with _http_lock:
+        if _http_client is None:
+            # 连接池限制：最大连接数、最大空闲长连接数与空闲连接保持时间
+            limits = httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+            # 超时配置：单独限制建立连接的时间
+            timeout = httpx.Timeout(None, connect=HTTP_CONNECT_TIMEOUT)
+            # 按服务商 host 配置的限流参数，同步与异步客户端共享同一组限流器
+            # 限流器只在进程内生效，多 worker 部署时每个 worker 只分得 1/worker数 的配额，合计不超过服务商限制
+            _rate_limiters = RateLimiterRegistry(
+                limits_by_host={
+                    httpx.URL(config["base_url"]).host: _per_worker_limits({key: config[key] for key in DEFAULT_RATE_LIMITS if key in config})
+                    for config in MODEL_CONFIGS.values()
+                },
+                default_limits=_per_worker_limits(DEFAULT_RATE_LIMITS)
+            )
+            # 创建同步客户端（供 invoke/embed_query 等同步调用使用），请求先经过限流器再进入连接池
+            _http_client = httpx.Client(
+                transport=RateLimitedTransport(httpx.HTTPTransport(limits=limits, http2=HTTP2_ENABLED), _rate_limiters),
+                timeout=timeout
+            )
+            # 创建异步客户端（供 ainvoke/aembed_query 等异步调用使用）
+            _http_async_client = httpx.AsyncClient(
+                transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(limits=limits, http2=HTTP2_ENABLED), _rate_limiters),
+                timeout=timeout
+            )
+            logger.info(f"共享 HTTP 客户端创建成功，最大连接数: {HTTP_MAX_CONNECTIONS}，HTTP/2: {HTTP2_ENABLED}")
+        return _http_client, _http_async_client
+
+
+# 获取进程内共享的限流器注册表，用于查看各服务商的限流状态
+def get_rate_limiters() -> RateLimiterRegistry:
+    get_http_clients()
+    return _rate_limiters
+
 
 # 自定义异常类，在 LLM 初始化失败时统一抛出该异常
 class LLMInitializationError(Exception):
@@ -82,7 +215,7 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
     初始化LLM实例
 
     Args:
-        llm_type (str): LLM类型，可选值为 'openai', 'oneapi', 'qwen', 'ollama'
+        llm_type (str): LLM类型，可选值为 'openai', 'oneapi', 'qwen', 'ollama', 'mock', 'router'
 
     Returns:
         ChatOpenAI: 初始化后的LLM实例
@@ -91,6 +224,10 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
         LLMInitializationError: 当LLM初始化失败时抛出
     """
     try:
+        # 路由模式：组合多个服务商的对话模型
+        if llm_type == ROUTER_LLM_TYPE:
+            return initialize_router()
+
         # 检查传入的 llm_type 是否在预定义的配置字典中
         if llm_type not in MODEL_CONFIGS:
             # 如果不支持该类型，则先抛出 ValueError 供下方捕获
@@ -99,6 +236,9 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
         # 根据指定类型获取对应的配置
         config = MODEL_CONFIGS[llm_type]
 
+        # 获取共享的 HTTP 客户端，所有实例复用同一个连接池
+        http_client, http_async_client = get_http_clients()
+
         # 对 ollama 类型做特殊处理
         if llm_type == "ollama":
             # 使用兼容 OpenAI 协议的方式时，需要设置 OPENAI_API_KEY 环境变量
@@ -117,7 +257,12 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
             # 设置单次调用的超时时间（秒），避免长时间阻塞
             timeout=30,
             # 设置失败时的最大重试次数，提高稳定性
-            max_retries=2
+            max_retries=2,
+            # 接入精确匹配缓存（只缓存 temperature 为 0 的调用，未启用时为 None）
+            cache=get_llm_cache(),
+            # 复用共享的同步/异步 HTTP 客户端（长连接、连接池）
+            http_client=http_client,
+            http_async_client=http_async_client
         )
 
         # 创建向量嵌入模型实例
@@ -129,7 +274,12 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
             # 嵌入模型名称
             model=config["embedding_model"],
             # 部署名称，一般与模型名保持一致
-            deployment=config["embedding_model"]
+            deployment=config["embedding_model"],
+            # 是否在本地按模型上下文长度分词切块（仅 OpenAI 官方嵌入模型需要）
+            check_embedding_ctx_length=config.get("check_embedding_ctx_length", True),
+            # 复用共享的同步/异步 HTTP 客户端（长连接、连接池）
+            http_client=http_client,
+            http_async_client=http_async_client
         )
 
         # 记录成功初始化的日志，包含当前使用的 llm_type
@@ -151,10 +301,29 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
         raise LLMInitializationError(f"初始化LLM失败: {str(e)}")
 
 
+# 定义函数用于初始化路由模式的对话模型，嵌入模型使用第一个服务商的
+def initialize_router(providers: list[str] = ROUTER_PROVIDERS) -> tuple[RoutedChatModel, OpenAIEmbeddings]:
+    """
+    初始化多服务商路由对话模型
+
+    Args:
+        providers (list[str]): 参与路由的服务商，按优先级排列
+
+    Returns:
+        tuple[RoutedChatModel, OpenAIEmbeddings]: 路由对话模型与嵌入模型实例
+    """
+    # 复用各服务商已缓存的实例（共享 HTTP 连接池与 LLM 缓存）
+    instances = {name: _get_or_create_llm(name) for name in providers}
+    llm_chat = RoutedChatModel(providers={name: chat for name, (chat, _) in instances.items()})
+    logger.info(f"成功初始化路由模型，服务商: {providers}")
+    return llm_chat, instances[providers[0]][1]
+
+
 # 提供对外使用的封装函数，负责获取 LLM 实例并带有容错逻辑
 def get_llm(llm_type: str = DEFAULT_LLM_TYPE) -> ChatOpenAI:
     """
     获取LLM实例的封装函数，提供默认值和错误处理
+    同一 llm_type 的实例在进程内只创建一次，所有实例共享同一组 HTTP 连接池
 
     Args:
         llm_type (str): LLM类型
@@ -163,19 +332,32 @@ def get_llm(llm_type: str = DEFAULT_LLM_TYPE) -> ChatOpenAI:
         ChatOpenAI: LLM实例
     """
     try:
-        # 直接调用初始化函数，返回 (chat, embedding) 元组
-        return initialize_llm(llm_type)
+        # 优先返回已缓存的实例，同一 llm_type 在进程内只初始化一次
+        return _get_or_create_llm(llm_type)
     # 捕获自定义的初始化异常
     except LLMInitializationError as e:
         # 打印警告日志，说明会尝试使用默认配置重试
         logger.warning(f"使用默认配置重试: {str(e)}")
         # 如果当前类型不是默认类型，则退回到默认 LLM 类型再尝试一次
         if llm_type != DEFAULT_LLM_TYPE:
-            return initialize_llm(DEFAULT_LLM_TYPE)
+            return _get_or_create_llm(DEFAULT_LLM_TYPE)
         # 如果已经是默认类型仍然失败，则继续向上抛出异常
         raise
 
 
+# 内部函数：按 llm_type 返回缓存的实例，不存在时初始化并缓存
+def _get_or_create_llm(llm_type: str) -> tuple[ChatOpenAI, OpenAIEmbeddings]:
+    # 快速路径：已缓存时直接返回，无需加锁
+    instances = _llm_instances.get(llm_type)
+    if instances is not None:
+        return instances
+    with _llm_lock:
+        # 双重检查，避免并发请求重复初始化
+        if llm_type not in _llm_instances:
+            _llm_instances[llm_type] = initialize_llm(llm_type)
+        return _llm_instances[llm_type]
+
+
 
 # 仅在当前文件作为脚本直接运行时执行下面的测试代码
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+# 导入 os 模块，用于读取 Prometheus 多进程目录的环境变量
+import os
+# 导入 shutil 模块，用于清理上次运行遗留的多进程指标文件
+import shutil
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Tuple
+# 导入 Prometheus 客户端：指标类型、注册表、多进程汇总与文本格式输出
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 多 worker 部署时，各进程把指标写入 PROMETHEUS_MULTIPROC_DIR 目录下的文件，/metrics 汇总全部进程的数据
+# 该环境变量必须在 worker 进程导入 prometheus_client 之前设置（agent_api.py 的 --workers 与 gunicorn.conf.py 会自动设置）
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# 延迟直方图的分桶（秒）：覆盖从毫秒级的缓存命中到分钟级的多轮 Agent 执行
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# HTTP 请求：按路由模板（如 /runs/{run_id}）统计，避免路径参数导致标签数量膨胀
+HTTP_REQUESTS = Counter("agent_api_requests_total", "HTTP 请求数", ["method", "route", "status"])
+HTTP_LATENCY = Histogram("agent_api_request_duration_seconds", "HTTP 请求耗时（流式响应统计到响应头发出）", ["method", "route"], buckets=LATENCY_BUCKETS)
+# 处理中的请求数：多进程模式下只汇总存活进程的数值
+HTTP_IN_FLIGHT = Gauge("agent_api_requests_in_flight", "处理中的 HTTP 请求数", multiprocess_mode="livesum")
+
+# 模型服务商请求：provider 为服务商域名，model 为请求体中的模型名
+LLM_LATENCY = Histogram("agent_llm_request_duration_seconds", "模型服务商请求耗时（不含限流排队）", ["provider", "model", "status"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("agent_llm_tokens_total", "模型服务商返回的 token 用量（仅非流式响应）", ["provider", "model"])
+
+# 工具调用
+TOOL_LATENCY = Histogram("agent_tool_call_duration_seconds", "工具调用耗时（MCP 工具即一次 MCP 往返）", ["tool", "status"], buckets=LATENCY_BUCKETS)
+
+# 缓存：event 为 hits、misses、skipped、writes、errors，命中率 = hits / (hits + misses)
+CACHE_EVENTS = Counter("agent_cache_events_total", "缓存查询与写入次数", ["cache", "event"])
+
+# Agent 执行结果：status 为 completed、interrupted、failed，人工介入率 = interrupted / 全部
+AGENT_RESULTS = Counter("agent_results_total", "Agent 执行结果数", ["endpoint", "status"])
+
+# 工具调用审批决策：source 为 policy（策略自动决策）或 human（人工审核），decision 为 approve、reject、edit、escalate
+HITL_DECISIONS = Counter("agent_hitl_decisions_total", "工具调用审批决策数", ["tool", "decision", "source"])
+
+# 数据库连接池：state 为 max、size、in_use、available、waiting，利用率 = in_use / max
+DB_POOL_CONNECTIONS = Gauge("agent_db_pool_connections", "数据库连接池连接数", ["pool", "state"], multiprocess_mode="livesum")
+
+
+def update_pool_metrics(stats: Dict[str, Any]) -> None:
+    """根据 PoolManager.get_stats() 的结果更新连接池指标"""
+    for pool in ("checkpointer", "store"):
+        pool_stats = stats.get(pool) or {}
+        if not pool_stats:
+            continue
+        DB_POOL_CONNECTIONS.labels(pool, "max").set(pool_stats["pool_max"])
+        DB_POOL_CONNECTIONS.labels(pool, "size").set(pool_stats["pool_size"])
+        DB_POOL_CONNECTIONS.labels(pool, "in_use").set(pool_stats["in_use"])
+        DB_POOL_CONNECTIONS.labels(pool, "available").set(pool_stats["pool_available"])
+        DB_POOL_CONNECTIONS.labels(pool, "waiting").set(pool_stats["requests_waiting"])
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成 Prometheus 文本格式的指标，多进程模式下汇总全部 worker 的数据"""
+    if os.getenv(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def prepare_multiprocess_dir(path: str) -> None:
+    """在启动 worker 之前清空多进程指标目录并设置环境变量（worker 进程继承该环境变量）"""
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    os.environ[MULTIPROC_DIR_ENV] = path
+
+
+def mark_process_dead(pid: int) -> None:
+    """worker 退出后清理其处理中请求数等实时指标，避免已退出进程的数值继续计入汇总"""
+    if os.getenv(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(pid)
@@ -1,5 +1,7 @@
 # 从 dataclasses 模块导入 dataclass 装饰器，用于简化数据类的定义
 from dataclasses import dataclass
+# 导入 datetime，用于异步任务的时间字段
+from datetime import datetime
 # Pydantic 数据验证与序列化基类
 from pydantic import BaseModel
 # 導入 typing 模块中的类型提示工具
@@ -33,6 +35,15 @@ class AskRequest(BaseModel):
     thread_id: str
     # 用户本次提出的问题/指令
     question: str
+    # 为 true 时在响应中附带本次请求的耗时明细
+    debug: bool = False
+
+# 定义请求体模型：批量提问的输入结构
+class BatchAskRequest(BaseModel):
+    # 问题列表，每个问题带有各自的用户与会话标识
+    questions: List[AskRequest]
+    # 同时执行的最大问题数，不超过服务端配置的上限
+    max_concurrency: Optional[int] = None
 
 # 定义请求体模型：人工介入时提交决策的结构
 class InterveneRequest(BaseModel):
@@ -42,6 +53,8 @@ class InterveneRequest(BaseModel):
     user_id: str
     # 人工对每个待审核工具调用的决策列表
     decisions: List[Dict[str, Any]]
+    # 为 true 时在响应中附带本次请求的耗时明细
+    debug: bool = False
 
 # 定义响应体模型：API 返回的统一结构
 class AgentResponse(BaseModel):
@@ -51,4 +64,35 @@ class AgentResponse(BaseModel):
     result: Optional[str] = None
     # 当状态为 interrupted 时，返回需要人工审核的工具调用细节
     interrupt_details: Optional[Dict[str, Any]] = None
+    # 请求携带 debug=true 时，返回各阶段的耗时明细（与 Server-Timing 响应头一致）
+    timings: Optional[Dict[str, Any]] = None
+
+# 定义响应体模型：提交异步任务后立即返回的结构
+class RunCreated(BaseModel):
+    # 任务唯一标识，用于查询结果与订阅进度
+    run_id: str
+    # 任务状态：提交后为 queued
+    status: str
 
+# 定义响应体模型：异步任务的查询结果
+class RunInfo(BaseModel):
+    # 任务唯一标识
+    run_id: str
+    # 任务类型：ask（提问）或 intervene（人工决策后继续执行）
+    kind: str
+    # 任务状态：queued、running、completed、interrupted、failed
+    status: str
+    # 用户唯一标识
+    user_id: str
+    # 会话（对话线程）唯一标识
+    thread_id: str
+    # 已执行次数（含失败重试）
+    attempts: int
+    # 任务结束时的结果，结构与 AgentResponse 一致
+    result: Optional[Dict[str, Any]] = None
+    # 最近一次执行失败的错误信息
+    error: Optional[str] = None
+    # 提交、开始与结束时间
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,382 @@
+# 导入 asyncio，用于获取事件循环中正在执行的任务与安装任务工厂
+import asyncio
+# 导入 json，用于保存 speedscope 格式的剖析文件与剖析元数据
+import json
+# 导入 marshal，用于保存 pstats 可以读取的剖析文件
+import marshal
+# 导入 os，用于创建目录、列出与清理剖析文件
+import os
+# 导入 re，用于校验剖析ID，避免路径穿越
+import re
+# 导入 sys，用于读取事件循环线程当前的调用栈
+import sys
+# 导入 threading，用于后台采样线程
+import threading
+# 导入 time，用于记录采样时间
+import time
+# 导入 uuid，用于生成剖析ID
+import uuid
+# 导入 weakref，用于记录属于某次剖析的任务（任务结束后自动释放）
+import weakref
+# 导入 ContextVar，剖析请求中创建的任务继承该上下文变量，据此把任务归入这次剖析
+from contextvars import ContextVar
+# 导入 datetime，用于记录剖析开始时间
+from datetime import datetime, timezone
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, List, Optional, Tuple
+# 从当前包中导入 Config 配置类
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志记录器，用于输出运行过程中的日志信息
+logger = LoggerManager.get_logger()
+
+# 当前上下文所属的剖析会话，由中间件在剖析的请求中设置
+_current_session: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+
+# 任务 -> 所属的剖析会话，由任务工厂在创建任务时登记
+_task_sessions: "weakref.WeakKeyDictionary[asyncio.Task, ProfileSession]" = weakref.WeakKeyDictionary()
+
+# 剖析ID的格式（时间戳_随机串），下载接口据此校验
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{6}_[0-9a-f]{8}$")
+
+# 调用栈中的帧：(文件名, 函数名, 函数定义所在行号)，按函数汇总
+Frame = Tuple[str, str, int]
+
+# 合成帧：请求的任务都处于等待状态时，事件循环正在执行其他请求或处于空闲（等待网络 IO）
+OTHER_FRAME: Frame = ("<event loop>", "[执行其他请求或事件循环回调]", 0)
+IDLE_FRAME: Frame = ("<event loop>", "[等待 IO：事件循环空闲]", 0)
+
+
+# 驱动事件循环的函数：uvloop 的事件循环由 Cython 实现，调用栈中没有 Handle._run，以这些帧作为事件循环调度代码的边界
+LOOP_DRIVER_NAMES = {"run_forever", "run_until_complete"}
+LOOP_DRIVER_FILES = (os.path.join("asyncio", "runners.py"), os.path.join("uvloop", "__init__.py"))
+
+
+def _frame_stack(frame: Any) -> List[Frame]:
+    """
+    把事件循环线程的调用栈转换为从外到内的帧列表，去掉事件循环自身的调度帧；
+    事件循环没有在执行回调（空闲等待 IO 或在调度）时返回空列表
+    """
+    stack = []
+    # 没有找到 Handle._run 时（uvloop）使用的调用栈：截断在最内层的事件循环驱动帧
+    driver_stack = None
+    while frame is not None:
+        code = frame.f_code
+        # 事件循环执行回调的入口（asyncio/events.py 中的 Handle._run），其外层都是事件循环的调度代码
+        if code.co_name == "_run" and code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+            stack.reverse()
+            return stack
+        # 纯 Python 的 asyncio 事件循环在调度或等待 IO（没有经过 Handle._run），视为空闲
+        if code.co_name == "_run_once" and code.co_filename.endswith(os.path.join("asyncio", "base_events.py")):
+            return []
+        if driver_stack is None and (code.co_name in LOOP_DRIVER_NAMES or code.co_filename.endswith(LOOP_DRIVER_FILES)):
+            driver_stack = stack[::-1]
+        stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    # uvloop：回调由 Cython 代码直接调用，驱动帧之内的 Python 帧都是回调本身；事件循环空闲时驱动帧之内没有 Python 帧
+    if driver_stack is not None:
+        return driver_stack
+    # 找不到任何事件循环边界时返回完整调用栈，避免采样结果为空
+    stack.reverse()
+    return stack
+
+
+def _await_stack(task: asyncio.Task) -> List[Frame]:
+    """沿着协程的 await 链获取挂起任务正在等待的位置（从外到内）"""
+    stack = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        stack.append((frame.f_code.co_filename, frame.f_code.co_name, frame.f_code.co_firstlineno))
+        awaited = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+        if awaited is not None and not hasattr(awaited, "cr_frame") and not hasattr(awaited, "gi_frame") and not hasattr(awaited, "ag_frame"):
+            # await 链的末端是 Future 等非协程对象
+            stack.append(("<await>", f"[await {type(awaited).__name__}]", 0))
+            break
+        coro = awaited
+    return stack
+
+
+# 定义一次请求的剖析会话：保存采样结果，结束后写入剖析文件
+class ProfileSession:
+
+    def __init__(self, request_id: str, method: str, path: str):
+        self.profile_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        # 属于本次请求的任务（中间件中的请求任务以及 LangGraph 等创建的子任务）
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        # 请求时间线：(耗时毫秒, 调用栈)，调用栈为本次请求的代码、其他请求或事件循环空闲
+        self.wall_samples: List[Tuple[float, List[Frame]]] = []
+        # 任务时间线：任务名 -> [(耗时毫秒, 调用栈)]，挂起的任务记录其 await 链
+        self.task_samples: Dict[str, List[Tuple[float, List[Frame]]]] = {}
+        # 采样状态计数：request（执行本次请求的代码）、other（执行其他请求）、idle（事件循环空闲）
+        self.states = {"request": 0, "other": 0, "idle": 0}
+
+    def sample(self, running: Optional[asyncio.Task], loop_stack: List[Frame], weight_ms: float) -> None:
+        """记录一次采样（在采样线程中调用），loop_stack 为事件循环线程当前执行的调用栈"""
+        if running is not None and _task_sessions.get(running) is self:
+            state, stack = "request", loop_stack
+        elif running is not None or loop_stack:
+            state, stack = "other", [OTHER_FRAME]
+        else:
+            state, stack = "idle", [IDLE_FRAME]
+        self.states[state] += 1
+        self.wall_samples.append((weight_ms, stack))
+        try:
+            tasks = list(self.tasks)
+        except RuntimeError:
+            # 事件循环线程正在登记新任务，跳过本次任务时间线采样
+            return
+        for task in tasks:
+            if task.done():
+                continue
+            task_stack = stack if task is running else _await_stack(task)
+            self.task_samples.setdefault(task.get_name(), []).append((weight_ms, task_stack))
+
+    def metadata(self) -> Dict[str, Any]:
+        duration_ms = ((self.end or time.perf_counter()) - self.start) * 1000
+        return {
+            "profile_id": self.profile_id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_ms": round(duration_ms, 2),
+            "samples": len(self.wall_samples),
+            "states": dict(self.states),
+        }
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        """生成 speedscope 格式：第一个剖析为请求时间线，其余为各任务的 await 时间线"""
+        frames: List[Frame] = []
+        frame_index: Dict[Frame, int] = {}
+
+        def indexes(stack: List[Frame]) -> List[int]:
+            result = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append(frame)
+                result.append(frame_index[frame])
+            return result
+
+        def profile(name: str, samples: List[Tuple[float, List[Frame]]]) -> Dict[str, Any]:
+            weights = [round(weight, 3) for weight, _ in samples]
+            return {"type": "sampled", "name": name, "unit": "milliseconds", "startValue": 0, "endValue": round(sum(weights), 3),
+                    "samples": [indexes(stack) for _, stack in samples], "weights": weights}
+
+        profiles = [profile(f"请求时间线 {self.method} {self.path}", self.wall_samples)]
+        profiles += [profile(f"任务 {name}", samples) for name, samples in self.task_samples.items()]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path} {self.request_id}",
+            "exporter": "agent_api profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for file, name, line in frames]},
+            "profiles": profiles,
+        }
+
+    def to_pstats(self) -> Dict[Tuple[str, int, str], Tuple]:
+        """根据本次请求代码的采样生成 pstats 数据（调用次数为采样次数，时间为采样估算的秒数）"""
+        stats: Dict[Tuple[str, int, str], List] = {}
+        for weight_ms, stack in self.wall_samples:
+            if not stack or stack[0][0] == "<event loop>":
+                continue
+            seconds = weight_ms / 1000
+            keys = [(file, line, name) for file, name, line in stack]
+            seen = set()
+            for index, key in enumerate(keys):
+                entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                if key not in seen:
+                    # 包含该函数的采样计入累计时间（递归调用只计一次）
+                    entry[0] += 1
+                    entry[1] += 1
+                    entry[3] += seconds
+                    seen.add(key)
+                if index > 0:
+                    caller = entry[4].setdefault(keys[index - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += 1
+                    caller[1] += 1
+                    caller[3] += seconds
+                    if index == len(keys) - 1:
+                        caller[2] += seconds
+            # 位于栈顶的函数计入自身时间
+            stats[keys[-1]][2] += seconds
+        return {key: (cc, nc, tt, ct, {caller: tuple(value) for caller, value in callers.items()})
+                for key, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+# 定义采样剖析器：后台线程定时读取事件循环线程的调用栈，把采样归入正在剖析的请求
+class SamplingProfiler:
+    """
+    请求级采样剖析：
+
+      - 事件循环线程每个采样点只会执行一个任务，正在执行的任务属于剖析中的请求时记录其调用栈（本次请求自身的 Python 代码耗时）
+      - 本次请求的任务都处于等待时，记录事件循环在执行其他请求还是空闲（空闲即在等待网络 IO）
+      - 同时记录本次请求每个任务的 await 链，得到任务级的等待时间线（如等待模型服务商响应、数据库、MCP 工具）
+      - 线程池中执行的同步代码不在事件循环线程中，不计入剖析
+      - 采样线程需要获取 GIL 才能采样，剖析期间把解释器的线程切换间隔降低到采样间隔的 1/5，避免短于默认切换间隔（5 毫秒）的 CPU 执行片段无法被采到
+    """
+
+    def __init__(self, directory: str, interval_ms: float, max_concurrent: int, max_files: int):
+        self.directory = directory
+        self.interval = interval_ms / 1000
+        self.max_concurrent = max_concurrent
+        self.max_files = max_files
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        # 剖析开始前的线程切换间隔，没有剖析中的请求时恢复
+        self._switch_interval = sys.getswitchinterval()
+        os.makedirs(directory, exist_ok=True)
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """在事件循环线程中调用：安装任务工厂，剖析请求中创建的任务会登记到对应的剖析会话"""
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        previous_factory = loop.get_task_factory()
+
+        def task_factory(loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any) -> asyncio.Task:
+            task = previous_factory(loop, coro, **kwargs) if previous_factory else asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get("context")
+            session = context.get(_current_session) if context is not None else _current_session.get()
+            if session is not None and session.end is None:
+                _task_sessions[task] = session
+                session.tasks.add(task)
+            return task
+
+        loop.set_task_factory(task_factory)
+
+    def start(self, request_id: str, method: str, path: str) -> Optional[ProfileSession]:
+        """开始剖析，返回剖析会话；未安装或同时剖析的请求数已达上限时返回 None"""
+        if self._loop is None:
+            return None
+        with self._lock:
+            if len([session for session in self._sessions if session.end is None]) >= self.max_concurrent:
+                return None
+            session = ProfileSession(request_id, method, path)
+            self._sessions.append(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._switch_interval, self.interval / 5))
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession) -> None:
+        """结束剖析（剖析文件由采样线程写入，不占用请求路径）"""
+        session.end = time.perf_counter()
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            weight_ms, last = (now - last) * 1000, now
+            with self._lock:
+                sessions = list(self._sessions)
+            if not sessions:
+                with self._lock:
+                    # 没有剖析中的请求时退出采样线程
+                    if not self._sessions:
+                        self._thread = None
+                        sys.setswitchinterval(self._switch_interval)
+                        return
+                continue
+            running = asyncio.current_task(self._loop)
+            loop_stack = _frame_stack(sys._current_frames().get(self._loop_thread_id))
+            for session in sessions:
+                if session.end is not None:
+                    self._finish(session)
+                else:
+                    session.sample(running, loop_stack, weight_ms)
+
+    def _finish(self, session: ProfileSession) -> None:
+        with self._lock:
+            self._sessions.remove(session)
+        try:
+            base = os.path.join(self.directory, session.profile_id)
+            with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+                json.dump(session.to_speedscope(), f, ensure_ascii=False)
+            with open(f"{base}.pstats", "wb") as f:
+                marshal.dump(session.to_pstats(), f)
+            # 元数据最后写入，列表接口只列出已写完的剖析
+            with open(f"{base}.json", "w", encoding="utf-8") as f:
+                json.dump(session.metadata(), f, ensure_ascii=False)
+            logger.info(f"请求剖析已保存，剖析ID: {session.profile_id} 采样状态: {session.states}")
+            self._cleanup()
+        except Exception as e:
+            logger.error(f"保存请求剖析失败，剖析ID: {session.profile_id} 错误: {e}")
+
+    def _cleanup(self) -> None:
+        """只保留最近的 max_files 个剖析"""
+        profile_ids = sorted(name[:-len(".json")] for name in os.listdir(self.directory)
+                             if name.endswith(".json") and not name.endswith(".speedscope.json"))
+        for profile_id in profile_ids[:-self.max_files]:
+            for suffix in (".json", ".speedscope.json", ".pstats"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """列出已保存的剖析（多 worker 共享同一目录时包含全部 worker 的剖析），最新的在前"""
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith(".json") and not name.endswith(".speedscope.json"):
+                try:
+                    with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return profiles
+
+    def profile_path(self, profile_id: str, fmt: str) -> Optional[str]:
+        """返回剖析文件路径，剖析ID不合法或文件不存在时返回 None"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + (".pstats" if fmt == "pstats" else ".speedscope.json"))
+        return path if os.path.exists(path) else None
+
+
+# 进程内共享的采样剖析器
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    """获取进程内共享的采样剖析器，未开启剖析时返回 None"""
+    global _profiler
+    if _profiler is None and (Config.PROFILING_ENABLED or Config.PROFILING_SAMPLE_RATE > 0):
+        _profiler = SamplingProfiler(Config.PROFILING_DIR, Config.PROFILING_INTERVAL_MS,
+                                     Config.PROFILING_MAX_CONCURRENT, Config.PROFILING_MAX_FILES)
+    return _profiler
+
+
+def current_session() -> Optional[ProfileSession]:
+    """当前上下文所属的剖析会话"""
+    return _current_session.get()
+
+
+def set_session(session: ProfileSession):
+    """把剖析会话设置到当前上下文，返回用于恢复的 token"""
+    return _current_session.set(session)
+
+
+def reset_session(token: Any) -> None:
+    _current_session.reset(token)
@@ -0,0 +1,152 @@
+# 导入操作系统模块，用于遍历目录与读取文件修改时间
+import os
+# 导入 threading，用于在后台线程中监听模板文件变化
+import threading
+# 导入 dataclass，用于定义不可变的模板条目
+from dataclasses import dataclass
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Dict, Optional, Tuple
+# 导入提示词模板相关类，用于预编译系统/用户提示
+from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
+# 从当前包中导入 Config 配置类，用于读取模板目录与刷新间隔
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+
+# 使用 @dataclass 定义一个已加载的模板条目，frozen=True 保证条目创建后不会被修改
+@dataclass(frozen=True)
+class PromptEntry:
+    # 模板文件路径
+    path: str
+    # 模板原始文本
+    template: str
+    # 预编译好的 PromptTemplate
+    prompt: PromptTemplate
+    # 加载时文件的修改时间（纳秒），用于判断是否需要重新加载
+    mtime_ns: int
+    # 模板版本号，每次重新加载后递增
+    version: int
+
+
+# 定义提示词模板注册表：启动时一次性加载 prompt/ 目录下的模板，后台监听文件变化并原子替换
+class PromptRegistry:
+    """提示词模板注册表，请求处理过程中只读内存，不访问文件系统"""
+
+    def __init__(self, prompt_dir: str = Config.PROMPT_DIR, reload_interval: float = Config.PROMPT_RELOAD_INTERVAL):
+        # 模板所在目录
+        self.prompt_dir = prompt_dir
+        # 检查文件变化的间隔（秒），小于等于 0 表示不启用热加载
+        self.reload_interval = reload_interval
+        # 已加载的模板：路径 -> 模板条目（整体替换，读取时无需加锁）
+        self._entries: Dict[str, PromptEntry] = {}
+        # 预编译的聊天模板缓存：(系统模板路径, 版本, 用户模板路径, 版本) -> ChatPromptTemplate
+        self._chat_prompts: Dict[Tuple[str, int, str, int], ChatPromptTemplate] = {}
+        # 串行化重新加载操作的锁
+        self._reload_lock = threading.Lock()
+        # 通知后台线程退出的事件
+        self._stop_event = threading.Event()
+        # 后台监听线程
+        self._watcher: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        """统一路径写法，保证 "prompt/a.md" 与 "./prompt/a.md" 对应同一条目"""
+        return os.path.normpath(path)
+
+    def _scan(self) -> Dict[str, int]:
+        """扫描模板目录，返回 路径 -> 修改时间"""
+        files = {}
+        for name in os.listdir(self.prompt_dir):
+            path = self._normalize(os.path.join(self.prompt_dir, name))
+            if os.path.isfile(path):
+                files[path] = os.stat(path).st_mtime_ns
+        return files
+
+    def _load_entry(self, path: str, mtime_ns: int, version: int) -> PromptEntry:
+        """读取并编译单个模板文件"""
+        with open(path, encoding="utf-8") as f:
+            template = f.read()
+        return PromptEntry(path=path, template=template, prompt=PromptTemplate.from_template(template), mtime_ns=mtime_ns, version=version)
+
+    def reload(self) -> bool:
+        """检查模板文件变化并重新加载，返回是否有模板发生变化"""
+        with self._reload_lock:
+            current = self._entries
+            updated = dict(current)
+            changed = False
+            for path, mtime_ns in self._scan().items():
+                entry = current.get(path)
+                # 文件未变化时保留原条目
+                if entry is not None and entry.mtime_ns == mtime_ns:
+                    continue
+                try:
+                    # 新文件或已修改的文件：重新读取并编译，版本号递增
+                    updated[path] = self._load_entry(path, mtime_ns, entry.version + 1 if entry else 1)
+                    changed = True
+                    logger.info(f"提示词模板已加载: {path} 版本: {updated[path].version}")
+                except Exception as e:
+                    # 编辑过程中可能读到不完整的模板，保留旧版本，下次检查时再重试
+                    logger.error(f"提示词模板加载失败，继续使用旧版本: {path} 错误: {e}")
+            if changed:
+                # 整体替换字典引用，读取方要么看到旧版本要么看到新版本
+                self._entries = updated
+            return changed
+
+    def get(self, path: str) -> PromptEntry:
+        """获取已加载的模板条目"""
+        entry = self._entries.get(self._normalize(path))
+        if entry is None:
+            raise KeyError(f"提示词模板未加载: {path}")
+        return entry
+
+    def get_template(self, path: str) -> str:
+        """获取模板原始文本"""
+        return self.get(path).template
+
+    def get_chat_prompt(self, system_path: str, human_path: str) -> ChatPromptTemplate:
+        """获取预编译的聊天模板（system + human），模板版本变化后自动重新编译"""
+        system_entry = self.get(system_path)
+        human_entry = self.get(human_path)
+        key = (system_entry.path, system_entry.version, human_entry.path, human_entry.version)
+        chat_prompt = self._chat_prompts.get(key)
+        if chat_prompt is None:
+            chat_prompt = ChatPromptTemplate.from_messages([
+                ("system", system_entry.template),
+                ("human", human_entry.template),
+            ])
+            # 只保留最新版本的编译结果
+            self._chat_prompts = {key: chat_prompt}
+        return chat_prompt
+
+    def _watch(self) -> None:
+        """后台线程：按间隔检查模板文件的修改时间"""
+        while not self._stop_event.wait(self.reload_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"检查提示词模板变化失败: {e}")
+
+    def start(self) -> None:
+        """加载全部模板，并启动后台热加载线程"""
+        self.reload()
+        if self.reload_interval > 0 and self._watcher is None:
+            self._stop_event.clear()
+            self._watcher = threading.Thread(target=self._watch, name="prompt-registry-watcher", daemon=True)
+            self._watcher.start()
+            logger.info(f"提示词模板热加载已启动，目录: {self.prompt_dir} 检查间隔: {self.reload_interval} 秒")
+
+    def stop(self) -> None:
+        """停止后台热加载线程"""
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.reload_interval + 1)
+            self._watcher = None
@@ -0,0 +1,371 @@
+# 导入 asyncio，用于异步请求的非阻塞等待
+import asyncio
+# 导入 json 模块，用于解析请求体中的模型名称与响应体中的 token 用量
+import json
+# 导入线程锁，保证限流状态在多线程下的读写安全
+import threading
+# 导入 time 模块，用于令牌桶补充与等待计时
+import time
+# 导入 contextmanager，用于定义切换请求优先级的上下文管理器
+from contextlib import contextmanager
+# 导入 ContextVar，用于在调用链上传递请求优先级（asyncio 任务与 to_thread 线程都会继承）
+from contextvars import ContextVar
+# 导入 HTTP 日期解析函数，用于解析日期格式的 Retry-After
+from email.utils import parsedate_to_datetime
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Iterator, Optional
+# 导入 httpx，限流器以 transport 包装的形式接入共享的 HTTP 客户端
+import httpx
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+# 从当前包中导入 record，用于把排队时间与响应头耗时记入当前请求的耗时明细
+from .timing import record
+# 从当前包中导入模型请求的 Prometheus 指标
+from .metrics import LLM_LATENCY, LLM_TOKENS
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+# 请求优先级：数值越小越优先
+# 交互请求（/ask、/intervene 中的 Agent 调用、检索过滤表达式生成）
+INTERACTIVE = 0
+# 后台请求（后台摘要、数据入库时的批量向量化）
+BACKGROUND = 1
+
+# 当前调用链的请求优先级，默认视为交互请求
+_request_priority: ContextVar[int] = ContextVar("llm_request_priority", default=INTERACTIVE)
+
+# 等待名额时的轮询间隔上限（秒）
+POLL_INTERVAL = 0.05
+# 收到 429 但响应中没有 Retry-After 时的默认暂停时间（秒）
+DEFAULT_RETRY_AFTER = 1.0
+# 未设置 max_tokens 时，为对话请求预估的输出 token 数
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """在 with 块内以指定优先级发起模型请求"""
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def set_default_priority(priority: int) -> None:
+    """设置当前上下文的默认请求优先级（用于数据入库等整体为后台任务的脚本）"""
+    _request_priority.set(priority)
+
+
+# 定义令牌桶：按每分钟配额匀速补充，允许短时突发到一分钟的配额
+class TokenBucket:
+
+    def __init__(self, per_minute: float):
+        # 桶容量（一分钟的配额）
+        self.capacity = per_minute
+        # 每秒补充的令牌数
+        self.rate = per_minute / 60.0
+        # 当前令牌数（可以因实际用量超出预估而为负，即“欠账”）
+        self.tokens = per_minute
+        # 上次补充时间
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """返回获取 amount 个令牌还需等待的秒数，0 表示可以立即获取（单次请求超过桶容量时按桶容量计算）"""
+        self._refill()
+        needed = min(amount, self.capacity)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        """扣除令牌"""
+        self.tokens -= amount
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量修正（delta 为实际用量减去预估用量，可为负数即退还）"""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+# 定义单个（服务商, 模型）的限流器：请求数令牌桶 + token 数令牌桶 + 自适应并发上限 + 优先级
+class ProviderLimiter:
+    """
+    单个（服务商, 模型）的限流器：
+
+      - RPM / TPM 两个令牌桶，按每分钟配额匀速补充
+      - 并发上限按 AIMD 自适应：收到 429 时减半并暂停到 Retry-After 指定的时间，成功时缓慢回升
+      - 有高优先级请求在等待时，低优先级请求不会抢占名额
+    """
+
+    def __init__(self, key: str, rpm: float, tpm: float, max_concurrency: int, min_concurrency: int = 1):
+        # 限流器标识（host/model）
+        self.key = key
+        # 请求数与 token 数令牌桶
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        # 并发上限的取值范围与当前值
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        # 正在执行的请求数
+        self.in_flight = 0
+        # 各优先级正在等待的请求数
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        # 收到 429 后暂停发送请求直到该时间点
+        self.blocked_until = 0.0
+        # 统计信息
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # 保护以上字段的锁（同一个限流器同时被同步客户端的多个线程与异步客户端使用）
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, priority: int, tokens: int) -> float:
+        """尝试获取一个名额，成功返回 0，否则返回建议的等待秒数"""
+        with self._lock:
+            now = time.monotonic()
+            # 收到 429 后的暂停期
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            # 有更高优先级的请求在等待时让行
+            if any(count for level, count in self.waiting.items() if level < priority):
+                return POLL_INTERVAL
+            # 并发已满
+            if self.in_flight >= int(self.limit):
+                return POLL_INTERVAL
+            # 请求数或 token 数配额不足
+            delay = max(self.request_bucket.delay(1), self.token_bucket.delay(tokens))
+            if delay > 0:
+                return delay
+            self.request_bucket.take(1)
+            self.token_bucket.take(tokens)
+            self.in_flight += 1
+            self.requests += 1
+            return 0.0
+
+    def _record_wait(self, waited: float) -> None:
+        with self._lock:
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def acquire(self, priority: int, tokens: int) -> None:
+        """同步获取名额（阻塞当前线程）"""
+        start = time.monotonic()
+        with self._lock:
+            self.waiting[priority] += 1
+        try:
+            while (delay := self._try_acquire(priority, tokens)) > 0:
+                time.sleep(min(delay, POLL_INTERVAL))
+        finally:
+            with self._lock:
+                self.waiting[priority] -= 1
+        self._record_wait(time.monotonic() - start)
+
+    async def aacquire(self, priority: int, tokens: int) -> None:
+        """异步获取名额（不阻塞事件循环）"""
+        start = time.monotonic()
+        with self._lock:
+            self.waiting[priority] += 1
+        try:
+            while (delay := self._try_acquire(priority, tokens)) > 0:
+                await asyncio.sleep(min(delay, POLL_INTERVAL))
+        finally:
+            with self._lock:
+                self.waiting[priority] -= 1
+        self._record_wait(time.monotonic() - start)
+
+    def release(self, status_code: Optional[int], retry_after: Optional[float], estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """归还名额，并根据响应状态调整并发上限与 token 配额"""
+        with self._lock:
+            self.in_flight -= 1
+            if status_code == 429:
+                # 被服务商限流：并发上限减半，并暂停到 Retry-After 指定的时间
+                self.throttled += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                pause = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+                self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+                logger.warning(f"模型服务 {self.key} 返回 429，并发上限降为 {int(self.limit)}，暂停 {pause:.2f} 秒")
+            elif status_code is not None and status_code < 500:
+                # 请求成功：并发上限缓慢回升（每个“窗口”加一）
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            # 按实际 token 用量修正配额
+            if actual_tokens is not None:
+                self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回限流器运行统计"""
+        with self._lock:
+            return {
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting_interactive": self.waiting[INTERACTIVE],
+                "waiting_background": self.waiting[BACKGROUND],
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "blocked_for_s": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+                "avg_wait_ms": round(self.total_wait / self.requests * 1000, 2) if self.requests else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+            }
+
+
+# 定义限流器注册表：按请求的 host 与模型名称分配限流器
+class RateLimiterRegistry:
+
+    def __init__(self, limits_by_host: Dict[str, Dict[str, Any]], default_limits: Dict[str, Any]):
+        # host -> 限流配置（rpm、tpm、max_concurrency）
+        self.limits_by_host = limits_by_host
+        # 未单独配置的 host 使用的默认限流配置
+        self.default_limits = default_limits
+        # host/model -> 限流器
+        self._limiters: Dict[str, ProviderLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str, model: str) -> ProviderLimiter:
+        key = f"{host}/{model}"
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(key)
+                if limiter is None:
+                    limits = {**self.default_limits, **self.limits_by_host.get(host, {})}
+                    limiter = ProviderLimiter(key, limits["rpm"], limits["tpm"], limits["max_concurrency"])
+                    self._limiters[key] = limiter
+        return limiter
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {key: limiter.get_stats() for key, limiter in list(self._limiters.items())}
+
+
+# 解析请求体，返回 (模型名称, 预估 token 数)
+def _inspect_request(request: httpx.Request) -> tuple[str, int]:
+    body = request.content
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = {}
+    # 按请求体字节数粗略估算输入 token（中文约 3 字节/token，英文约 4 字节/token），加上预期输出 token
+    estimated = len(body) // 3
+    if "messages" in payload:
+        estimated += payload.get("max_completion_tokens") or payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return str(payload.get("model", "")), estimated
+
+
+# 解析 429 响应中的重试等待时间（秒）
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+# 从非流式 JSON 响应中读取实际 token 用量
+def _usage_tokens(response: httpx.Response) -> Optional[int]:
+    if response.status_code != 200 or "application/json" not in response.headers.get("content-type", ""):
+        return None
+    try:
+        return json.loads(response.content).get("usage", {}).get("total_tokens")
+    except (ValueError, AttributeError):
+        return None
+
+
+# 把一次模型请求的排队时间与响应头耗时（流式请求即首个 token 的到达时间）记入当前请求的耗时明细
+def _record_timing(request: httpx.Request, queued_at: float, sent_at: float) -> None:
+    kind = "embedding" if request.url.path.endswith("/embeddings") else "llm"
+    record(f"{kind}_queue", (sent_at - queued_at) * 1000)
+    record(f"{kind}_ttfb", (time.perf_counter() - sent_at) * 1000)
+
+
+# 按服务商与模型记录请求耗时与 token 用量指标
+def _record_metrics(request: httpx.Request, model: str, sent_at: float, status_code: Optional[int], actual_tokens: Optional[int]) -> None:
+    provider, model = request.url.host, model or "unknown"
+    LLM_LATENCY.labels(provider, model, str(status_code or "error")).observe(time.perf_counter() - sent_at)
+    if actual_tokens:
+        LLM_TOKENS.labels(provider, model).inc(actual_tokens)
+
+
+# 定义同步 transport 包装：请求发出前获取名额，收到响应后归还名额
+class RateLimitedTransport(httpx.BaseTransport):
+
+    def __init__(self, transport: httpx.BaseTransport, registry: RateLimiterRegistry):
+        self._transport = transport
+        self._registry = registry
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        model, estimated = _inspect_request(request)
+        limiter = self._registry.get(request.url.host, model)
+        queued_at = time.perf_counter()
+        limiter.acquire(_request_priority.get(), estimated)
+        sent_at = time.perf_counter()
+        status_code, retry_after, actual = None, None, None
+        try:
+            response = self._transport.handle_request(request)
+            _record_timing(request, queued_at, sent_at)
+            status_code = response.status_code
+            if status_code == 429:
+                retry_after = _retry_after(response)
+            elif "application/json" in response.headers.get("content-type", ""):
+                # 非流式响应体较小，提前读取以获得实际 token 用量（流式响应在收到响应头时即归还名额）
+                response.read()
+                actual = _usage_tokens(response)
+            return response
+        finally:
+            limiter.release(status_code, retry_after, estimated, actual)
+            _record_metrics(request, model, sent_at, status_code, actual)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+# 定义异步 transport 包装：请求发出前获取名额，收到响应后归还名额
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, registry: RateLimiterRegistry):
+        self._transport = transport
+        self._registry = registry
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        model, estimated = _inspect_request(request)
+        limiter = self._registry.get(request.url.host, model)
+        queued_at = time.perf_counter()
+        await limiter.aacquire(_request_priority.get(), estimated)
+        sent_at = time.perf_counter()
+        status_code, retry_after, actual = None, None, None
+        try:
+            response = await self._transport.handle_async_request(request)
+            _record_timing(request, queued_at, sent_at)
+            status_code = response.status_code
+            if status_code == 429:
+                retry_after = _retry_after(response)
+            elif "application/json" in response.headers.get("content-type", ""):
+                # 非流式响应体较小，提前读取以获得实际 token 用量（流式响应在收到响应头时即归还名额）
+                await response.aread()
+                actual = _usage_tokens(response)
+            return response
+        finally:
+            limiter.release(status_code, retry_after, estimated, actual)
+            _record_metrics(request, model, sent_at, status_code, actual)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
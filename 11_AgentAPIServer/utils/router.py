@@ -0,0 +1,307 @@
+# 导入 asyncio，用于并发发起对冲请求并取第一个返回的结果
+import asyncio
+# 导入线程锁，保证统计信息在多线程下的读写安全
+import threading
+# 导入 time 模块，用于统计调用耗时与熔断恢复时间
+import time
+# 导入双端队列，用于保存最近的延迟样本
+from collections import deque
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, List, Optional, Sequence
+# 导入 LangChain 对话模型基类，路由模型本身也是一个对话模型，可直接交给 create_agent 使用
+from langchain_core.language_models.chat_models import BaseChatModel
+# 导入回调管理器类型
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+# 导入消息与生成结果类型
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+# 导入 Runnable 类型，用于 bind_tools 的返回值注解
+from langchain_core.runnables import Runnable
+# 导入 pydantic 的私有属性声明，用于保存运行时统计
+from pydantic import PrivateAttr
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+
+# 定义单个服务商的运行统计与熔断器
+class ProviderState:
+    """
+    记录单个服务商的延迟与错误情况，并实现熔断器：
+
+      - closed：正常调用
+      - open：连续失败达到阈值后熔断，recovery_time 秒内不再路由到该服务商
+      - half_open：熔断时间结束后放行一个试探请求，成功则恢复，失败则重新熔断
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_time: float, window: int = 200, ewma_alpha: float = 0.2):
+        # 服务商名称（对应 MODEL_CONFIGS 中的 llm_type）
+        self.name = name
+        # 连续失败多少次后熔断
+        self.failure_threshold = failure_threshold
+        # 熔断持续时间（秒）
+        self.recovery_time = recovery_time
+        # 指数加权移动平均的平滑系数
+        self.ewma_alpha = ewma_alpha
+        # 最近的成功调用延迟样本（秒），用于计算 p95
+        self.latencies: deque = deque(maxlen=window)
+        # 延迟的指数加权移动平均（秒），尚无样本时为 None
+        self.ewma: Optional[float] = None
+        # 调用统计
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        # 作为对冲请求被发起的次数，以及对冲请求先于主请求返回的次数
+        self.hedges = 0
+        self.hedge_wins = 0
+        # 熔断器状态
+        self.state = "closed"
+        self.opened_at = 0.0
+        # half_open 状态下是否已有试探请求在执行
+        self.trial_in_flight = False
+        # 保护以上字段的锁
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """判断当前是否可以向该服务商发起请求（熔断结束时转为 half_open 并占用试探名额）"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_time:
+                self.state = "half_open"
+                self.trial_in_flight = False
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency: float) -> None:
+        """记录一次成功调用"""
+        with self._lock:
+            self.calls += 1
+            self.consecutive_failures = 0
+            self.latencies.append(latency)
+            self.ewma = latency if self.ewma is None else self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.ewma
+            if self.state != "closed":
+                logger.info(f"服务商 {self.name} 试探请求成功，熔断器恢复")
+            self.state = "closed"
+            self.trial_in_flight = False
+
+    def record_failure(self, error: BaseException) -> None:
+        """记录一次失败调用，连续失败达到阈值（或试探失败）时熔断"""
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"服务商 {self.name} 连续失败 {self.consecutive_failures} 次，熔断 {self.recovery_time} 秒，最近错误: {error}")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_cancelled(self, elapsed: float) -> None:
+        """对冲落败被取消的请求：其耗时是实际延迟的下限，只计入移动平均，使持续偏慢的服务商降低优先级"""
+        with self._lock:
+            self.trial_in_flight = False
+            if self.ewma is not None:
+                self.ewma = self.ewma_alpha * max(elapsed, self.ewma) + (1 - self.ewma_alpha) * self.ewma
+
+    def release(self) -> None:
+        """归还未实际使用的试探名额"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        """计算最近延迟样本的分位数"""
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回该服务商的运行统计"""
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            return {
+                "state": self.state,
+                "calls": self.calls,
+                "failures": self.failures,
+                "error_rate": round(self.failures / self.calls, 4) if self.calls else 0.0,
+                "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+
+
+# 定义多服务商路由对话模型：按延迟选择服务商，慢请求发起对冲，失败时自动切换
+class RoutedChatModel(BaseChatModel):
+    """
+    多服务商路由对话模型：
+
+      - 按延迟的指数加权移动平均选择主服务商，熔断中的服务商排在最后
+      - 主请求超过其 p95 延迟仍未返回时，向下一个服务商发起对冲请求，取先返回的结果并取消另一个
+      - 请求失败时依次切换到其余服务商，每个服务商独立熔断
+    """
+
+    # 服务商名称 -> 对话模型实例（按优先级排列）
+    providers: Dict[str, BaseChatModel]
+    # 发起对冲请求所依据的延迟分位数
+    hedge_quantile: float = 0.95
+    # 对冲等待时间的下限（秒），避免在延迟很低时频繁对冲
+    min_hedge_delay: float = 0.5
+    # 延迟样本不足时使用的对冲等待时间（秒）
+    initial_hedge_delay: float = 3.0
+    # 计算分位数所需的最少延迟样本数
+    min_samples: int = 10
+    # 是否启用对冲请求
+    hedging: bool = True
+    # 连续失败多少次后熔断
+    failure_threshold: int = 5
+    # 熔断持续时间（秒）
+    recovery_time: float = 30.0
+
+    # 各服务商的运行统计与熔断器
+    _states: Dict[str, ProviderState] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        # 为每个服务商创建独立的统计与熔断器
+        self._states = {
+            name: ProviderState(name, self.failure_threshold, self.recovery_time) for name in self.providers
+        }
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"providers": list(self.providers)}
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any) -> Runnable:
+        """绑定工具：各服务商均兼容 OpenAI 协议，复用第一个服务商的工具格式转换"""
+        first = next(iter(self.providers.values()))
+        bound = first.bind_tools(tools, tool_choice=tool_choice, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def _ordered(self) -> List[str]:
+        """按路由优先级排列服务商：未熔断的在前，其中延迟低的在前，尚无延迟样本的按配置顺序排在其后"""
+        def key(item):
+            index, name = item
+            state = self._states[name]
+            return (state.state == "open", state.ewma is None, state.ewma or 0.0, index)
+        return [name for _, name in sorted(enumerate(self.providers), key=key)]
+
+    def _hedge_delay(self, name: str) -> float:
+        """计算主请求的对冲等待时间"""
+        state = self._states[name]
+        if len(state.latencies) < self.min_samples:
+            return self.initial_hedge_delay
+        return max(self.min_hedge_delay, state.percentile(self.hedge_quantile))
+
+    @staticmethod
+    def _to_result(message: BaseMessage) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _acall(self, name: str, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> BaseMessage:
+        """调用单个服务商并记录延迟与错误"""
+        state = self._states[name]
+        start = time.perf_counter()
+        try:
+            message = await self.providers[name].ainvoke(messages, stop=stop, **kwargs)
+        except asyncio.CancelledError:
+            # 对冲落败被取消，不计入失败
+            state.record_cancelled(time.perf_counter() - start)
+            raise
+        except Exception as e:
+            state.record_failure(e)
+            raise
+        state.record_success(time.perf_counter() - start)
+        return message
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        """异步调用：主请求 + 对冲请求 + 失败切换"""
+        # 依次取出可用的服务商
+        candidates = [name for name in self._ordered() if self._states[name].available()]
+        if not candidates:
+            # 全部熔断时仍按优先级尝试，避免整体不可用
+            candidates = self._ordered()
+        last_error: Optional[BaseException] = None
+        pending: Dict[asyncio.Task, str] = {}
+        # 作为对冲请求发起的服务商
+        hedged = set()
+        try:
+            while candidates or pending:
+                # 当前没有进行中的请求时，发起主请求
+                if not pending:
+                    primary = candidates.pop(0)
+                    pending[asyncio.create_task(self._acall(primary, messages, stop, **kwargs))] = primary
+                    timeout = self._hedge_delay(primary) if self.hedging and candidates else None
+                else:
+                    timeout = None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 主请求超过 p95 仍未返回，向下一个服务商发起对冲请求
+                    backup = candidates.pop(0)
+                    self._states[backup].hedges += 1
+                    hedged.add(backup)
+                    logger.info(f"服务商 {pending[next(iter(pending))]} 响应超过 {timeout:.2f} 秒，向 {backup} 发起对冲请求")
+                    pending[asyncio.create_task(self._acall(backup, messages, stop, **kwargs))] = backup
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        # 对冲请求先返回，计入对冲胜出次数
+                        if name in hedged:
+                            self._states[name].hedge_wins += 1
+                        return self._to_result(task.result())
+                    last_error = task.exception()
+                    logger.warning(f"服务商 {name} 调用失败，切换到下一个服务商: {last_error}")
+        finally:
+            # 取消仍在进行的请求（对冲落败的一方）
+            for task in pending:
+                task.cancel()
+            # 归还未实际使用的服务商占用的试探名额
+            for name in candidates:
+                self._states[name].release()
+        raise last_error if last_error else RuntimeError("没有可用的服务商")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        """同步调用：按优先级依次尝试，失败时切换（同步场景不发起对冲请求）"""
+        candidates = [name for name in self._ordered() if self._states[name].available()] or self._ordered()
+        last_error: Optional[BaseException] = None
+        for index, name in enumerate(candidates):
+            state = self._states[name]
+            start = time.perf_counter()
+            try:
+                message = self.providers[name].invoke(messages, stop=stop, **kwargs)
+            except Exception as e:
+                state.record_failure(e)
+                last_error = e
+                logger.warning(f"服务商 {name} 调用失败，切换到下一个服务商: {e}")
+                continue
+            state.record_success(time.perf_counter() - start)
+            # 归还未实际使用的服务商占用的试探名额
+            for unused in candidates[index + 1:]:
+                self._states[unused].release()
+            return self._to_result(message)
+        raise last_error if last_error else RuntimeError("没有可用的服务商")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回各服务商的延迟、错误率、熔断状态与对冲统计"""
+        return {
+            "order": self._ordered(),
+            "providers": {name: state.get_stats() for name, state in self._states.items()},
+        }
@@ -0,0 +1,316 @@
+# 导入 asyncio，用于运行后台 worker 与租约续期任务
+import asyncio
+# 导入 os 模块，用于生成 worker 标识
+import os
+# 导入 socket 模块，用于生成 worker 标识
+import socket
+# 导入 time 模块，用于判断租约是否已经过期
+import time
+# 导入 uuid 模块，用于生成任务 ID
+import uuid
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+# 导入 psycopg 的 JSON 包装与字典行工厂
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+# 导入异步 PostgreSQL 连接池
+from psycopg_pool import AsyncConnectionPool
+# 导入检查点保存器基类，用于读取任务执行进度
+from langgraph.checkpoint.base import BaseCheckpointSaver
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+
+# 任务的终止状态
+TERMINAL_STATUSES = ("completed", "interrupted", "failed")
+
+
+# 定义基于 PostgreSQL 的任务队列：任务持久化在 agent_runs 表中，服务重启后仍可继续执行
+class RunQueue:
+    """
+    Agent 异步任务队列：
+
+      - 任务状态：queued（排队）→ running（执行中）→ completed / interrupted / failed
+      - 使用 FOR UPDATE SKIP LOCKED 领取任务，多个进程、多个 worker 并发领取互不阻塞
+      - 执行中的任务持有租约，worker 定期续期；进程崩溃后租约过期，任务会被其他 worker 重新领取
+      - 同一个 thread_id 的任务按创建顺序串行执行，避免并发写同一个会话的 checkpoint
+    """
+
+    def __init__(self, pool: AsyncConnectionPool):
+        # 数据库连接池（连接需开启 autocommit）
+        self.pool = pool
+
+    async def setup(self) -> None:
+        """创建任务表与索引"""
+        async with self.pool.connection() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS agent_runs (
+                    run_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    thread_id TEXT NOT NULL,
+                    payload JSONB NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    result JSONB,
+                    error TEXT,
+                    attempts INT NOT NULL DEFAULT 0,
+                    checkpoint_id TEXT,
+                    worker_id TEXT,
+                    lease_until TIMESTAMPTZ,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    started_at TIMESTAMPTZ,
+                    finished_at TIMESTAMPTZ
+                )
+            """)
+            # 部分索引：只索引未结束的任务，领取任务时扫描量与历史任务数无关
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS agent_runs_pending_idx
+                ON agent_runs (created_at) WHERE status IN ('queued', 'running')
+            """)
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS agent_runs_thread_idx
+                ON agent_runs (thread_id, created_at) WHERE status IN ('queued', 'running')
+            """)
+
+    async def enqueue(self, kind: str, user_id: str, thread_id: str, payload: Dict[str, Any], checkpoint_id: Optional[str] = None) -> str:
+        """提交任务，返回任务 ID；checkpoint_id 为提交时会话的最新 checkpoint（会话还没有 checkpoint 时记为空字符串）"""
+        run_id = uuid.uuid4().hex
+        async with self.pool.connection() as conn:
+            await conn.execute(
+                "INSERT INTO agent_runs (run_id, kind, user_id, thread_id, payload, checkpoint_id) VALUES (%s, %s, %s, %s, %s, %s)",
+                (run_id, kind, user_id, thread_id, Jsonb(payload), checkpoint_id or "")
+            )
+        return run_id
+
+    async def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """领取一个可执行的任务（排队中，或租约已过期的执行中任务），没有任务时返回 None"""
+        async with self.pool.connection() as conn:
+            cur = conn.cursor(row_factory=dict_row)
+            await cur.execute("""
+                UPDATE agent_runs
+                SET status = 'running', attempts = attempts + 1, worker_id = %s,
+                    lease_until = now() + make_interval(secs => %s), started_at = COALESCE(started_at, now())
+                WHERE run_id = (
+                    SELECT r.run_id FROM agent_runs r
+                    WHERE (r.status = 'queued' OR (r.status = 'running' AND r.lease_until < now()))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM agent_runs p
+                          WHERE p.thread_id = r.thread_id AND p.created_at < r.created_at AND p.status IN ('queued', 'running')
+                      )
+                    ORDER BY r.created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING *
+            """, (worker_id, lease_seconds))
+            return await cur.fetchone()
+
+    async def extend_lease(self, run_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """续期租约，返回任务是否仍由当前 worker 持有"""
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                "UPDATE agent_runs SET lease_until = now() + make_interval(secs => %s) WHERE run_id = %s AND worker_id = %s AND status = 'running'",
+                (lease_seconds, run_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+    async def set_checkpoint(self, run_id: str, checkpoint_id: Optional[str]) -> None:
+        """记录任务开始执行前会话的最新 checkpoint ID，重试时据此判断上一次执行是否已经产生进度"""
+        async with self.pool.connection() as conn:
+            await conn.execute("UPDATE agent_runs SET checkpoint_id = %s WHERE run_id = %s", (checkpoint_id or "", run_id))
+
+    async def finish(self, run_id: str, worker_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        """记录任务结果（只有当前持有任务的 worker 可以写入）"""
+        async with self.pool.connection() as conn:
+            await conn.execute("""
+                UPDATE agent_runs SET status = %s, result = %s, error = %s, finished_at = now(), lease_until = NULL
+                WHERE run_id = %s AND worker_id = %s
+            """, (status, Jsonb(result) if result is not None else None, error, run_id, worker_id))
+
+    async def retry(self, run_id: str, worker_id: str, error: str) -> None:
+        """执行失败，放回队列等待重试"""
+        async with self.pool.connection() as conn:
+            await conn.execute(
+                "UPDATE agent_runs SET status = 'queued', error = %s, lease_until = NULL WHERE run_id = %s AND worker_id = %s",
+                (error, run_id, worker_id)
+            )
+
+    async def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务"""
+        async with self.pool.connection() as conn:
+            cur = conn.cursor(row_factory=dict_row)
+            await cur.execute("SELECT * FROM agent_runs WHERE run_id = %s", (run_id,))
+            return await cur.fetchone()
+
+    async def get_stats(self) -> Dict[str, int]:
+        """按状态统计任务数"""
+        async with self.pool.connection() as conn:
+            cur = await conn.execute("SELECT status, count(*) FROM agent_runs GROUP BY status")
+            return {status: count for status, count in await cur.fetchall()}
+
+
+# 定义任务执行 worker 池：在 API 服务进程内运行若干个后台协程，从队列领取并执行任务
+class RunWorkerPool:
+    """
+    任务执行 worker 池：
+
+      - 每个 API 进程启动 concurrency 个后台协程，空闲时按 poll_interval 轮询队列，本进程提交任务时立即唤醒
+      - 执行期间每隔 lease_seconds/3 续期租约，租约失效（已被其他 worker 领取或续期失败直到过期）时取消执行且不写入结果；
+        失败的任务放回队列重试，超过 max_attempts 次后标记为 failed
+      - 关闭时停止领取新任务，等待执行中的任务完成，超时后取消（任务租约过期后由其他进程重新领取）
+    """
+
+    def __init__(self,
+                 queue: RunQueue,
+                 execute: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 concurrency: int = 4,
+                 poll_interval: float = 0.5,
+                 lease_seconds: float = 60,
+                 max_attempts: int = 3):
+        self.queue = queue
+        # 任务执行函数：接收任务记录，返回 {"status": ..., ...} 结果
+        self.execute = execute
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # 本进程提交任务时用于唤醒空闲 worker 的事件
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._tasks: List[asyncio.Task] = []
+        # 统计信息
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.lease_lost = 0
+
+    def start(self) -> None:
+        """启动后台 worker 协程"""
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = [asyncio.create_task(self._worker(f"{prefix}:{i}")) for i in range(self.concurrency)]
+        logger.info(f"任务执行 worker 已启动，并发数: {self.concurrency}")
+
+    async def stop(self, timeout: float = 30) -> None:
+        """停止领取新任务，等待执行中的任务完成"""
+        self._stopping = True
+        self._wakeup.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout) if self._tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        logger.info(f"任务执行 worker 已停止，被取消的执行中任务数: {len(pending)}")
+
+    def notify(self) -> None:
+        """唤醒空闲的 worker"""
+        self._wakeup.set()
+
+    async def _worker(self, worker_id: str) -> None:
+        while not self._stopping:
+            try:
+                run = await self.queue.claim(worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+                run = None
+            if run is None:
+                # 没有任务时等待唤醒或轮询间隔
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(worker_id, run)
+
+    async def _keep_lease(self, run_id: str, worker_id: str, execution: asyncio.Task) -> bool:
+        """定期续期租约；租约已被其他 worker 接管，或续期连续失败直到租约过期时，取消任务执行并返回 False"""
+        renewed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if await self.queue.extend_lease(run_id, worker_id, self.lease_seconds):
+                    renewed_at = time.monotonic()
+                    continue
+                logger.warning(f"任务租约已失效，停止执行，任务ID: {run_id}")
+            except Exception as e:
+                logger.error(f"任务租约续期失败，任务ID: {run_id} 错误: {e}")
+                # 租约尚未过期时继续重试续期
+                if time.monotonic() - renewed_at < self.lease_seconds:
+                    continue
+                logger.warning(f"任务租约续期失败且已过期，停止执行，任务ID: {run_id}")
+            # 租约过期后任务可能已被其他 worker 领取，继续执行会与其重复执行并写入结果
+            execution.cancel()
+            return False
+
+    async def _run(self, worker_id: str, run: Dict[str, Any]) -> None:
+        run_id = run["run_id"]
+        if run["attempts"] > self.max_attempts:
+            self.failed += 1
+            await self.queue.finish(run_id, worker_id, "failed", error=f"超过最大重试次数，最后一次错误: {run['error']}")
+            return
+        logger.info(f"开始执行任务，任务ID: {run_id} 类型: {run['kind']} 会话ID: {run['thread_id']} 第 {run['attempts']} 次执行")
+        self.running += 1
+        execution = asyncio.create_task(self.execute(run))
+        lease_task = asyncio.create_task(self._keep_lease(run_id, worker_id, execution))
+        try:
+            result = await execution
+            await self.queue.finish(run_id, worker_id, result["status"], result=result)
+            self.completed += 1
+            logger.info(f"任务执行结束，任务ID: {run_id} 状态: {result['status']}")
+        except asyncio.CancelledError:
+            # 租约失效被取消：任务由重新领取的 worker 负责，不更新状态
+            if lease_task.done() and not lease_task.cancelled() and lease_task.result() is False:
+                self.lease_lost += 1
+                return
+            # 服务关闭时被取消，不更新状态，租约过期后由其他进程重新领取
+            raise
+        except Exception as e:
+            logger.error(f"任务执行失败，任务ID: {run_id} 错误: {e}")
+            error = f"{type(e).__name__}: {e}"
+            if run["attempts"] < self.max_attempts:
+                self.retried += 1
+                await self.queue.retry(run_id, worker_id, error)
+            else:
+                self.failed += 1
+                await self.queue.finish(run_id, worker_id, "failed", error=error)
+        finally:
+            lease_task.cancel()
+            self.running -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "lease_lost": self.lease_lost,
+        }
+
+
+async def checkpoint_progress(checkpointer: BaseCheckpointSaver, thread_id: str) -> Optional[Dict[str, Any]]:
+    """从 checkpointer 读取会话的最新进度：checkpoint ID、步数与最后一条消息摘要"""
+    checkpoint_tuple = await checkpointer.aget_tuple({"configurable": {"thread_id": thread_id}})
+    if checkpoint_tuple is None:
+        return None
+    messages = checkpoint_tuple.checkpoint.get("channel_values", {}).get("messages") or []
+    last = messages[-1] if messages else None
+    progress = {
+        "checkpoint_id": checkpoint_tuple.config["configurable"].get("checkpoint_id"),
+        "step": (checkpoint_tuple.metadata or {}).get("step"),
+        "messages": len(messages),
+    }
+    if last is not None:
+        progress["last_message"] = {
+            "type": last.type,
+            "tool_calls": [call["name"] for call in getattr(last, "tool_calls", None) or []],
+            "content": str(last.content)[:200],
+        }
+    return progress
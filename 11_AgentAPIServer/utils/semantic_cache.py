@@ -0,0 +1,295 @@
+# 导入线程锁，保证索引在多线程下的读写安全
+import threading
+# 导入 time 模块，用于计算缓存过期时间
+import time
+# 导入 uuid 模块，用于生成缓存条目的唯一键
+import uuid
+# 导入 dataclass，用于定义缓存条目
+from dataclasses import dataclass
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+# 导入 numpy，用于向量归一化与批量计算余弦相似度
+import numpy as np
+# 导入嵌入模型基类
+from langchain_core.embeddings import Embeddings
+# 导入消息类型，用于从 Agent 运行结果中提取本轮调用过的工具
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+# 导入 LangGraph 键值存储基类，多 worker 部署时用于在进程之间同步缓存条目
+from langgraph.store.base import BaseStore
+# 从当前包中导入 Config 配置类，用于读取语义缓存配置
+from .config import Config
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+# 从当前包中导入缓存事件的 Prometheus 指标
+from .metrics import CACHE_EVENTS
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+
+# 使用 @dataclass 定义语义缓存条目
+@dataclass
+class SemanticCacheEntry:
+    # 条目唯一键（同时作为共享存储中的 key）
+    key: str
+    # 原始问题
+    question: str
+    # Agent 的最终回答
+    answer: str
+    # 生成该回答时调用过的工具
+    tools_used: Tuple[str, ...]
+    # 写入时间
+    created_at: float
+    # 过期时间
+    expire_at: float
+
+
+# 定义单个用户的向量索引：归一化后的问题向量按行存放在矩阵中，一次矩阵乘法得到全部相似度
+class _UserIndex:
+
+    def __init__(self, dim: int):
+        # 问题向量矩阵（每行一个归一化向量）
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        # 与矩阵行一一对应的缓存条目
+        self.entries: List[SemanticCacheEntry] = []
+        # 已有条目的键，用于同步时去重
+        self.keys = set()
+
+    def search(self, vector: np.ndarray) -> Tuple[Optional[SemanticCacheEntry], float]:
+        """返回与给定向量最相似且未过期的条目及其相似度"""
+        if not self.entries:
+            return None, 0.0
+        # 向量已归一化，点积即余弦相似度
+        scores = self.vectors @ vector
+        now = time.time()
+        # 按相似度从高到低查找第一条未过期的条目
+        for index in np.argsort(-scores):
+            entry = self.entries[index]
+            if entry.expire_at >= now:
+                return entry, float(scores[index])
+        return None, 0.0
+
+    def add(self, vector: np.ndarray, entry: SemanticCacheEntry, max_entries: int) -> None:
+        """追加条目，先清理过期条目，再按写入时间淘汰超出容量的条目"""
+        now = time.time()
+        keep = [i for i, e in enumerate(self.entries) if e.expire_at >= now]
+        # 超出容量时只保留最新写入的条目（为新条目预留一个位置）
+        keep = keep[-(max_entries - 1):] if max_entries > 1 else []
+        self.vectors = np.vstack([self.vectors[keep], vector[None, :]])
+        self.entries = [self.entries[i] for i in keep] + [entry]
+        self.keys = {e.key for e in self.entries}
+
+
+# 定义语义缓存：对语义相近的重复问题直接返回已有回答，跳过完整的 ReAct 循环
+class SemanticCache:
+    """
+    Agent 问答语义缓存：
+
+      - 使用配置的嵌入模型对问题编码，在当前用户的向量索引中查找相似度超过阈值的历史问题
+      - 缓存有效期取决于生成回答时调用过的工具（例如天气类工具的结果很快过时），有效期为 0 的工具不缓存
+      - 按 user_id 隔离，不同用户之间不会共享回答
+      - 只缓存未触发人工审批、正常完成的回答
+      - 传入 shared_store 时，写入的条目同时保存到共享存储，各 worker 按 sync_interval 拉取其他 worker 写入的条目
+    """
+
+    # 共享存储中的命名空间前缀
+    NAMESPACE = "semantic_cache"
+
+    def __init__(self,
+                 embeddings: Embeddings,
+                 threshold: float = 0.92,
+                 default_ttl: float = 3600,
+                 tool_ttls: Optional[Dict[str, float]] = None,
+                 max_entries_per_user: int = 1000,
+                 shared_store: Optional[BaseStore] = None,
+                 sync_interval: float = 5):
+        # 嵌入模型，用于对问题编码
+        self.embeddings = embeddings
+        # 命中所需的最低余弦相似度
+        self.threshold = threshold
+        # 未调用任何工具（或工具未单独配置）时的有效期（秒）
+        self.default_ttl = default_ttl
+        # 按工具名配置的有效期（秒）
+        self.tool_ttls = tool_ttls or {}
+        # 每个用户最多缓存的问答条数
+        self.max_entries_per_user = max_entries_per_user
+        # 多 worker 共享的存储（未配置时只在本进程内缓存）
+        self.shared_store = shared_store
+        # 拉取共享条目的最小间隔（秒）
+        self.sync_interval = sync_interval
+        # user_id -> (上次拉取时间, 已拉取条目的最大同步键)
+        self._sync_marks: Dict[str, Tuple[float, str]] = {}
+        # user_id -> 用户向量索引
+        self._indexes: Dict[str, _UserIndex] = {}
+        # 保护索引的锁
+        self._lock = threading.Lock()
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.rejected = 0
+        self.synced = 0
+
+    async def aembed(self, question: str) -> np.ndarray:
+        """对问题编码并归一化，返回的向量可同时用于查找与写入，避免重复调用嵌入模型"""
+        vector = np.asarray(await self.embeddings.aembed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, user_id: str, vector: np.ndarray) -> Optional[SemanticCacheEntry]:
+        """在当前用户的索引中查找可复用的回答"""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            entry, score = index.search(vector) if index is not None else (None, 0.0)
+            if entry is not None and score >= self.threshold:
+                self.hits += 1
+                CACHE_EVENTS.labels("semantic", "hits").inc()
+                logger.info(f"语义缓存命中，用户ID: {user_id} 相似度: {score:.4f} 命中问题: {entry.question}")
+                return entry
+            self.misses += 1
+            CACHE_EVENTS.labels("semantic", "misses").inc()
+            return None
+
+    def ttl_for(self, tools_used: Iterable[str]) -> float:
+        """根据调用过的工具计算有效期，取各工具有效期的最小值"""
+        return min([self.tool_ttls.get(name, self.default_ttl) for name in tools_used] + [self.default_ttl])
+
+    def store(self, user_id: str, question: str, vector: np.ndarray, answer: str, tools_used: Iterable[str]) -> Optional[SemanticCacheEntry]:
+        """写入一条问答，返回写入的条目，不缓存时返回 None"""
+        tools_used = tuple(sorted(set(tools_used)))
+        ttl = self.ttl_for(tools_used)
+        with self._lock:
+            # 有效期为 0 的工具（实时数据）参与生成的回答不缓存
+            if ttl <= 0:
+                self.rejected += 1
+                return None
+            now = time.time()
+            entry = SemanticCacheEntry(key=uuid.uuid4().hex, question=question, answer=answer, tools_used=tools_used, created_at=now, expire_at=now + ttl)
+            index = self._indexes.setdefault(user_id, _UserIndex(vector.shape[0]))
+            index.add(vector, entry, self.max_entries_per_user)
+            self.stores += 1
+        logger.info(f"语义缓存写入，用户ID: {user_id} 调用工具: {list(tools_used)} 有效期: {ttl} 秒")
+        return entry
+
+    @staticmethod
+    def _sync_key(created_at: float) -> str:
+        """同步键：定长的写入时间字符串（共享存储按字符串比较过滤条件）"""
+        return f"{created_at:020.6f}"
+
+    async def alookup(self, user_id: str, vector: np.ndarray) -> Optional[SemanticCacheEntry]:
+        """先拉取其他 worker 写入的条目，再在本地索引中查找"""
+        await self._sync(user_id)
+        return self.lookup(user_id, vector)
+
+    async def astore(self, user_id: str, question: str, vector: np.ndarray, answer: str, tools_used: Iterable[str]) -> Optional[SemanticCacheEntry]:
+        """写入本地索引，并同步写入共享存储"""
+        entry = self.store(user_id, question, vector, answer, tools_used)
+        if entry is not None and self.shared_store is not None:
+            try:
+                await self.shared_store.aput(
+                    (self.NAMESPACE, user_id),
+                    entry.key,
+                    {
+                        "question": entry.question,
+                        "answer": entry.answer,
+                        "tools_used": list(entry.tools_used),
+                        "created_at": entry.created_at,
+                        "expire_at": entry.expire_at,
+                        "sync_key": self._sync_key(entry.created_at),
+                        "vector": vector.tolist(),
+                    },
+                    index=False
+                )
+            except Exception as e:
+                # 共享存储故障时只影响其他 worker 的命中率，不影响本次请求
+                logger.error(f"语义缓存写入共享存储失败: {e}")
+        return entry
+
+    async def _sync(self, user_id: str) -> None:
+        """按间隔从共享存储拉取该用户新写入的条目"""
+        if self.shared_store is None:
+            return
+        now = time.time()
+        checked_at, since = self._sync_marks.get(user_id, (0.0, ""))
+        if now - checked_at < self.sync_interval:
+            return
+        # 先更新拉取时间，避免同一用户的并发请求重复拉取
+        self._sync_marks[user_id] = (now, since)
+        try:
+            items = await self.shared_store.asearch(
+                (self.NAMESPACE, user_id),
+                filter={"sync_key": {"$gt": since}} if since else None,
+                limit=self.max_entries_per_user
+            )
+        except Exception as e:
+            logger.error(f"语义缓存从共享存储拉取失败: {e}")
+            return
+        with self._lock:
+            for item in sorted(items, key=lambda i: i.value["sync_key"]):
+                value = item.value
+                since = max(since, value["sync_key"])
+                index = self._indexes.setdefault(user_id, _UserIndex(len(value["vector"])))
+                # 跳过本进程写入过的条目与已过期的条目
+                if item.key in index.keys or value["expire_at"] < now:
+                    continue
+                entry = SemanticCacheEntry(key=item.key, question=value["question"], answer=value["answer"], tools_used=tuple(value["tools_used"]),
+                                           created_at=value["created_at"], expire_at=value["expire_at"])
+                index.add(np.asarray(value["vector"], dtype=np.float32), entry, self.max_entries_per_user)
+                self.synced += 1
+            self._sync_marks[user_id] = (now, since)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._indexes),
+                "entries": sum(len(index.entries) for index in self._indexes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "rejected": self.rejected,
+                "synced": self.synced,
+                "shared": self.shared_store is not None,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# 从本轮 Agent 运行产生的消息中提取调用过的工具名称（最后一条用户消息之后的工具调用）
+def tools_used_in_turn(messages: List[AnyMessage]) -> List[str]:
+    names = []
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, AIMessage):
+            names.extend(call["name"] for call in message.tool_calls)
+    return names
+
+
+# 进程内共享的语义缓存实例
+_shared_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache(embeddings: Embeddings, store: Optional[BaseStore] = None) -> Optional[SemanticCache]:
+    """获取进程内共享的语义缓存，未启用时返回 None；配置 SEMANTIC_CACHE_SHARED 时通过 store 在 worker 之间同步"""
+    global _shared_cache
+    if not Config.SEMANTIC_CACHE_ENABLED:
+        return None
+    # 首次调用时创建共享实例
+    if _shared_cache is None:
+        _shared_cache = SemanticCache(
+            embeddings=embeddings,
+            threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+            default_ttl=Config.SEMANTIC_CACHE_TTL,
+            tool_ttls=Config.SEMANTIC_CACHE_TOOL_TTLS,
+            max_entries_per_user=Config.SEMANTIC_CACHE_MAX_ENTRIES_PER_USER,
+            shared_store=store if Config.SEMANTIC_CACHE_SHARED else None,
+            sync_interval=Config.SEMANTIC_CACHE_SYNC_INTERVAL
+        )
+        logger.info(f"语义缓存已启用，相似度阈值: {Config.SEMANTIC_CACHE_THRESHOLD} 默认有效期: {Config.SEMANTIC_CACHE_TTL} 秒 多 worker 同步: {_shared_cache.shared_store is not None}")
+    return _shared_cache
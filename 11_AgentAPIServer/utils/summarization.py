@@ -0,0 +1,246 @@
+# 导入 asyncio，用于在后台调度摘要任务
+import asyncio
+# 导入 contextvars，用于让后台任务脱离当前请求的运行上下文（回调、追踪等）
+import contextvars
+# 导入 threading，用于同步调用场景下在后台线程中生成摘要
+import threading
+# 导入 time 模块，用于记录摘要生成时间
+import time
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Optional
+# 导入 LangChain 摘要中间件，后台摘要中间件在其基础上扩展
+from langchain.agents.middleware import SummarizationMiddleware
+from langchain.agents.middleware.types import AgentState
+# 导入 RemoveMessage，用于在状态中替换消息；get_buffer_string 用于把待摘要的消息格式化为文本
+from langchain_core.messages import AnyMessage, RemoveMessage, get_buffer_string
+# 导入特殊常量 REMOVE_ALL_MESSAGES，表示删除全部消息
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+# 导入 get_config，用于在中间件中读取当前运行的 thread_id
+from langgraph.config import get_config
+# 导入 Runtime，表示运行时上下文（包含 store 等）
+from langgraph.runtime import Runtime
+# 导入键值存储基类
+from langgraph.store.base import BaseStore
+# 导入限流优先级，后台摘要请求让行给交互请求
+from .rate_limiter import request_priority, BACKGROUND
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+# 预计算摘要在 store 中的命名空间前缀，完整命名空间为 ("summaries", thread_id)
+SUMMARY_NAMESPACE = "summaries"
+# 每个会话只保留最新一份预计算摘要
+SUMMARY_KEY = "latest"
+
+# 进程内正在执行的后台摘要任务（thread_id -> 任务），Agent 实例按请求创建，因此放在模块级别共享
+_inflight_tasks: Dict[str, Any] = {}
+# 保护 _inflight_tasks 的锁（同步调用场景下会在多个线程中访问）
+_inflight_lock = threading.Lock()
+# 没有配置 store 时使用的进程内兜底存储（thread_id -> 摘要记录）
+_local_summaries: Dict[str, Dict[str, Any]] = {}
+
+
+# 定义后台摘要中间件：在会话接近阈值时后台预计算摘要，下一轮再替换历史，用户请求从不等待摘要
+class BackgroundSummarizationMiddleware(SummarizationMiddleware):
+    """
+    后台摘要中间件：
+
+      - token 数达到 trigger 的 precompute_ratio 比例时，在后台调用摘要模型生成滚动摘要，并写入 store
+      - 下一轮调用模型前，若 store 中已有可用摘要，则用“摘要 + 摘要点之后的消息”替换历史
+      - 无论是否达到阈值，当前请求都不会等待摘要模型
+    """
+
+    def __init__(self, *args: Any, precompute_ratio: float = 0.8, **kwargs: Any) -> None:
+        # 初始化父类（模型、trigger、keep、token_counter 等参数与 SummarizationMiddleware 保持一致）
+        super().__init__(*args, **kwargs)
+        # 达到阈值多少比例时开始预计算摘要
+        self.precompute_ratio = precompute_ratio
+
+    @staticmethod
+    def _thread_id() -> Optional[str]:
+        """读取当前运行配置中的 thread_id"""
+        try:
+            return get_config().get("configurable", {}).get("thread_id")
+        except RuntimeError:
+            return None
+
+    def _should_precompute(self, messages: list[AnyMessage], total_tokens: int) -> bool:
+        """判断当前会话是否已接近摘要阈值"""
+        for kind, value in self._trigger_conditions:
+            if kind == "messages" and len(messages) >= value * self.precompute_ratio:
+                return True
+            if kind == "tokens" and total_tokens >= value * self.precompute_ratio:
+                return True
+            if kind == "fraction":
+                max_input_tokens = self._get_profile_limits()
+                if max_input_tokens and total_tokens >= max_input_tokens * value * self.precompute_ratio:
+                    return True
+        return False
+
+    def _apply_summary(self, messages: list[AnyMessage], item: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """如果预计算摘要仍然适用于当前历史，则返回替换历史的状态更新"""
+        if not item:
+            return None
+        # 摘要覆盖到的最后一条消息 ID
+        cutoff_id = item.get("cutoff_id")
+        # 在当前历史中定位摘要点
+        index = next((i for i, m in enumerate(messages) if m.id == cutoff_id), None)
+        # 摘要点已不在历史中（例如历史已被其他方式改写），该摘要作废
+        if index is None:
+            return None
+        # 摘要点之后的消息全部保留（包括预计算之后新增的消息）
+        preserved_messages = messages[index + 1:]
+        logger.info(f"应用后台预计算摘要，替换 {index + 1} 条历史消息，保留 {len(preserved_messages)} 条")
+        return {
+            "messages": [
+                RemoveMessage(id=REMOVE_ALL_MESSAGES),
+                *self._build_new_messages(item["summary"]),
+                *preserved_messages,
+            ]
+        }
+
+    def _prepare_precompute(self, messages: list[AnyMessage]) -> Optional[list[AnyMessage]]:
+        """计算需要摘要的消息区间，无可摘要内容时返回 None"""
+        cutoff_index = self._determine_cutoff_index(messages)
+        if cutoff_index <= 0:
+            return None
+        messages_to_summarize, _ = self._partition_messages(messages, cutoff_index)
+        return list(messages_to_summarize)
+
+    def _summary_input(self, messages_to_summarize: list[AnyMessage]) -> str:
+        """
+        构造摘要模型的输入。父类的 _create_summary 在没有可摘要消息、裁剪后为空或模型调用失败时不抛出异常，
+        而是返回 "No previous conversation history." 等占位文本，这些文本一旦写入 store，下一轮会替换真实历史，
+        因此后台摘要自行调用模型，任何失败都抛出异常
+        """
+        trimmed_messages = self._trim_messages_for_summary(messages_to_summarize)
+        if not trimmed_messages:
+            raise RuntimeError("待摘要的消息为空或超出摘要长度限制")
+        return self.summary_prompt.format(messages=get_buffer_string(trimmed_messages))
+
+    @staticmethod
+    def _summary_text(response: Any) -> str:
+        """读取摘要模型的回复，回复为空时抛出异常"""
+        summary = response.text.strip()
+        if not summary:
+            raise RuntimeError("摘要模型返回空内容")
+        return summary
+
+    @staticmethod
+    def _summary_value(summary: str, messages_to_summarize: list[AnyMessage]) -> Dict[str, Any]:
+        """构造写入 store 的摘要记录"""
+        return {
+            "summary": summary,
+            "cutoff_id": messages_to_summarize[-1].id,
+            "summarized_count": len(messages_to_summarize),
+            "created_at": time.time(),
+        }
+
+    async def _aprecompute(self, thread_id: str, store: Optional[BaseStore], messages_to_summarize: list[AnyMessage]) -> None:
+        """后台任务：生成摘要并写入 store"""
+        try:
+            start = time.perf_counter()
+            # 以后台优先级调用摘要模型
+            with request_priority(BACKGROUND):
+                # 生成失败时抛出异常，不写入 store，下一轮重新预计算
+                summary = self._summary_text(await self.model.ainvoke(self._summary_input(messages_to_summarize)))
+            value = self._summary_value(summary, messages_to_summarize)
+            if store is not None:
+                await store.aput((SUMMARY_NAMESPACE, thread_id), SUMMARY_KEY, value)
+            else:
+                _local_summaries[thread_id] = value
+            logger.info(f"会话 {thread_id} 后台摘要生成完成，覆盖 {len(messages_to_summarize)} 条消息，耗时 {time.perf_counter() - start:.2f} 秒")
+        except Exception as e:
+            logger.error(f"会话 {thread_id} 后台摘要生成失败: {e}")
+        finally:
+            with _inflight_lock:
+                _inflight_tasks.pop(thread_id, None)
+
+    def _precompute(self, thread_id: str, store: Optional[BaseStore], messages_to_summarize: list[AnyMessage]) -> None:
+        """后台线程：生成摘要并写入 store（同步调用场景）"""
+        try:
+            # 以后台优先级调用摘要模型
+            with request_priority(BACKGROUND):
+                # 生成失败时抛出异常，不写入 store，下一轮重新预计算
+                summary = self._summary_text(self.model.invoke(self._summary_input(messages_to_summarize)))
+            value = self._summary_value(summary, messages_to_summarize)
+            if store is not None:
+                store.put((SUMMARY_NAMESPACE, thread_id), SUMMARY_KEY, value)
+            else:
+                _local_summaries[thread_id] = value
+            logger.info(f"会话 {thread_id} 后台摘要生成完成，覆盖 {len(messages_to_summarize)} 条消息")
+        except Exception as e:
+            logger.error(f"会话 {thread_id} 后台摘要生成失败: {e}")
+        finally:
+            with _inflight_lock:
+                _inflight_tasks.pop(thread_id, None)
+
+    def before_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        """调用模型前：应用已就绪的摘要，或在后台线程中启动预计算"""
+        messages = state["messages"]
+        self._ensure_message_ids(messages)
+        thread_id = self._thread_id()
+        # 没有 thread_id 时无法跨轮次保存摘要，退回父类的同步摘要逻辑
+        if not thread_id:
+            return super().before_model(state, runtime)
+        # 尚未接近阈值时不可能存在预计算摘要，直接返回，避免每次调用模型都读取 store
+        if not self._should_precompute(messages, self.token_counter(messages)):
+            return None
+        store = runtime.store
+        # 读取已就绪的摘要
+        item = store.get((SUMMARY_NAMESPACE, thread_id), SUMMARY_KEY) if store is not None else None
+        update = self._apply_summary(messages, item.value if item else _local_summaries.get(thread_id))
+        if update is not None:
+            # 摘要只使用一次，应用后删除
+            if store is not None:
+                store.delete((SUMMARY_NAMESPACE, thread_id), SUMMARY_KEY)
+            _local_summaries.pop(thread_id, None)
+            return update
+        # 已接近阈值且没有可用摘要，在后台线程中预计算摘要
+        messages_to_summarize = self._prepare_precompute(messages)
+        with _inflight_lock:
+            if messages_to_summarize and thread_id not in _inflight_tasks:
+                worker = threading.Thread(target=self._precompute, args=(thread_id, store, messages_to_summarize), daemon=True)
+                _inflight_tasks[thread_id] = worker
+                worker.start()
+        return None
+
+    async def abefore_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        """调用模型前：应用已就绪的摘要，或在后台任务中启动预计算"""
+        messages = state["messages"]
+        self._ensure_message_ids(messages)
+        thread_id = self._thread_id()
+        # 没有 thread_id 时无法跨轮次保存摘要，退回父类的同步摘要逻辑
+        if not thread_id:
+            return await super().abefore_model(state, runtime)
+        # 尚未接近阈值时不可能存在预计算摘要，直接返回，避免每次调用模型都读取 store
+        if not self._should_precompute(messages, self.token_counter(messages)):
+            return None
+        store = runtime.store
+        # 读取已就绪的摘要
+        item = await store.aget((SUMMARY_NAMESPACE, thread_id), SUMMARY_KEY) if store is not None else None
+        update = self._apply_summary(messages, item.value if item else _local_summaries.get(thread_id))
+        if update is not None:
+            # 摘要只使用一次，应用后删除
+            if store is not None:
+                await store.adelete((SUMMARY_NAMESPACE, thread_id), SUMMARY_KEY)
+            _local_summaries.pop(thread_id, None)
+            return update
+        # 已接近阈值且没有可用摘要，在后台任务中预计算摘要，当前请求不等待
+        messages_to_summarize = self._prepare_precompute(messages)
+        with _inflight_lock:
+            if messages_to_summarize and thread_id not in _inflight_tasks:
+                # 在全新的上下文中运行，避免摘要调用挂到当前请求的回调和追踪上
+                task = asyncio.create_task(
+                    self._aprecompute(thread_id, store, messages_to_summarize),
+                    context=contextvars.Context()
+                )
+                _inflight_tasks[thread_id] = task
+        return None
@@ -0,0 +1,181 @@
+# 导入 time 模块，用于高精度计时
+import time
+# 导入 ContextVar，用于在一次请求的所有异步任务之间共享计时器
+from contextvars import ContextVar
+# 导入上下文管理器装饰器与空上下文
+from contextlib import contextmanager, nullcontext
+# 导入 UUID 类型，用于回调中的 run_id 类型注解
+from uuid import UUID
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Iterator, List, Optional
+# 导入 LangChain 异步回调基类，用于采集模型调用与工具调用的耗时
+from langchain_core.callbacks import AsyncCallbackHandler
+# 从当前包中导入工具调用耗时的 Prometheus 指标
+from .metrics import TOOL_LATENCY
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 当前请求的计时器，HTTP 中间件在请求开始时设置；LangGraph 创建的子任务会复制上下文，共享同一个计时器对象
+_current_timer: ContextVar[Optional["RequestTimer"]] = ContextVar("request_timer", default=None)
+
+
+# 定义请求计时器：记录一次请求中各阶段的耗时片段（span）
+class RequestTimer:
+    """
+    请求级耗时明细：
+
+      - 每个 span 记录名称、相对请求开始的起始时间与耗时（毫秒），以及可选的附加属性（如工具名）
+      - summary 按名称汇总次数与总耗时，用于生成 Server-Timing 响应头与结构化日志
+      - 并发执行的 span（如并行工具调用）各自计时，汇总耗时可能大于请求总耗时
+    """
+
+    def __init__(self):
+        # 请求开始时间
+        self._start = time.perf_counter()
+        # 已记录的耗时片段
+        self.spans: List[Dict[str, Any]] = []
+
+    def elapsed_ms(self) -> float:
+        """请求开始至今的耗时（毫秒）"""
+        return (time.perf_counter() - self._start) * 1000
+
+    def record(self, name: str, duration_ms: float, start_ms: Optional[float] = None, **attrs: Any) -> None:
+        """记录一个耗时片段，未指定起始时间时视为刚刚结束"""
+        if start_ms is None:
+            start_ms = self.elapsed_ms() - duration_ms
+        span = {"name": name, "start_ms": round(start_ms, 2), "duration_ms": round(duration_ms, 2)}
+        span.update(attrs)
+        self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """统计代码块的耗时，代码块内可以向返回的字典追加属性"""
+        start_ms = self.elapsed_ms()
+        try:
+            yield attrs
+        finally:
+            self.record(name, self.elapsed_ms() - start_ms, start_ms, **attrs)
+
+    @contextmanager
+    def activate(self) -> Iterator["RequestTimer"]:
+        """把计时器设置为当前上下文的计时器"""
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """按名称汇总各阶段的次数与总耗时（保持首次出现的顺序）"""
+        summary: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            item = summary.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+            item["count"] += 1
+            item["total_ms"] = round(item["total_ms"] + span["duration_ms"], 2)
+        return summary
+
+    def server_timing(self) -> str:
+        """生成 Server-Timing 响应头，例如 agent_build;dur=12.3, llm;dur=850.1;desc="x2", total;dur=1020.5"""
+        metrics = []
+        for name, item in self.summary().items():
+            metric = f"{name};dur={item['total_ms']}"
+            if item["count"] > 1:
+                metric += f';desc="x{item["count"]}"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={round(self.elapsed_ms(), 2)}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回完整的耗时明细，用于结构化日志与调试响应"""
+        return {"total_ms": round(self.elapsed_ms(), 2), "summary": self.summary(), "spans": list(self.spans)}
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """获取当前上下文的计时器，不在请求中时返回 None"""
+    return _current_timer.get()
+
+
+def span(name: str, **attrs: Any):
+    """在当前请求的计时器上统计代码块耗时，不在请求中时不做任何事"""
+    timer = _current_timer.get()
+    return timer.span(name, **attrs) if timer is not None else nullcontext(attrs)
+
+
+def record(name: str, duration_ms: float, **attrs: Any) -> None:
+    """在当前请求的计时器上记录一个刚结束的耗时片段，不在请求中时不做任何事"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(name, duration_ms, **attrs)
+
+
+# 定义耗时采集回调：记录每次模型调用与工具调用的耗时
+class TimingCallbackHandler(AsyncCallbackHandler):
+    """
+    通过 LangChain 回调采集耗时：
+
+      - llm：单次模型调用的总耗时；流式调用时额外记录 llm_ttft（首个 token 的耗时）
+      - tool：单次工具调用的总耗时（MCP 工具即为一次 MCP 往返），同时按工具名记入 Prometheus 直方图
+      - MCP Server 在 structuredContent 中返回的服务端耗时（向量化、Milvus 检索、过滤表达式生成等）记录为 mcp.* 片段
+      - 模型调用的排队时间与响应头耗时由 HTTP 传输层记录（见 rate_limiter.py）
+    """
+
+    def __init__(self):
+        # run_id -> 开始时间，模型调用与工具调用分别保存
+        self._llm_starts: Dict[UUID, float] = {}
+        self._first_token: Dict[UUID, float] = {}
+        self._tool_starts: Dict[UUID, tuple] = {}
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *,
+                                  run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        # 路由模型内部再调用子模型时只记录外层调用，避免重复计时
+        if current_timer() is not None and parent_run_id not in self._llm_starts:
+            self._llm_starts[run_id] = time.perf_counter()
+
+    async def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._llm_starts and run_id not in self._first_token:
+            self._first_token[run_id] = time.perf_counter()
+            record("llm_ttft", (self._first_token[run_id] - self._llm_starts[run_id]) * 1000)
+
+    async def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_llm(run_id)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_llm(run_id, error=type(error).__name__)
+
+    def _finish_llm(self, run_id: UUID, **attrs: Any) -> None:
+        start = self._llm_starts.pop(run_id, None)
+        self._first_token.pop(run_id, None)
+        if start is not None:
+            record("llm", (time.perf_counter() - start) * 1000, **attrs)
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._tool_starts[run_id] = ((serialized or {}).get("name") or kwargs.get("name", ""), time.perf_counter())
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._tool_starts.pop(run_id, None)
+        if started is None:
+            return
+        tool_name, start = started
+        duration = time.perf_counter() - start
+        TOOL_LATENCY.labels(tool_name, "ok").observe(duration)
+        record("tool", duration * 1000, tool=tool_name)
+        # MCP 工具的 ToolMessage.artifact 中携带服务端返回的 structuredContent
+        artifact = getattr(output, "artifact", None)
+        if isinstance(artifact, dict):
+            timings = (artifact.get("structured_content") or {}).get("timings") or {}
+            for name, duration_ms in timings.items():
+                record(f"mcp.{name}", duration_ms, tool=tool_name)
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._tool_starts.pop(run_id, None)
+        if started is not None:
+            duration = time.perf_counter() - started[1]
+            TOOL_LATENCY.labels(started[0], "error").observe(duration)
+            record("tool", duration * 1000, tool=started[0], error=type(error).__name__)
+
+
+# 进程内共享的耗时采集回调（按 run_id 区分各次调用，可在并发请求之间共享）
+timing_callback = TimingCallbackHandler()
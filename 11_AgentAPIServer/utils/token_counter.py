@@ -0,0 +1,142 @@
+# 导入线程锁，保证缓存在多线程（同步中间件在线程池中执行）下的读写安全
+import threading
+# 导入有序字典，用于实现按最近使用顺序淘汰的 LRU 缓存
+from collections import OrderedDict
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+# 导入 LangChain 消息基类与消息格式转换函数
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.utils import convert_to_messages, count_tokens_approximately
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 定义带缓存的 token 计数器，可直接作为 SummarizationMiddleware 的 token_counter 参数使用
+class CachedTokenCounter:
+    """
+    按消息 ID 缓存 token 数的计数器：
+
+      - 每条消息只在第一次出现时调用底层计数函数，之后直接命中缓存
+      - 对同一会话逐轮追加消息的场景，额外缓存“前缀累计值”，每轮只需累加新增消息
+      - 从 checkpointer 恢复的历史消息与摘要消息都带有稳定的 ID，同样可以命中缓存
+    """
+
+    def __init__(self,
+                 base_counter: Callable[[Iterable[Any]], int] = count_tokens_approximately,
+                 max_entries: int = 100_000,
+                 max_prefixes: int = 10_000):
+        # 底层的 token 计数函数（默认与 SummarizationMiddleware 相同的近似计数）
+        self.base_counter = base_counter
+        # 单条消息 token 数缓存的最大条目数
+        self.max_entries = max_entries
+        # 前缀累计值缓存的最大条目数（约等于同时活跃的会话数）
+        self.max_prefixes = max_prefixes
+        # 单条消息缓存：(消息ID, 内容指纹) -> token 数
+        self._message_cache: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        # 前缀累计值缓存：末尾消息ID -> (首条消息ID, 前缀消息条数, 前缀 token 总数)
+        self._prefix_cache: "OrderedDict[str, Tuple[str, int, int]]" = OrderedDict()
+        # 保护两个缓存的锁
+        self._lock = threading.Lock()
+        # 命中与未命中统计
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _fingerprint(message: BaseMessage) -> int:
+        """计算消息内容的廉价指纹，防止同一 ID 的消息被编辑后仍命中旧的计数"""
+        # 文本内容直接用长度，多模态内容用内容块数量，再叠加工具调用数量
+        content = message.content
+        size = len(content) if isinstance(content, (str, list)) else 0
+        return size * 31 + len(getattr(message, "tool_calls", None) or [])
+
+    def count_message(self, message: BaseMessage) -> int:
+        """返回单条消息的 token 数，优先读取缓存"""
+        # 没有 ID 的消息无法缓存，直接计数
+        if not message.id:
+            return self.base_counter([message])
+        # 缓存键由消息 ID 与内容指纹组成
+        key = (message.id, self._fingerprint(message))
+        with self._lock:
+            cached = self._message_cache.get(key)
+            if cached is not None:
+                # 命中缓存，将其移动到最近使用的位置
+                self._message_cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        # 未命中时在锁外计数，避免长消息计数阻塞其他线程
+        tokens = self.base_counter([message])
+        with self._lock:
+            self._message_cache[key] = tokens
+            # 超过容量时淘汰最久未使用的条目
+            while len(self._message_cache) > self.max_entries:
+                self._message_cache.popitem(last=False)
+        return tokens
+
+    @staticmethod
+    def _message_id(message: Any) -> Optional[str]:
+        """读取消息 ID（字典等未转换的消息表示形式没有 ID）"""
+        return getattr(message, "id", None)
+
+    def _lookup_prefix(self, messages: list) -> Tuple[int, int]:
+        """从后向前查找可复用的前缀累计值，返回 (前缀条数, 前缀 token 总数)"""
+        # 没有消息或首条消息没有 ID 时无法复用
+        first_id = self._message_id(messages[0]) if messages else None
+        if not first_id:
+            return 0, 0
+        with self._lock:
+            for index in range(len(messages) - 1, -1, -1):
+                message_id = self._message_id(messages[index])
+                entry = self._prefix_cache.get(message_id) if message_id else None
+                # 首条消息与前缀长度都一致，说明前缀没有被摘要/裁剪改写过
+                if entry is not None and entry[0] == first_id and entry[1] == index + 1:
+                    self._prefix_cache.move_to_end(message_id)
+                    return entry[1], entry[2]
+        return 0, 0
+
+    def __call__(self, messages: Iterable[Any]) -> int:
+        """统计消息列表的 token 总数"""
+        # 统一为列表，便于按下标访问
+        messages = messages if isinstance(messages, list) else list(messages)
+        # 复用前缀累计值，只对新增的消息计数
+        start, total = self._lookup_prefix(messages)
+        # 只对新增部分做消息格式转换（兼容字典、元组等消息表示形式）
+        for message in convert_to_messages(messages[start:]):
+            total += self.count_message(message)
+        # 记录本次完整列表的累计值，下一轮追加消息后即可直接复用
+        first_id = self._message_id(messages[0]) if messages else None
+        last_id = self._message_id(messages[-1]) if messages else None
+        if first_id and last_id:
+            with self._lock:
+                self._prefix_cache[last_id] = (first_id, len(messages), total)
+                self._prefix_cache.move_to_end(last_id)
+                while len(self._prefix_cache) > self.max_prefixes:
+                    self._prefix_cache.popitem(last=False)
+        return total
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计信息"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._message_cache),
+                "prefixes": len(self._prefix_cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            }
+
+
+# 进程内共享的计数器实例，所有 Agent 实例的摘要中间件共用同一份缓存
+_shared_counter: Optional[CachedTokenCounter] = None
+
+
+def get_token_counter() -> CachedTokenCounter:
+    """获取进程内共享的带缓存 token 计数器"""
+    global _shared_counter
+    # 首次调用时创建共享实例
+    if _shared_counter is None:
+        _shared_counter = CachedTokenCounter()
+    return _shared_counter
@@ -6,9 +6,9 @@ from langchain.tools import tool, ToolRuntime
 from langgraph.config import get_stream_writer
 # 从 langchain_chroma 包中导入 Chroma，用于构建和使用基于 Chroma 的向量数据库/向量存储
 from langchain_chroma import Chroma
-# Human-in-the-loop 中间件，用于在工具调用前做人审查
-from langchain.agents.middleware import HumanInTheLoopMiddleware
 from langchain_mcp_adapters.client import MultiServerMCPClient
+# 导入 httpx，通过 MultiServerMCPClient 公开的 httpx_client_factory 配置创建附加请求ID请求头的客户端
+import httpx
 # 从自定义配置模块导入 Config 类，用于读取模型类型等配置
 from .config import Config
 # 从当前包中导入 Context 模型，用于在工具运行时携带用户等上下文信息
@@ -16,7 +16,9 @@ from .models import Context
 # 从自定义 LLM 工具模块导入 get_llm 方法，用于获取对话模型和向量模型实例
 from .llms import get_llm
 # 从当前包中导入 LoggerManager，用于获取日志记录器实例
-from .logger import LoggerManager
+from .logger import LoggerManager, current_request_id
+# 从当前包中导入审批策略与带审批策略的人工介入中间件，安全的工具调用自动放行，只有转人工审核的调用才会中断
+from .hitl_policy import HITLPolicy, PolicyHumanInTheLoopMiddleware, load_policy_rules
 import asyncio
 
 
@@ -30,6 +32,61 @@ logger = LoggerManager.get_logger()
 # 根据配置中指定的 LLM 类型，获取对话模型 llm_chat 和嵌入模型 llm_embedding 实例
 llm_chat, llm_embedding = get_llm(Config.LLM_TYPE)
 
+# httpx 请求钩子：把当前请求ID写入 X-Request-ID 请求头，MCP Server 的日志据此与 API 服务的请求关联
+async def propagate_request_id(request: httpx.Request) -> None:
+    request_id = current_request_id()
+    if request_id:
+        request.headers["X-Request-ID"] = request_id
+
+
+# 创建 MCP 客户端使用的 httpx 客户端（每次工具调用在调用方的上下文中创建会话，钩子可以读取到当前请求ID）
+# 参数与 MultiServerMCPClient 的 httpx_client_factory 约定一致，默认值与 MCP SDK 相同：跟随重定向，超时 30 秒，SSE 读取超时 300 秒
+def create_mcp_client_with_request_id(headers=None, timeout=None, auth=None) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=timeout or httpx.Timeout(30.0, read=300.0),
+        auth=auth,
+        follow_redirects=True,
+        event_hooks={"request": [propagate_request_id]},
+    )
+
+
+# 审批策略规则：按顺序匹配，第一条匹配的规则决定自动同意（approve）、自动拒绝（reject）或转人工审核（escalate）
+# 没有规则匹配时按 Config.HITL_POLICY_DEFAULT_ACTION 处理（默认转人工审核）；args 的键必须与工具 schema 中的参数名一致
+DEFAULT_POLICY_RULES = [
+    # 检索内容过长通常是模型把整段上下文当作查询，直接拒绝并让模型精简后重试
+    {
+        'name': 'reject_oversized_query',
+        'tool': 'search_documents',
+        'args': {'query_text': r'^[\s\S]{500,}$'},
+        'action': 'reject',
+        'message': '查询内容过长（超过 500 字符），请提取关键词后重新检索'
+    },
+    # 天气查询为只读操作：城市名为中英文名称时自动同意，每个用户每分钟最多自动同意 20 次，超出后转人工审核
+    {
+        'name': 'weather_city_name',
+        'tool': 'get_weather_for_location',
+        'args': {'city': r'^[\u4e00-\u9fa5A-Za-z· ]{1,20}$'},
+        'rate': {'max_calls': 20, 'window_seconds': 60},
+        'action': 'approve'
+    },
+    # 用户位置只读取当前用户自己的上下文，自动同意
+    {
+        'name': 'own_location',
+        'tool': 'get_user_location',
+        'rate': {'max_calls': 20, 'window_seconds': 60},
+        'action': 'approve'
+    },
+    # 知识库检索为只读操作，自动同意
+    {
+        'name': 'document_search',
+        'tool': 'search_documents',
+        'rate': {'max_calls': 30, 'window_seconds': 60},
+        'action': 'approve'
+    },
+]
+
+
 # 定义一个函数，用于构建并返回当前 Agent 可用的工具列表
 async def get_tools():
 
@@ -60,8 +117,9 @@ async def get_tools():
     # 调用MCP Server，工具名为 "search_documents"，描述为根据查询内容在向量数据库中进行相似度搜索
     client = MultiServerMCPClient({
         "rag_mcp_server": {
-            "url": "http://127.0.0.1:8010/mcp",
+            "url": Config.MCP_SERVER_URL,
             "transport": "streamable_http",
+            "httpx_client_factory": create_mcp_client_with_request_id,
         }
     })
     # 从MCP Server中获取可提供使用的全部工具
@@ -72,7 +130,7 @@ async def get_tools():
     tools.append(get_user_location)
 
     # 记录当前获取到的工具列表，方便在调试或运行中查看已注册的工具
-    logger.info(f"获取并提供的工具列表: {tools} ")
+    logger.info("获取并提供的工具列表: %s", [t.name for t in tools])
 
 
     ###################### 2、Human-in-the-loop 策略配置 ######################
@@ -94,12 +152,21 @@ async def get_tools():
     }
     logger.info(f"需要人工审批的工具有：{interrupt_on}")
 
-    # 创建一个人工介入循环（Human-in-the-loop）中间件实例
-    # 该中间件用于在工具调用时拦截并等待人工审核
-    hitl_middleware = HumanInTheLoopMiddleware(
-        # 传入中断配置字典，指定哪些工具需要人工审核以及审核规则
+    # 配置 HITL_POLICY_FILE 时从 JSON 文件读取审批策略规则，否则使用默认规则
+    if Config.HITL_POLICY_FILE:
+        policy_rules = load_policy_rules(Config.HITL_POLICY_FILE)
+    else:
+        policy_rules = DEFAULT_POLICY_RULES
+    policy = HITLPolicy(policy_rules, default_action=Config.HITL_POLICY_DEFAULT_ACTION) if Config.HITL_POLICY_ENABLED else None
+
+    # 创建一个带审批策略的人工介入循环（Human-in-the-loop）中间件实例
+    # 该中间件先按审批策略处理工具调用，只有转人工审核的调用才会拦截并等待人工审核
+    hitl_middleware = PolicyHumanInTheLoopMiddleware(
+        # 传入中断配置字典，指定哪些工具需要审批以及人工审核的规则
         # interrupt_on 包含每个工具的审核配置（allowed_decisions 和 description）
         interrupt_on=interrupt_on,
+        # 传入审批策略，为 None 时 interrupt_on 中的工具调用全部转人工审核
+        policy=policy,
         # 设置描述信息的前缀文本
         # 当触发人工审核时，会在提示信息前添加此前缀
         description_prefix="工具调用需要人工审批"
@@ -0,0 +1,109 @@
+# 导入 uuid 模块，用于为缺少 ID 的消息补充 ID
+import uuid
+# 导入 typing 模块中的类型提示工具，用于类型注解
+from typing import Any, Dict, Optional
+# 导入 LangChain 中间件基类与 Agent 状态类型
+from langchain.agents.middleware import AgentMiddleware, AgentState
+# 导入消息类型，RemoveMessage 用于按 ID 删除单条消息
+from langchain_core.messages import AnyMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+# 导入 Runtime，表示运行时上下文
+from langgraph.runtime import Runtime
+# 导入带缓存的 token 计数器，窗口内的消息只计数一次
+from .token_counter import CachedTokenCounter, get_token_counter
+# 从当前包中导入 LoggerManager，用于获取日志记录器实例
+from .logger import LoggerManager
+
+
+
+# Author:@南哥AGI研习社 (B站 or YouTube 搜索“南哥AGI研习社”)
+
+
+# 获取全局日志实例
+logger = LoggerManager.get_logger()
+
+
+# 定义消息窗口裁剪中间件：只为滑出窗口的消息生成删除操作，而不是每轮删除全部消息再重新写入
+class MessageWindowMiddleware(AgentMiddleware):
+    """
+    消息窗口裁剪中间件：
+
+      - 按消息条数和/或 token 数维护一个有界的消息窗口
+      - 每轮只对滑出窗口的消息发出 RemoveMessage(id=...)，窗口内的消息保持不动，
+        checkpoint 中只记录少量删除操作，序列化开销与窗口大小无关
+      - 窗口起点不会落在 ToolMessage 上，保证工具调用与工具结果成对保留
+    """
+
+    def __init__(self,
+                 max_messages: Optional[int] = None,
+                 max_tokens: Optional[int] = None,
+                 token_counter: Optional[CachedTokenCounter] = None,
+                 start_on_human: bool = True,
+                 keep_system: bool = True):
+        # 至少需要一种窗口预算
+        if max_messages is None and max_tokens is None:
+            raise ValueError("max_messages 与 max_tokens 至少需要指定一个")
+        super().__init__()
+        # 窗口内最多保留的消息条数
+        self.max_messages = max_messages
+        # 窗口内最多保留的 token 数
+        self.max_tokens = max_tokens
+        # 带缓存的 token 计数器，未指定时使用进程内共享实例
+        self.token_counter = token_counter or get_token_counter()
+        # 窗口是否尽量从用户消息开始（部分模型要求首条非系统消息为用户消息）
+        self.start_on_human = start_on_human
+        # 是否始终保留开头的系统消息
+        self.keep_system = keep_system
+
+    def _window_start(self, messages: list[AnyMessage], offset: int) -> int:
+        """从后向前累加，计算窗口起点下标（offset 之前的消息受保护，不参与裁剪）"""
+        start = len(messages)
+        tokens = 0
+        # 从最新的消息开始向前扩展窗口，只访问窗口内的消息
+        for index in range(len(messages) - 1, offset - 1, -1):
+            if self.max_messages is not None and len(messages) - index > self.max_messages:
+                break
+            if self.max_tokens is not None:
+                tokens += self.token_counter.count_message(messages[index])
+                # 至少保留最新的一条消息
+                if tokens > self.max_tokens and index < len(messages) - 1:
+                    break
+            start = index
+        # 窗口起点不能是 ToolMessage，否则工具结果会失去对应的工具调用，向后跳过这些 ToolMessage
+        safe_start = start
+        while safe_start < len(messages) and isinstance(messages[safe_start], ToolMessage):
+            safe_start += 1
+        # 如果跳过后窗口为空，则改为向前扩展到发起这些工具调用的 AIMessage，保证成对保留
+        if safe_start >= len(messages):
+            while start > offset and isinstance(messages[start], ToolMessage):
+                start -= 1
+            safe_start = start
+        # 尽量让窗口从用户消息开始
+        if self.start_on_human:
+            human_start = next((i for i in range(safe_start, len(messages)) if isinstance(messages[i], HumanMessage)), None)
+            if human_start is not None:
+                safe_start = human_start
+        return safe_start
+
+    def _trim(self, messages: list[AnyMessage]) -> Optional[Dict[str, Any]]:
+        """计算需要删除的消息，窗口未溢出时返回 None"""
+        # 开头的系统消息受保护
+        offset = 1 if self.keep_system and messages and isinstance(messages[0], SystemMessage) else 0
+        start = self._window_start(messages, offset)
+        # 窗口覆盖了全部可裁剪消息，无需修改状态
+        if start <= offset:
+            return None
+        # 补充缺失的消息 ID，保证 RemoveMessage 能定位到消息
+        for message in messages[offset:start]:
+            if message.id is None:
+                message.id = str(uuid.uuid4())
+        logger.info(f"消息窗口裁剪：删除 {start - offset} 条滑出窗口的消息，保留 {len(messages) - start} 条")
+        # 只为滑出窗口的消息生成删除操作
+        return {"messages": [RemoveMessage(id=message.id) for message in messages[offset:start]]}
+
+    def before_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        """调用模型前裁剪消息窗口"""
+        return self._trim(state["messages"])
+
+    async def abefore_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        """调用模型前裁剪消息窗口（纯计算，无 IO，直接复用同步逻辑）"""
+        return self._trim(state["messages"])